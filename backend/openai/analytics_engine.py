@@ -0,0 +1,248 @@
+import os
+import sqlite3
+import decimal
+import datetime
+import threading
+import pandas as pd
+import config
+import db
+from keyword_fts import has_keyword_fts, rewrite_keyword_filters
+from metrics import span
+from query_guard import sqlite_read, check_duckdb, check_row_count, duckdb_deadline
+
+SOURCE_TABLE = 'data_pengadaan'
+RESULT_TABLE = 'intermediary_table'
+SQLITE_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def duckdb_frame(conn, sql: str, max_rows: int = None, params=None) -> pd.DataFrame:
+    """
+    Runs a query on DuckDB within the query guard's limits and returns the
+    frame SQLite would have returned.
+    """
+    max_rows = config.QUERY_MAX_ROWS if max_rows is None else max_rows
+    check_duckdb(conn, sql, params)
+    with duckdb_deadline(conn):
+        relation = conn.sql(sql, params=params)
+        if relation is None:
+            return pd.DataFrame()
+        if max_rows:
+            # One row past the limit tells a full result from a cut-off one
+            relation = relation.limit(max_rows + 1)
+        df = relation.df()
+    check_row_count(len(df), max_rows)
+    # SUM over BIGINT is HUGEINT, which pandas receives as float64
+    for column, dtype in zip(relation.columns, relation.types):
+        if str(dtype) == 'HUGEINT' and df[column].notna().all():
+            df[column] = df[column].astype('int64')
+    return sqlite_compatible(df)
+
+
+def sqlite_compatible(df: pd.DataFrame) -> pd.DataFrame:
+    """Formats temporal columns the way SQLite returns them, so both engines give identical frames."""
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime(SQLITE_TIMESTAMP_FORMAT).where(df[column].notna(), None)
+        elif df[column].dtype == object:
+            sample = df[column].dropna()
+            if len(sample) and isinstance(sample.iloc[0], (datetime.date, datetime.time)):
+                df[column] = df[column].map(lambda v: v.isoformat() if v is not None else None)
+    return df
+
+
+def sqlite_value(value):
+    """One cell as SQLite would return it (DuckDB cursors return datetime/Decimal objects)."""
+    if isinstance(value, datetime.datetime):
+        return value.strftime(SQLITE_TIMESTAMP_FORMAT)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    return value
+
+
+def _file_version(path: str) -> tuple:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return (None, None)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+class SQLiteEngine:
+    name = 'sqlite'
+
+    def query(self, sql: str, params=()) -> pd.DataFrame:
+        conn = db.connect(config.DATA_DB_PATH)
+        # Answer filtered_keywords LIKE chains from the full-text index when it exists
+        if has_keyword_fts(conn):
+            sql = rewrite_keyword_filters(sql)
+        with span('db.query', engine=self.name):
+            return sqlite_read(conn, sql, params=params)
+
+    def data_version(self):
+        # Changes with every committed write; in WAL mode writes land in the -wal file first
+        return _file_version(config.DATA_DB_PATH) + _file_version(config.DATA_DB_PATH + '-wal')
+
+    def load_frame(self, df: pd.DataFrame):
+        return SQLiteFrame(df)
+
+
+class SQLiteFrame:
+    """A session's intermediary_table held in its own in-memory SQLite database."""
+
+    def __init__(self, df: pd.DataFrame):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        df.to_sql(RESULT_TABLE, self.conn, if_exists='replace', index=False)
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        self.size_bytes = page_count * page_size
+
+    def query(self, sql: str) -> pd.DataFrame:
+        return sqlite_read(self.conn, sql)
+
+    def cursor(self):
+        return self.conn.cursor()
+
+    def close(self):
+        self.conn.close()
+
+
+class DuckDBEngine:
+    """
+    Columnar engine over a Parquet snapshot of data_pengadaan. DuckDB
+    accepts the SQLite-style SQL the agent writes (LIKE chains,
+    strftime('%Y-%m', col), GROUP BY/SUM) and runs it vectorized on all
+    cores. Note that `/` on integers is float division here.
+    """
+    name = 'duckdb'
+
+    def __init__(self, snapshot_path: str, source_db_path: str = None):
+        try:
+            import duckdb
+        except ImportError as e:
+            raise ImportError("SIRUPA_ANALYTICS_ENGINE=duckdb needs the duckdb package (pip install duckdb)") from e
+        self._duckdb = duckdb
+        self.snapshot_path = snapshot_path
+        source_db_path = source_db_path or config.DATA_DB_PATH
+        if snapshot_is_stale(snapshot_path, source_db_path):
+            print(f"Building Parquet snapshot {snapshot_path} from {source_db_path}")
+            build_snapshot(source_db_path, snapshot_path)
+
+        self._conn = duckdb.connect(config={'threads': config.DUCKDB_THREADS})
+        path_literal = os.path.abspath(snapshot_path).replace("'", "''")
+        self._conn.execute(f"CREATE VIEW {SOURCE_TABLE} AS SELECT * FROM read_parquet('{path_literal}')")
+        self._timestamp_columns = [
+            row[0] for row in self._conn.execute(f"DESCRIBE {SOURCE_TABLE}").fetchall()
+            if row[1].startswith('TIMESTAMP') or row[1] == 'DATE'
+        ]
+        self._local = threading.local()
+
+    def _cursor(self):
+        # DuckDB connections are not shared across threads; each thread gets its own cursor
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self._conn.cursor()
+        return cursor
+
+    def query(self, sql: str, params=()) -> pd.DataFrame:
+        with span('db.query', engine=self.name):
+            return duckdb_frame(self._cursor(), sql, params=list(params) or None)
+
+    def data_version(self):
+        return _file_version(self.snapshot_path)
+
+    def load_frame(self, df: pd.DataFrame):
+        return DuckDBFrame(self._duckdb, df, self._timestamp_columns)
+
+
+class DuckDBFrame:
+    """A session's intermediary_table held in its own in-memory DuckDB database."""
+
+    def __init__(self, duckdb, df: pd.DataFrame, timestamp_columns: list):
+        self.conn = duckdb.connect()
+        self.conn.register('frame', df)
+        # Restore the snapshot's temporal types so strftime() and date comparisons behave as on data_pengadaan
+        casts = [c for c in timestamp_columns if c in df.columns]
+        replace = f" REPLACE ({', '.join(f'TRY_CAST({c} AS TIMESTAMP) AS {c}' for c in casts)})" if casts else ''
+        self.conn.execute(f"CREATE TABLE {RESULT_TABLE} AS SELECT *{replace} FROM frame")
+        self.conn.unregister('frame')
+        self.size_bytes = int(df.memory_usage(deep=True).sum())
+
+    def query(self, sql: str) -> pd.DataFrame:
+        return duckdb_frame(self.conn, sql)
+
+    def cursor(self):
+        # A duplicate connection to the same database, independent of query()
+        return self.conn.cursor()
+
+    def close(self):
+        self.conn.close()
+
+
+def snapshot_is_stale(snapshot_path: str, source_db_path: str) -> bool:
+    if not os.path.exists(snapshot_path):
+        return True
+    return os.path.exists(source_db_path) and os.path.getmtime(source_db_path) > os.path.getmtime(snapshot_path)
+
+
+def build_snapshot(source_db_path: str, snapshot_path: str, chunk_size: int = 200_000):
+    """Streams data_pengadaan out of SQLite into a Parquet file, typing TIMESTAMP columns."""
+    import duckdb
+
+    conn = db.connect(source_db_path)
+    declared = {row[1]: (row[2] or '').upper() for row in conn.execute(f"PRAGMA table_info({SOURCE_TABLE})")}
+    temporal = [name for name, declared_type in declared.items() if declared_type in ('TIMESTAMP', 'DATETIME', 'DATE')]
+
+    directory = os.path.dirname(snapshot_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    staging = duckdb.connect()
+    created = False
+    for chunk in pd.read_sql_query(f"SELECT * FROM {SOURCE_TABLE}", conn, chunksize=chunk_size):
+        for column in temporal:
+            chunk[column] = pd.to_datetime(chunk[column], errors='coerce', format='mixed')
+        staging.register('chunk', chunk)
+        if created:
+            staging.execute(f"INSERT INTO {SOURCE_TABLE} SELECT * FROM chunk")
+        else:
+            staging.execute(f"CREATE TABLE {SOURCE_TABLE} AS SELECT * FROM chunk")
+            created = True
+        staging.unregister('chunk')
+
+    tmp_path = snapshot_path + '.tmp'
+    staging.execute(f"COPY {SOURCE_TABLE} TO '{tmp_path.replace(chr(39), chr(39) * 2)}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+    staging.close()
+    os.replace(tmp_path, snapshot_path)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """The deployment's engine, chosen by SIRUPA_ANALYTICS_ENGINE and created once."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if config.ANALYTICS_ENGINE == 'duckdb':
+                    _engine = DuckDBEngine(config.PARQUET_SNAPSHOT_PATH)
+                elif config.ANALYTICS_ENGINE == 'sqlite':
+                    _engine = SQLiteEngine()
+                else:
+                    raise ValueError(f"Unknown SIRUPA_ANALYTICS_ENGINE '{config.ANALYTICS_ENGINE}'")
+    return _engine
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export data_pengadaan to the Parquet snapshot used by the duckdb engine.")
+    parser.add_argument('--db', default=config.DATA_DB_PATH)
+    parser.add_argument('--out', default=config.PARQUET_SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    build_snapshot(args.db, args.out)
+    print(f"Wrote {args.out}")
@@ -0,0 +1,166 @@
+"""
+Inverted-file (IVF-flat) index over the keyword matrix, for vocabularies
+where a full matrix-vector product per query gets too slow.
+
+The rows are clustered with spherical k-means; a query is scored against
+the centroids first and then exactly against the rows of the `nprobe`
+closest clusters. More probes give higher recall for more work; nprobe
+equal to nlist is an exact search. Rows appended to the vocabulary are
+assigned to the existing lists (extend); the centroids are only retrained
+once the vocabulary has grown well past the rows they were trained on.
+Rows not in the index yet are scored exactly.
+
+    python ann_index.py                   # build v2_key.ivf.npz for the current vocabulary
+    python ann_index.py --nlist 4096
+"""
+import os
+import numpy as np
+from keyword_index import MATRIX_PATH, top_k_indices, vocabulary_fingerprint
+
+
+def ivf_path(matrix_path: str = MATRIX_PATH) -> str:
+    """Where the IVF index of matrix_path lives, e.g. v2_key.ivf.npz."""
+    base = matrix_path[:-len('.npy')] if matrix_path.endswith('.npy') else matrix_path
+    return base + '.ivf.npz'
+
+
+IVF_PATH = ivf_path()
+
+
+def default_nlist(rows: int) -> int:
+    # About 4 * sqrt(n) lists keeps both the centroid scan and the probed lists small
+    return max(1, min(rows, int(4 * np.sqrt(rows))))
+
+
+def _assign(matrix, centroids, chunk_rows):
+    labels = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], chunk_rows):
+        block = np.asarray(matrix[start:start + chunk_rows], dtype=np.float32)
+        labels[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def spherical_kmeans(sample: np.ndarray, nlist: int, iterations: int, rng) -> np.ndarray:
+    """Unit-length centroids for unit-length rows; empty clusters are reseeded from random rows."""
+    centroids = sample[rng.choice(sample.shape[0], nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(sample, centroids, 65536)
+        counts = np.bincount(labels, minlength=nlist)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        # Per-cluster sums over the rows sorted by cluster
+        sums[~empty] = np.add.reduceat(sample[np.argsort(labels, kind='stable')], starts[~empty], axis=0)
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Centroids plus the matrix rows grouped by cluster: the rows of list c
+    are order[offsets[c]:offsets[c + 1]]. `count` is how many matrix rows
+    were indexed; later rows are searched exhaustively. `trained` is how
+    many rows the centroids were trained for. `fingerprint` identifies the
+    first `count` keywords.
+    """
+
+    def __init__(self, centroids: np.ndarray, offsets: np.ndarray, order: np.ndarray, count: int,
+                 nprobe: int = 16, fingerprint: str = '', trained: int = None):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.order = order
+        self.count = count
+        self.nprobe = nprobe
+        self.fingerprint = fingerprint
+        self.trained = count if trained is None else trained
+
+    def matches(self, keywords: list) -> bool:
+        """Whether this index was built for these keywords, possibly before more were appended."""
+        return self.count <= len(keywords) and self.fingerprint == vocabulary_fingerprint(keywords[:self.count])
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, nlist: int = None, iterations: int = 10, train_rows: int = None,
+              nprobe: int = 16, keywords: list = None, seed: int = 0, chunk_rows: int = 65536) -> 'IVFIndex':
+        """Trains on a sample of the (L2-normalized) rows, then assigns every row to its closest centroid."""
+        rows = matrix.shape[0]
+        nlist = min(nlist or default_nlist(rows), rows)
+        rng = np.random.default_rng(seed)
+        train_rows = min(rows, train_rows or nlist * 64)
+        sample_ids = np.sort(rng.choice(rows, train_rows, replace=False))
+        sample = np.asarray(matrix[sample_ids], dtype=np.float32)
+
+        centroids = spherical_kmeans(sample, nlist, iterations, rng)
+        labels = _assign(matrix, centroids, chunk_rows)
+        order = np.argsort(labels, kind='stable').astype(np.int32)
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+        fingerprint = vocabulary_fingerprint(keywords[:rows]) if keywords is not None else ''
+        return cls(centroids, offsets, order, rows, nprobe, fingerprint)
+
+    def extend(self, matrix: np.ndarray, keywords: list, chunk_rows: int = 65536) -> 'IVFIndex':
+        """
+        A copy that also indexes rows count.. of the matrix, each put in the
+        list of its closest existing centroid; nothing is retrained.
+        """
+        labels = np.empty(matrix.shape[0], dtype=np.int32)
+        labels[self.order] = np.repeat(np.arange(self.nlist, dtype=np.int32), np.diff(self.offsets))
+        labels[self.count:] = _assign(matrix[self.count:], self.centroids, chunk_rows)
+        order = np.argsort(labels, kind='stable').astype(np.int32)
+        offsets = np.zeros(self.nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(labels, minlength=self.nlist), out=offsets[1:])
+        return IVFIndex(self.centroids, offsets, order, matrix.shape[0], self.nprobe,
+                        vocabulary_fingerprint(keywords[:matrix.shape[0]]), self.trained)
+
+    def candidates(self, query: np.ndarray, nprobe: int = None) -> np.ndarray:
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probe = top_k_indices(self.centroids @ query, nprobe)
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, top_k: int, nprobe: int = None):
+        """(row indices, scores) of the best top_k rows among the probed lists and the unindexed tail."""
+        ids = np.sort(self.candidates(query, nprobe))
+        if matrix.shape[0] > self.count:
+            ids = np.concatenate([ids, np.arange(self.count, matrix.shape[0])])
+        scores = matrix[ids] @ query
+        top = top_k_indices(scores, top_k)
+        return ids[top], scores[top]
+
+    def save(self, path: str = IVF_PATH):
+        # np.savez appends .npz to names without it, so the temporary name keeps the suffix
+        tmp_path = path[:-len('.npz')] + '.tmp.npz' if path.endswith('.npz') else path + '.tmp.npz'
+        np.savez(tmp_path, centroids=self.centroids, offsets=self.offsets, order=self.order,
+                 count=np.int64(self.count), fingerprint=np.array(self.fingerprint), trained=np.int64(self.trained))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = IVF_PATH, nprobe: int = 16) -> 'IVFIndex':
+        with np.load(path) as data:
+            return cls(data['centroids'], data['offsets'], data['order'], int(data['count']), nprobe,
+                       str(data['fingerprint']), int(data['trained']) if 'trained' in data else None)
+
+
+if __name__ == '__main__':
+    import time
+    import argparse
+    import config
+    from keyword_index import get_keyword_index
+
+    parser = argparse.ArgumentParser(description="Build the IVF index for the current keyword vocabulary.")
+    parser.add_argument('--out', default=IVF_PATH)
+    parser.add_argument('--nlist', type=int, default=config.KEYWORD_IVF_NLIST or None)
+    parser.add_argument('--iterations', type=int, default=10)
+    args = parser.parse_args()
+
+    vocabulary = get_keyword_index()
+    start = time.perf_counter()
+    ivf = IVFIndex.build(vocabulary.matrix, args.nlist, args.iterations, keywords=vocabulary.keywords)
+    ivf.save(args.out)
+    print(f"Indexed {ivf.count} keywords into {ivf.nlist} lists in {time.perf_counter() - start:.1f}s: {args.out}")
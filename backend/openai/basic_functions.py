@@ -1,16 +1,26 @@
 import openai
+import os
 import json
 import itertools
 import time
-import sqlite3
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 import pandas as pd
 from datetime import datetime
 from openai import OpenAI
-from list_of_tools import mini_retrieve_similar_keywords, schema_check, intermediary_dataframe_retrieval, bar_chart_tool, line_chart_tool, pie_chart_tool, histogram_tool
+from list_of_tools import mini_retrieve_similar_keywords, search_pengadaan, schema_check, intermediary_dataframe_retrieval, bar_chart_tool, line_chart_tool, pie_chart_tool, histogram_tool
 import api_keys
+import config
+from result_store import result_store
+from chart_reduce import reduce_chart_data
+from chart_render import chart_renderer, chart_filename
+from run_driver import drive_stream, drive_polling, EventRecorder
+from metrics import span, record_tool_call
 
 tool_functions = {
     'mini_retrieve_similar_keywords': mini_retrieve_similar_keywords,
+    'search_pengadaan': search_pengadaan,
     'schema_check': schema_check,
     'intermediary_dataframe_retrieval': intermediary_dataframe_retrieval,
     'bar_chart_tool': bar_chart_tool,
@@ -20,6 +30,7 @@ tool_functions = {
             }
 
 client = OpenAI(api_key=api_keys.openai_key)
+tool_executor = ThreadPoolExecutor(max_workers=config.TOOL_WORKERS, thread_name_prefix='tool')
 
 prompt = """Guide to Database Retrieval Using Keyword Similarity
 
@@ -30,7 +41,8 @@ Assist the user in retrieving database information using keyword similarity and
 Process Steps:
 
 1. SPECIAL REQUEST: If User said "SIRUPA TAMPILKAN GRAFIK {USER QUERY}", Prepare to GIVE ALL 4 CHARTS FOR THE QUERY BAR, LINE, PIE AND HISTOGRAM.
-2. Use mini_retrieve_similar_keywords tool: This tool identifies similar keywords for the user's query. Using this is essential; otherwise, the query may fail.
+FAST PATH: When the request is a search by topic, optionally with exclusions, an announcement date range or a satuan_kerja, call search_pengadaan ONCE with the concepts (e.g. ["perbaikan", "gedung"]), exclusions, date_from/date_to and satuan_kerja. It does steps 2-7 by itself and keeps the result for the chart tools. Follow steps 2-7 only when the request needs SQL that search_pengadaan cannot express.
+2. Use mini_retrieve_similar_keywords tool: This tool identifies similar keywords for the user's query. Using this is essential; otherwise, the query may fail. Pass every concept of the request in one call as 'queries' (e.g. ["perbaikan", "gedung"]) instead of calling it once per concept.
 3. Keyword Selection: Choose keywords with similarity scores above 0.6, grouping them by meaning or relationship to the user’s request.
 4. Schema Check: Run schema_check to understand the database structure.
 5. SQL Query Construction:
@@ -59,6 +71,12 @@ Notes:
 """
 progress_updates = {}
 
+CHART_TOOLS = {'bar_chart_tool', 'line_chart_tool', 'pie_chart_tool', 'histogram_tool'}
+
+# Tools that replace the per-session intermediary result, and all that read or write it
+SESSION_WRITERS = {'intermediary_dataframe_retrieval', 'search_pengadaan'}
+SESSION_TOOLS = SESSION_WRITERS | CHART_TOOLS
+
 def deploy_assistant(all_tools):
     assistant = client.beta.assistants.create(
     name="Data Agent",
@@ -69,101 +87,183 @@ def deploy_assistant(all_tools):
 
     return assistant
 
-def run_assistant(assistant_id, thread, question):
-
-    run = openai.beta.threads.runs.create(
-        thread_id=thread.id,
-        assistant_id=assistant_id,
-        instructions=question
-    )
+def run_assistant(assistant_id, thread, question, stream=None):
+    # Returns a Run, or the run's event stream when streaming is enabled
+    stream = config.RUN_STREAMING if stream is None else stream
+    with span('openai.run.create'):
+        run = openai.beta.threads.runs.create(
+            thread_id=thread.id,
+            assistant_id=assistant_id,
+            instructions=question,
+            stream=stream
+        )
 
     return run
 
-def execute_tool_call(tool_call):
+class _ToolOutcome:
+    """
+    Who reports a tool call's metrics: the call when it finishes, or
+    execute_tool_calls when it times out first. Whichever claims it first
+    records; the other stays silent, so every call is counted once.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._claimed = False
+
+    def claim(self) -> bool:
+        with self._lock:
+            claimed, self._claimed = self._claimed, True
+            return not claimed
+
+
+def execute_tool_call(tool_call, session_id='default', outcome: _ToolOutcome = None):
+    """
+    Runs one tool call. Returns the tool output for the run and, for chart
+    tools, the chart payload for the frontend (otherwise None).
+    """
     tool_name = tool_call.function.name
     print(f'Using tool: {tool_name}')
+    chart_info = None
+    started = time.perf_counter()
+    failed = False
         
     try:
         args = json.loads(tool_call.function.arguments)
+        if tool_name in SESSION_TOOLS:
+            args['session_id'] = session_id
+        if tool_name in CHART_TOOLS:
+            # Query once: the insights, the rendered image and the frontend payload share this result
+            chart_df = result_store.query(session_id, args.get('sql_query'))
+            chart_info = build_chart_info(tool_name, args)
+            # Top-N / downsampled / pre-binned rows keep the browser payload small
+            with span('chart.reduce'):
+                chart_info['chart_data'], chart_info['reduction'] = reduce_chart_data(
+                    chart_info['type'], chart_df, chart_info['visualization']
+                )
+            args['data'] = chart_df
+            if chart_renderer.mode != 'data' and args.get('image_filename'):
+                chart_info['image_url'] = f"/images/{chart_filename(session_id, args['image_filename'])}"
         function = tool_functions.get(tool_name)
         output = function(**args) if args else function()        
     except Exception as e:
         output = json.dumps({'error': str(e)})
+        failed = True
+
+    # Tools report most failures as an "Error ..." string rather than raising
+    failed = failed or (isinstance(output, str) and output.startswith('Error'))
+    if outcome is None or outcome.claim():
+        record_tool_call(tool_name, time.perf_counter() - started, 'error' if failed else 'ok')
 
     return {
             'tool_call_id': tool_call.id,
             'output': output
-        }
+        }, chart_info
 
-def get_answer(run, thread, progress_callback=None):
+def _dispatch(call, session_id):
+    # Each call runs in a copy of the caller's context, so its spans land on the request's trace
+    outcome = _ToolOutcome()
+    future = tool_executor.submit(contextvars.copy_context().run, execute_tool_call, call, session_id, outcome)
+    return future, outcome, time.monotonic()
+
+def _collect(call, future, outcome, dispatched):
+    tool_name = call.function.name
+    timeout = config.TOOL_TIMEOUTS.get(tool_name, config.TOOL_TIMEOUT_SECONDS)
+    try:
+        return future.result(timeout=max(0, dispatched + timeout - time.monotonic()))
+    except TimeoutError:
+        future.cancel()
+        print(f"Tool {tool_name} timed out after {timeout}s")
+        # The call keeps running on the pool; when it ends it finds the outcome claimed
+        if outcome.claim():
+            record_tool_call(tool_name, timeout, 'timeout')
+        return ({
+            'tool_call_id': call.id,
+            'output': json.dumps({'error': f'{tool_name} timed out after {timeout:g} seconds'})
+        }, None)
+    except Exception as e:
+        return ({'tool_call_id': call.id, 'output': json.dumps({'error': str(e)})}, None)
+
+def execute_tool_calls(tool_calls, session_id='default'):
+    """
+    Runs the tool calls of one run step on the shared pool and returns their
+    (output, chart_info) pairs in call order. Calls that do not touch the
+    session's intermediary_table run concurrently from the start. Calls that
+    replace it run one after another in call order, and the chart tools that
+    read it only start once those are done, so a step holding both a
+    retrieval and a chart charts the new table. A call that fails or
+    exceeds its timeout (counted from its dispatch) gets an error output
+    without holding back the others.
+    """
+    results = [None] * len(tool_calls)
+    running = {
+        i: _dispatch(call, session_id) for i, call in enumerate(tool_calls)
+        if call.function.name not in SESSION_TOOLS
+    }
+    for i, call in enumerate(tool_calls):
+        if call.function.name in SESSION_WRITERS:
+            results[i] = _collect(call, *_dispatch(call, session_id))
+    running.update(
+        (i, _dispatch(call, session_id)) for i, call in enumerate(tool_calls)
+        if call.function.name in CHART_TOOLS
+    )
+    for i, dispatched in running.items():
+        results[i] = _collect(tool_calls[i], *dispatched)
+    return results
+
+def get_answer(run, thread, progress_callback=None, session_id='default'):
     charts_info = []
-    chart_df = None
-    
-    while run.status != 'completed':
-        try:
-            run = openai.beta.threads.runs.retrieve(
-                thread_id=thread.id,
-                run_id=run.id
-            )
-            
-            if run.status == 'requires_action':
-                tool_calls = run.required_action.submit_tool_outputs.tool_calls
-                
-                for call in tool_calls:
-                    # Send tool usage update
-                    print(f"Processing tool: {call.function.name}")
-                    if progress_callback:
-                        progress_callback('tool_usage', f"Using tool: {call.function.name}")
-                    
-                    args = json.loads(call.function.arguments)
-                    
-                    if call.function.name in ['bar_chart_tool', 'line_chart_tool', 'pie_chart_tool', 'histogram_tool']:
-                        try:
-                            conn = sqlite3.connect('intermediary.db')
-                            chart_df = pd.read_sql_query(args.get('sql_query'), conn)
-                        except Exception as e:
-                            print(f"Error getting chart data: {e}")
-                        finally:
-                            conn.close()
-                        
-                        chart_info = build_chart_info(call.function.name, args)
-                        if chart_info and chart_df is not None:
-                            chart_info['chart_data'] = chart_df.to_dict(orient='records')
-                            charts_info.append(chart_info)
-                
-                tool_outputs = [execute_tool_call(call) for call in tool_calls]
-                
-                try:
-                    run = client.beta.threads.runs.submit_tool_outputs(
-                        thread_id=thread.id,
-                        run_id=run.id,
-                        tool_outputs=tool_outputs
-                    )
-                except Exception as e:
-                    print(f"Error submitting tool outputs: {e}")
-                    break
-            
-            time.sleep(0.1)
-            
-        except Exception as e:
-            print(f"Error: {e}")
-            continue
+
+    def handle_required_action(run):
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+
+        for call in tool_calls:
+            # Send tool usage update
+            print(f"Processing tool: {call.function.name}")
+            if progress_callback:
+                progress_callback('tool_usage', f"Using tool: {call.function.name}")
+
+        tool_outputs = []
+        for output, chart_info in execute_tool_calls(tool_calls, session_id):
+            tool_outputs.append(output)
+            if chart_info:
+                charts_info.append(chart_info)
+        return tool_outputs
+
+    recorder = EventRecorder() if config.RUN_RECORDING_DIR else None
+    try:
+        if isinstance(run, openai.Stream):
+            run = drive_stream(client, run, thread, handle_required_action, recorder)
+        else:
+            run = drive_polling(client, run, thread, handle_required_action)
+    except Exception as e:
+        print(f"Error: {e}")
+        return None, f"Error while running the assistant: {e}", charts_info
+
+    if run is None or run.status != 'completed':
+        status = run.status if run is not None else 'unknown'
+        print(f"Run ended with status {status}")
+        return None, f"The assistant run ended with status '{status}'.", charts_info
     
     try:
-        messages = openai.beta.threads.messages.list(thread_id=thread.id)
+        with span('openai.messages.list'):
+            messages = openai.beta.threads.messages.list(thread_id=thread.id)
         annotations = messages.data[0].content[0].text.annotations
         message_content = messages.data[0].content[0].text.value
+        if recorder:
+            recorder.save(os.path.join(config.RUN_RECORDING_DIR, f'{run.id}.json'), message_content)
         return annotations, message_content, charts_info
     except Exception as e:
         print(f"Error retrieving messages: {e}")
         return None, None, charts_info
 
 def add_message(thread, message_content, role):
-    return client.beta.threads.messages.create(
-        thread_id=thread.id,
-        role=role,
-        content=message_content,
-    )
+    with span('openai.add_message', role=role):
+        return client.beta.threads.messages.create(
+            thread_id=thread.id,
+            role=role,
+            content=message_content,
+        )
     
 def build_chart_info(chart_type, args):
     if chart_type == 'bar_chart_tool':
@@ -0,0 +1,86 @@
+"""
+SQLite versus the DuckDB/Parquet engine on the aggregate queries the chart
+tools run, over synthetic data_pengadaan tables. Both engines get the same
+SQL text and must return the same rows. Run from backend/openai:
+
+    python benchmarks/bench_analytics_engine.py --sizes 100000 1000000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+from synthetic import create_pengadaan_db
+import config
+import analytics_engine
+from analytics_engine import SQLiteEngine, DuckDBEngine, build_snapshot
+
+QUERIES = {
+    'pagu per satker': (
+        "SELECT satuan_kerja, SUM(total_pagu) AS total_pagu, COUNT(kode_rup) AS jumlah_paket "
+        "FROM data_pengadaan GROUP BY satuan_kerja ORDER BY total_pagu DESC"
+    ),
+    'monthly trend': (
+        "SELECT strftime('%Y-%m', tanggal_umumkan_paket) AS bulan, COUNT(kode_rup) AS jumlah_paket, "
+        "SUM(total_pagu) AS total_pagu FROM data_pengadaan GROUP BY bulan ORDER BY bulan"
+    ),
+    'keyword filter + sum': (
+        "SELECT satuan_kerja, SUM(total_pagu) AS total_pagu FROM data_pengadaan "
+        "WHERE (filtered_keywords LIKE '%perbaikan%' OR filtered_keywords LIKE '%pemeliharaan%') "
+        "AND (filtered_keywords LIKE '%gedung%' OR filtered_keywords LIKE '%kantor%') "
+        "GROUP BY satuan_kerja ORDER BY satuan_kerja"
+    ),
+    'satker x year stats': (
+        "SELECT satuan_kerja, strftime('%Y', tanggal_umumkan_paket) AS tahun, AVG(total_pagu) AS rata_rata, "
+        "MAX(total_pagu) AS maksimum FROM data_pengadaan GROUP BY satuan_kerja, tahun ORDER BY satuan_kerja, tahun"
+    ),
+}
+
+
+def timed(engine, sql, repeat):
+    samples, df = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = engine.query(sql)
+        samples.append(time.perf_counter() - start)
+    return np.median(samples) * 1000, df
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'snapshot s':>11} {'query':<22} {'SQLite ms':>10} {'DuckDB ms':>10} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            db_path = os.path.join(tmp, f'pengadaan_{n}.db')
+            snapshot_path = os.path.join(tmp, f'pengadaan_{n}.parquet')
+            create_pengadaan_db(db_path, n).close()
+            start = time.perf_counter()
+            build_snapshot(db_path, snapshot_path)
+            snapshot_s = time.perf_counter() - start
+
+            config.DATA_DB_PATH = db_path
+            sqlite_engine = SQLiteEngine()
+            duckdb_engine = DuckDBEngine(snapshot_path, db_path)
+
+            for name, sql in QUERIES.items():
+                sqlite_ms, expected = timed(sqlite_engine, sql, args.repeat)
+                duckdb_ms, actual = timed(duckdb_engine, sql, args.repeat)
+                try:
+                    pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+                except AssertionError as e:
+                    print(f"result mismatch for {name!r} at {n} rows: {e}", file=sys.stderr)
+                    return 1
+                print(f"{n:>9} {snapshot_s:>11.2f} {name:<22} {sqlite_ms:>10.2f} {duckdb_ms:>10.2f} "
+                      f"{sqlite_ms / duckdb_ms:>7.1f}x")
+            analytics_engine.db.connections.close_all()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
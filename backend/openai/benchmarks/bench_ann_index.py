@@ -0,0 +1,72 @@
+"""
+Recall@k and latency of the IVF keyword index against exact search, on
+synthetic clustered vocabularies. Run from backend/openai:
+
+    python benchmarks/bench_ann_index.py --sizes 100000 1000000 --dim 256
+
+A 1M x 3072 float32 matrix is 12 GB, so the default dimension is reduced;
+pass --dim 3072 where the memory is there. Recall is the share of the
+exact top-k that the index returns, averaged over the queries.
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from synthetic import clustered_embeddings, perturbed_queries
+from keyword_index import top_k_indices
+from ann_index import IVFIndex, default_nlist
+
+
+def timed_search(search, queries):
+    results, samples = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        samples.append((time.perf_counter() - start) * 1000)
+    return results, float(np.percentile(samples, 50)), float(np.percentile(samples, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000])
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--nlist', type=int, default=0, help='0 = about 4 * sqrt(size)')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--spread', type=float, default=0.8, help='Noise around topic centres.')
+    args = parser.parse_args()
+
+    print(f"{'keywords':>9} {'search':<12} {'recall@' + str(args.top_k):>10} {'p50 ms':>9} {'p99 ms':>9} {'speedup':>8}")
+    for n in args.sizes:
+        matrix = clustered_embeddings(n, args.dim, spread=args.spread)
+        queries = perturbed_queries(matrix, args.queries, args.spread)
+
+        exact, exact_p50, exact_p99 = timed_search(lambda q: top_k_indices(matrix @ q, args.top_k), queries)
+        print(f"{n:>9} {'exact':<12} {1.0:>10.3f} {exact_p50:>9.2f} {exact_p99:>9.2f} {1.0:>7.1f}x")
+
+        start = time.perf_counter()
+        ivf = IVFIndex.build(matrix, args.nlist or default_nlist(n))
+        build_seconds = time.perf_counter() - start
+
+        # The saved index must answer exactly like the one in memory
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.ivf.npz')
+            ivf.save(path)
+            loaded = IVFIndex.load(path)
+            assert all(np.array_equal(ivf.search(matrix, q, args.top_k)[0], loaded.search(matrix, q, args.top_k)[0])
+                       for q in queries[:10])
+            size_mb = os.path.getsize(path) / 2**20
+
+        for nprobe in args.nprobe:
+            approx, p50, p99 = timed_search(lambda q: ivf.search(matrix, q, args.top_k, nprobe)[0], queries)
+            recall = np.mean([len(set(a) & set(e)) / args.top_k for a, e in zip(approx, exact)])
+            print(f"{n:>9} {'ivf/' + str(nprobe):<12} {recall:>10.3f} {p50:>9.2f} {p99:>9.2f} {exact_p50 / p50:>7.1f}x")
+        print(f"{'':>9} nlist {ivf.nlist}, built in {build_seconds:.1f}s, saved index {size_mb:.1f} MB")
+        del matrix
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Delta ingest throughput into a synthetic data_pengadaan table, plus the
+checks a delta must pass; exits non-zero if announcement dates given
+date-only or as full timestamps are lost, or if a partial delta (only
+kode_rup and total_pagu) touches any other column. Run from backend/openai:
+
+    python benchmarks/bench_ingest.py --rows 100000 --delta-rows 20000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import pandas as pd
+
+from synthetic import create_pengadaan_db, synthetic_pengadaan_rows
+from ingest import COLUMNS, ingest
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--delta-rows', type=int, default=20000)
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'pengadaan.db')
+        conn = create_pengadaan_db(db_path, args.rows)
+
+        # Half the delta updates existing packages, half is new; every other
+        # row is announced date-only and brings no keywords of its own
+        first = args.rows - args.delta_rows // 2
+        delta = pd.DataFrame(list(synthetic_pengadaan_rows(args.delta_rows, seed=1, start=first)), columns=COLUMNS)
+        date_only = delta.index % 2 == 0
+        delta.loc[date_only, 'tanggal_umumkan_paket'] = delta.loc[date_only, 'tanggal_umumkan_paket'].str[:10]
+        delta.loc[date_only, 'filtered_keywords'] = None
+        delta_path = os.path.join(tmp, 'delta.csv')
+        delta.to_csv(delta_path, index=False)
+
+        start = time.perf_counter()
+        counts = ingest(delta_path, db_path, workers=args.workers, update_vocabulary=False)
+        seconds = time.perf_counter() - start
+        print(f"{len(delta)} delta rows in {seconds:.2f} s ({len(delta) / seconds:,.0f} rows/s): "
+              f"{counts['inserted']} new, {counts['updated']} updated, {counts['unchanged']} unchanged")
+
+        codes = [int(code) for code in delta['kode_rup']]
+        lost = conn.execute(
+            f"SELECT COUNT(*) FROM data_pengadaan WHERE kode_rup BETWEEN ? AND ? "
+            f"AND (tanggal_umumkan_paket IS NULL OR filtered_keywords IS NULL)", (min(codes), max(codes))
+        ).fetchone()[0]
+        if lost:
+            print(f"{lost} delta rows lost their announcement date or keywords", file=sys.stderr)
+            return 1
+
+        # A partial delta only changes the columns it carries
+        before = dict((row[0], row[1:]) for row in conn.execute(
+            "SELECT kode_rup, nama_paket, nama_klpd, satuan_kerja, uraian_pekerjaan, spesifikasi_pekerjaan, "
+            "tanggal_umumkan_paket, filtered_keywords FROM data_pengadaan WHERE kode_rup IN (?, ?)", codes[:2]))
+        partial_path = os.path.join(tmp, 'partial.csv')
+        pd.DataFrame({'kode_rup': codes[:2], 'total_pagu': [1, 2]}).to_csv(partial_path, index=False)
+        ingest(partial_path, db_path, workers=args.workers, update_vocabulary=False)
+        after = dict((row[0], row[1:]) for row in conn.execute(
+            "SELECT kode_rup, nama_paket, nama_klpd, satuan_kerja, uraian_pekerjaan, spesifikasi_pekerjaan, "
+            "tanggal_umumkan_paket, filtered_keywords FROM data_pengadaan WHERE kode_rup IN (?, ?)", codes[:2]))
+        pagu = [row[0] for row in conn.execute(
+            "SELECT total_pagu FROM data_pengadaan WHERE kode_rup IN (?, ?) ORDER BY kode_rup", codes[:2])]
+        if after != before or pagu != [1, 2]:
+            print("a partial delta changed columns it does not carry", file=sys.stderr)
+            return 1
+        print("partial delta kept the columns it does not carry")
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+"""
+LIKE '%...%' scans versus the filtered_keywords trigram index on synthetic
+data_pengadaan tables; exits non-zero if a rewritten query returns other
+rows than its LIKE original. Run from backend/openai:
+
+    python benchmarks/bench_keyword_fts.py --sizes 1000 100000 1000000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from synthetic import create_pengadaan_db
+from keyword_fts import create_keyword_fts, rewrite_keyword_filters
+
+QUERIES = {
+    'perbaikan gedung': (
+        "SELECT * FROM data_pengadaan WHERE (filtered_keywords LIKE '%perbaikan%' OR filtered_keywords LIKE '%rehabilitasi%' "
+        "OR filtered_keywords LIKE '%pemeliharaan%') AND (filtered_keywords LIKE '%gedung%' OR filtered_keywords LIKE '%bangunan%' "
+        "OR filtered_keywords LIKE '%kantor%')"
+    ),
+    'excluding alat': (
+        "SELECT * FROM data_pengadaan WHERE (filtered_keywords LIKE '%perbaikan%' OR filtered_keywords LIKE '%rehabilitasi%' "
+        "OR filtered_keywords LIKE '%pemeliharaan%') AND (filtered_keywords LIKE '%gedung%' OR filtered_keywords LIKE '%bangunan%' "
+        "OR filtered_keywords LIKE '%kantor%') AND NOT (filtered_keywords LIKE '%alat%' OR filtered_keywords LIKE '%peralatan%')"
+    ),
+    'rare term + satker': (
+        "SELECT * FROM data_pengadaan WHERE filtered_keywords LIKE '%konsultansi%' AND filtered_keywords LIKE '%internet%' "
+        "AND satuan_kerja = 'Dinas Kesehatan'"
+    ),
+    # Rows without keywords must stay out of a negated filter, as with LIKE
+    'not gedung': "SELECT * FROM data_pengadaan WHERE NOT filtered_keywords LIKE '%gedung%'",
+}
+
+
+def timed(conn, sql, repeat):
+    samples, rows = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(sql).fetchall()
+        samples.append(time.perf_counter() - start)
+    return np.median(samples) * 1000, rows
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'index build s':>14} {'query':<20} {'matches':>8} {'LIKE ms':>9} {'FTS ms':>9} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            conn = create_pengadaan_db(os.path.join(tmp, f'pengadaan_{n}.db'), n)
+            start = time.perf_counter()
+            create_keyword_fts(conn)
+            build_s = time.perf_counter() - start
+
+            for name, sql in QUERIES.items():
+                like_ms, like_rows = timed(conn, sql, args.repeat)
+                fts_ms, fts_rows = timed(conn, rewrite_keyword_filters(sql), args.repeat)
+                if sorted(like_rows) != sorted(fts_rows):
+                    print(f"result mismatch for {name!r} at {n} rows", file=sys.stderr)
+                    return 1
+                print(f"{n:>9} {build_s:>14.2f} {name:<20} {len(like_rows):>8} {like_ms:>9.2f} {fts_ms:>9.2f} "
+                      f"{like_ms / fts_ms:>7.1f}x")
+            conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
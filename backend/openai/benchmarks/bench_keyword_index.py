@@ -0,0 +1,82 @@
+"""
+Compares the original CSV-per-call keyword search against the resident
+KeywordIndex. Run from backend/openai:
+
+    python benchmarks/bench_keyword_index.py --sizes 1000 10000
+"""
+import os
+import sys
+import time
+import argparse
+import json
+import tempfile
+import numpy as np
+import pandas as pd
+
+from synthetic import write_keyword_csv, EMBEDDING_DIM
+from keyword_index import KeywordIndex, build_index
+
+
+def csv_search(csv_path, query_embedding, top_k):
+    # The pre-index implementation of mini_retrieve_similar_keywords
+    from sklearn.metrics.pairwise import cosine_similarity
+    df = pd.read_csv(csv_path)
+    df['embedding'] = df['embedding'].apply(lambda x: np.fromstring(x.strip('[]'), sep=','))
+    df['similarity'] = df['embedding'].apply(lambda x: cosine_similarity([query_embedding], [x])[0][0])
+    results = df.sort_values(by='similarity', ascending=False).head(top_k)
+    return results[['keyword', 'similarity']].to_json(orient='records')
+
+
+def index_search(index, query_embedding, top_k):
+    results = pd.DataFrame(index.search(query_embedding, top_k), columns=['keyword', 'similarity'])
+    return results.to_json(orient='records')
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return np.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--dim', type=int, default=EMBEDDING_DIM)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--csv-repeat', type=int, default=2)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'keywords':>10} {'csv ms':>10} {'build ms':>10} {'load ms':>10} {'index ms':>10} {'speedup':>8} {'same top-k':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.sizes:
+            csv_path = os.path.join(tmp, f'keys_{n}.csv')
+            matrix_path = os.path.join(tmp, f'keys_{n}.npy')
+            keywords_path = os.path.join(tmp, f'keys_{n}.json')
+            write_keyword_csv(csv_path, n, args.dim)
+            query = rng.standard_normal(args.dim).tolist()
+
+            start = time.perf_counter()
+            build_index(csv_path, matrix_path, keywords_path)
+            build_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            index = KeywordIndex.load(matrix_path, keywords_path)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            csv_ms = timed(lambda: csv_search(csv_path, query, args.top_k), args.csv_repeat)
+            index_ms = timed(lambda: index_search(index, query, args.top_k), args.repeat)
+
+            expected = [r['keyword'] for r in json.loads(csv_search(csv_path, query, args.top_k))]
+            actual = [r['keyword'] for r in json.loads(index_search(index, query, args.top_k))]
+
+            print(f"{n:>10} {csv_ms:>10.1f} {build_ms:>10.1f} {load_ms:>10.1f} {index_ms:>10.2f} "
+                  f"{csv_ms / index_ms:>7.0f}x {str(expected == actual):>10}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Memory and top-k overlap of the compact keyword storages (quantization.py)
+against full-precision search. Uses the real vocabulary (v2_key.npy) when
+it exists, otherwise a synthetic clustered one. Run from backend/openai:
+
+    python benchmarks/bench_quantization.py
+    python benchmarks/bench_quantization.py --synthetic 50000
+
+Overlap is the share of the exact top-k (float32, every dimension) that a
+storage returns, averaged over queries near vocabulary keywords; it is
+reported for the compact scores alone and after rescoring top_k * x
+candidates (ms is for the largest x). The float64 column is what the
+original CSV parsing held per keyword.
+"""
+import os
+import time
+import argparse
+import numpy as np
+
+from synthetic import clustered_embeddings, perturbed_queries, EMBEDDING_DIM
+from keyword_index import KeywordIndex, MATRIX_PATH, KEYWORDS_PATH, top_k_indices
+from quantization import QuantizedMatrix
+
+CONFIGURATIONS = [
+    ('float16', 0), ('int8', 0), ('pq', 0),
+    ('float32', 1024), ('float16', 1024), ('int8', 1024), ('pq', 1024),
+    ('int8', 256),
+]
+
+
+def overlap(found, expected):
+    return np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--synthetic', type=int, default=0, help='Keywords of a synthetic vocabulary instead of v2_key.npy.')
+    parser.add_argument('--dim', type=int, default=EMBEDDING_DIM)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--top-k', type=int, default=10)
+    parser.add_argument('--rescore', type=int, nargs='+', default=[4, 20], help='Candidates rescored, as multiples of top-k.')
+    parser.add_argument('--noise', type=float, default=0.8)
+    args = parser.parse_args()
+
+    if not args.synthetic and os.path.exists(MATRIX_PATH):
+        matrix = KeywordIndex.load(MATRIX_PATH, KEYWORDS_PATH).matrix
+        print(f"Vocabulary {MATRIX_PATH}: {matrix.shape[0]} keywords x {matrix.shape[1]} dims")
+    else:
+        matrix = clustered_embeddings(args.synthetic or 50000, args.dim)
+        print(f"Synthetic vocabulary: {matrix.shape[0]} keywords x {matrix.shape[1]} dims")
+    queries = perturbed_queries(matrix, args.queries, args.noise)
+    n = matrix.shape[0]
+
+    start = time.perf_counter()
+    exact = [top_k_indices(matrix @ q, args.top_k) for q in queries]
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    rescored_header = ''.join(f"{'x' + str(r):>8}" for r in args.rescore)
+    print(f"{'storage':<14} {'MB':>9} {'B/keyword':>10} {'vs f64':>7} {'vs f32':>7} "
+          f"{'overlap':>8}{rescored_header} {'ms':>8} {'build s':>8}")
+    print(f"{'float64 (csv)':<14} {n * matrix.shape[1] * 8 / 2**20:>9.1f} {matrix.shape[1] * 8:>10}")
+    print(f"{'float32':<14} {matrix.nbytes / 2**20:>9.1f} {matrix.shape[1] * 4:>10} {2:>6.0f}x {1:>6.0f}x "
+          f"{1:>8.3f}{'':>{8 * len(args.rescore)}} {exact_ms:>8.2f}")
+    for storage, dims in CONFIGURATIONS:
+        if dims >= matrix.shape[1]:
+            continue
+        start = time.perf_counter()
+        quantized = QuantizedMatrix.build(matrix, storage, dims)
+        build_seconds = time.perf_counter() - start
+
+        approximate = [quantized.search(matrix, q, args.top_k, rescore=0)[0] for q in queries]
+        overlaps = []
+        for rescore in args.rescore:
+            start = time.perf_counter()
+            rescored = [quantized.search(matrix, q, args.top_k, rescore=rescore)[0] for q in queries]
+            ms = (time.perf_counter() - start) * 1000 / len(queries)
+            overlaps.append(overlap(rescored, exact))
+
+        per_keyword = quantized.nbytes / n
+        name = storage + (f'/{dims}' if dims else '')
+        print(f"{name:<14} {quantized.nbytes / 2**20:>9.1f} {per_keyword:>10.0f} "
+              f"{matrix.shape[1] * 8 / per_keyword:>6.0f}x {matrix.shape[1] * 4 / per_keyword:>6.1f}x "
+              f"{overlap(approximate, exact):>8.3f}{''.join(f'{o:>8.3f}' for o in overlaps)} "
+              f"{ms:>8.2f} {build_seconds:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Run handling latency against the stub server replaying a recorded run:
+the original fixed 100 ms retrieve loop, adaptive polling and the event
+stream. Run from backend/openai:
+
+    python benchmarks/bench_run_driver.py --speed 4
+"""
+import os
+import sys
+import time
+import argparse
+import warnings
+import numpy as np
+from openai import OpenAI
+
+from stub_openai_server import start_stub_server, RECORDINGS_DIR
+from run_driver import drive_stream, drive_polling
+
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+def no_op_tools(run):
+    # Tool execution is not what is measured here
+    return [{'tool_call_id': call.id, 'output': '{}'}
+            for call in run.required_action.submit_tool_outputs.tool_calls]
+
+
+def legacy_loop(client, thread):
+    # The pre-driver get_answer loop
+    run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id='asst_stub')
+    while run.status != 'completed':
+        run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+        if run.status == 'requires_action':
+            run = client.beta.threads.runs.submit_tool_outputs(
+                thread_id=thread.id, run_id=run.id, tool_outputs=no_op_tools(run))
+        time.sleep(0.1)
+    return run
+
+
+def adaptive_polling(client, thread):
+    run = client.beta.threads.runs.create(thread_id=thread.id, assistant_id='asst_stub')
+    return drive_polling(client, run, thread, no_op_tools)
+
+
+def streaming(client, thread):
+    stream = client.beta.threads.runs.create(thread_id=thread.id, assistant_id='asst_stub', stream=True)
+    return drive_stream(client, stream, thread, no_op_tools)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--recording', default=os.path.join(RECORDINGS_DIR, 'perbaikan_gedung.json'))
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed-up factor.')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    server, state, base_url = start_stub_server(args.recording, speed=args.speed)
+    client = OpenAI(api_key='stub', base_url=base_url)
+    thread = client.beta.threads.create()
+    ideal_ms = sum(e['after_ms'] for segment in state.recording['segments'] for e in segment) / args.speed
+
+    print(f"recorded run time: {ideal_ms:.0f} ms")
+    print(f"{'mode':<18} {'median ms':>10} {'overhead ms':>12} {'API calls/run':>14}")
+    for name, drive in [('fixed 100ms poll', legacy_loop), ('adaptive poll', adaptive_polling), ('event stream', streaming)]:
+        samples = []
+        state.requests.clear()
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            run = drive(client, thread)
+            samples.append((time.perf_counter() - start) * 1000)
+            assert run.status == 'completed', run.status
+        median = np.median(samples)
+        calls = sum(state.requests.values()) / args.repeat
+        print(f"{name:<18} {median:>10.0f} {median - ideal_ms:>12.0f} {calls:>14.1f}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
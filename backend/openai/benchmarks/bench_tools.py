@@ -0,0 +1,246 @@
+"""
+Microbenchmarks for the assistant's tools in list_of_tools, on synthetic
+data_pengadaan tables and synthetic keyword vocabularies. get_embedding is
+replaced by the deterministic stub embedding, so no network is involved.
+
+Reports p50/p99 latency and peak traced memory (tracemalloc, measured in a
+separate run so it does not slow the timed ones) per tool and size, writes
+them to a JSON file and compares against an earlier one. Run from
+backend/openai:
+
+    python benchmarks/bench_tools.py --save benchmarks/baseline.json
+    python benchmarks/bench_tools.py --baseline benchmarks/baseline.json
+
+With --baseline the exit status is 1 when any p50 got slower than
+--threshold times the baseline. It is also 1 when a run step holding both
+a retrieval and a chart call charts anything but the retrieved table.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from types import SimpleNamespace
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+
+from stub_openai_server import stub_embedding
+from synthetic import create_pengadaan_db, synthetic_keywords, synthetic_embeddings
+import config
+import db
+import keyword_index
+import list_of_tools
+from keyword_index import KeywordIndex, normalize_rows
+from keyword_fts import create_keyword_fts
+from chart_render import chart_renderer
+from basic_functions import execute_tool_calls
+
+SESSION = 'bench'
+CONCEPTS = ['perbaikan', 'gedung', 'kantor', 'rehabilitasi']
+
+RETRIEVAL_SQL = (
+    "SELECT * FROM data_pengadaan WHERE (filtered_keywords LIKE '%perbaikan%' OR filtered_keywords LIKE '%rehabilitasi%' "
+    "OR filtered_keywords LIKE '%pemeliharaan%') AND (filtered_keywords LIKE '%gedung%' OR filtered_keywords LIKE '%bangunan%' "
+    "OR filtered_keywords LIKE '%kantor%')"
+)
+MONTHLY_SQL = (
+    "SELECT strftime('%Y-%m', tanggal_umumkan_paket) AS bulan, SUM(total_pagu) AS total_pagu, "
+    "COUNT(kode_rup) AS jumlah_paket FROM intermediary_table GROUP BY bulan ORDER BY bulan"
+)
+SATKER_SQL = (
+    "SELECT satuan_kerja, SUM(total_pagu) AS total_pagu, COUNT(kode_rup) AS jumlah_paket "
+    "FROM intermediary_table GROUP BY satuan_kerja ORDER BY total_pagu DESC"
+)
+
+
+def table_tools(image_directory):
+    """(name, call) for every tool that reads data_pengadaan or the session's intermediary_table."""
+    return [
+        ('intermediary_dataframe_retrieval', lambda: list_of_tools.intermediary_dataframe_retrieval(RETRIEVAL_SQL, SESSION)),
+        ('schema_check', list_of_tools.schema_check),
+        ('bar_chart_tool', lambda: list_of_tools.bar_chart_tool(
+            SATKER_SQL, 'satuan_kerja', 'total_pagu', 'Satuan Kerja', 'Total Pagu', 'Pagu per Satuan Kerja',
+            'bench_bar.png', image_directory, session_id=SESSION)),
+        ('line_chart_tool', lambda: list_of_tools.line_chart_tool(
+            MONTHLY_SQL, 'bulan', ['total_pagu', 'jumlah_paket'], 'Bulan', ['Total Pagu', 'Jumlah Paket'],
+            'Tren Bulanan', 'bench_line.png', image_directory, session_id=SESSION)),
+        ('pie_chart_tool', lambda: list_of_tools.pie_chart_tool(
+            SATKER_SQL, 'satuan_kerja', 'jumlah_paket', 'Paket per Satuan Kerja',
+            'bench_pie.png', image_directory, session_id=SESSION)),
+        ('histogram_tool', lambda: list_of_tools.histogram_tool(
+            "SELECT tanggal_umumkan_paket FROM intermediary_table", 'tanggal_umumkan_paket', 'Bulan', 'Jumlah Paket',
+            'Paket per Bulan', 'bench_histogram.png', image_directory, session_id=SESSION)),
+    ]
+
+
+def tool_call(call_id, name, **arguments):
+    # Shaped like the tool calls of a run's required_action
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+
+
+def one_step(image_directory):
+    """
+    A run step holding a retrieval of one satuan_kerja's packages and a bar
+    chart over intermediary_table. Returns the step and whether the chart
+    saw only the retrieved table.
+    """
+    satker = 'Dinas Kesehatan'
+    calls = [
+        tool_call('call_retrieval', 'intermediary_dataframe_retrieval',
+                  query=f"SELECT * FROM data_pengadaan WHERE satuan_kerja = '{satker}'"),
+        tool_call('call_bar', 'bar_chart_tool', sql_query=SATKER_SQL, x_column='satuan_kerja', y_column='total_pagu',
+                  x_label='Satuan Kerja', y_label='Total Pagu', chart_title='Pagu per Satuan Kerja',
+                  image_filename='bench_step.png', image_directory=image_directory),
+    ]
+
+    def run():
+        # Start from another session table, so a chart that runs first sees other satuan_kerja
+        list_of_tools.intermediary_dataframe_retrieval(RETRIEVAL_SQL, SESSION)
+        return execute_tool_calls(calls, SESSION)
+
+    def charted_retrieval():
+        (_, chart_info) = run()[1]
+        return chart_info is not None and [row['satuan_kerja'] for row in chart_info['chart_data']] == [satker]
+
+    return run, charted_retrieval
+
+
+def measure(fn, repeat):
+    fn()  # first call pays one-off costs (imports, statement cache, page cache)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p99_ms': round(float(np.percentile(samples, 99)), 3),
+        'mean_ms': round(float(np.mean(samples)), 3),
+        'peak_kib': round(peak / 1024, 1),
+        'runs': repeat,
+    }
+
+
+def print_row(key, result, baseline=None):
+    line = f"{key:<48} {result['p50_ms']:>10.2f} {result['p99_ms']:>10.2f} {result['peak_kib']:>11.0f}"
+    if baseline:
+        line += f" {result['p50_ms'] / baseline['p50_ms']:>9.2f}x {result['peak_kib'] / max(baseline['peak_kib'], 1):>9.2f}x"
+    print(line)
+
+
+def compare(results, baseline, threshold):
+    """Keys whose p50 regressed beyond the threshold, plus keys missing on either side."""
+    regressions = [
+        key for key, result in results.items()
+        if key in baseline and result['p50_ms'] > baseline[key]['p50_ms'] * threshold
+    ]
+    missing = sorted(set(baseline) - set(results))
+    added = sorted(set(results) - set(baseline))
+    return regressions, missing, added
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--vocab-sizes', type=int, nargs='+', default=[5000, 20000])
+    parser.add_argument('--dim', type=int, default=3072)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--render-mode', default='inline', help="Chart render mode to measure (default: inline).")
+    parser.add_argument('--fts', action='store_true', help='Build the filtered_keywords FTS index on each table.')
+    parser.add_argument('--save', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='Compare against a JSON file written by --save.')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Allowed p50 slowdown factor.')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+
+    chart_renderer.mode = args.render_mode
+    if args.render_mode == 'pool':
+        chart_renderer.start_pool()
+    list_of_tools.get_embedding = lambda text: stub_embedding(text, args.dim)
+    list_of_tools.get_embeddings = lambda texts, batch_size=None: [stub_embedding(text, args.dim) for text in texts]
+    results = {}
+
+    header = f"{'tool@size':<48} {'p50 ms':>10} {'p99 ms':>10} {'peak KiB':>11}"
+    print(header + (f" {'p50 vs base':>10} {'mem vs base':>10}" if baseline else ''))
+
+    for vocab_size in args.vocab_sizes:
+        keywords = synthetic_keywords(vocab_size)
+        keyword_index._index = KeywordIndex(keywords, normalize_rows(synthetic_embeddings(vocab_size, args.dim)))
+        key = f"mini_retrieve_similar_keywords@{vocab_size}kw"
+        results[key] = measure(lambda: list_of_tools.mini_retrieve_similar_keywords('perbaikan gedung kantor', 10), args.repeat)
+        print_row(key, results[key], baseline.get(key))
+        # One call for several concepts, as the prompt asks for
+        key = f"mini_retrieve_similar_keywords[{len(CONCEPTS)} queries]@{vocab_size}kw"
+        results[key] = measure(lambda: list_of_tools.mini_retrieve_similar_keywords(queries=CONCEPTS, top_k=10), args.repeat)
+        print_row(key, results[key], baseline.get(key))
+    keyword_index.reset_keyword_index()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_directory = os.path.join(tmp, 'images')
+        for n in args.sizes:
+            db_path = os.path.join(tmp, f'pengadaan_{n}.db')
+            conn = create_pengadaan_db(db_path, n)
+            if args.fts:
+                create_keyword_fts(conn)
+            conn.close()
+            config.DATA_DB_PATH = db_path
+
+            for name, call in table_tools(image_directory):
+                key = f"{name}@{n}rows"
+                results[key] = measure(call, args.repeat)
+                print_row(key, results[key], baseline.get(key))
+
+            run_step, charted_retrieval = one_step(image_directory)
+            if not charted_retrieval():
+                print(f"a chart in the same run step as a retrieval did not chart the retrieved table at {n} rows",
+                      file=sys.stderr)
+                return 1
+            key = f"retrieval + bar_chart_tool step@{n}rows"
+            results[key] = measure(run_step, args.repeat)
+            print_row(key, results[key], baseline.get(key))
+            list_of_tools.result_store.drop(SESSION)
+            db.connections.close_all()
+
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'dim': args.dim,
+            'repeat': args.repeat,
+            'render_mode': args.render_mode,
+            'analytics_engine': config.ANALYTICS_ENGINE,
+            'fts': args.fts,
+        },
+        'results': results,
+    }
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.save}")
+
+    if baseline:
+        regressions, missing, added = compare(results, baseline, args.threshold)
+        for key in missing:
+            print(f"not measured in this run: {key}")
+        for key in added:
+            print(f"no baseline for: {key}")
+        for key in regressions:
+            print(f"REGRESSION {key}: p50 {baseline[key]['p50_ms']:.2f} ms -> {results[key]['p50_ms']:.2f} ms")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
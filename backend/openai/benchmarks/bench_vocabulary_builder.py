@@ -0,0 +1,118 @@
+"""
+Vocabulary build throughput against the stub embeddings endpoint, and a
+resume check. The stub answers every request after --latency-ms, like a
+remote API would, so the numbers show what batching and concurrency buy
+over one request per keyword. Run from backend/openai:
+
+    python benchmarks/bench_vocabulary_builder.py --rows 20000 --latency-ms 200
+"""
+import os
+import time
+import argparse
+import tempfile
+import numpy as np
+from openai import OpenAI
+
+from stub_openai_server import start_stub_server, stub_embedding
+from synthetic import create_pengadaan_db
+import config
+import db
+from keyword_index import KeywordIndex
+from vocabulary_builder import VocabularyBuild, build_vocabulary, distinct_keywords
+
+
+class InjectedFailure(Exception):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--vocab-size', type=int, default=5000)
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--latency-ms', type=float, default=200)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--single-sample', type=int, default=20, help='Keywords timed one request at a time.')
+    args = parser.parse_args()
+
+    server, state, base_url = start_stub_server(embedding_dim=args.dim, embedding_latency=args.latency_ms / 1000)
+    client = OpenAI(api_key='stub', base_url=base_url)
+
+    def fetch(texts):
+        response = client.embeddings.create(input=texts, model=config.EMBEDDING_MODEL)
+        return [item.embedding for item in response.data]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'pengadaan.db')
+        create_pengadaan_db(db_path, args.rows, vocab_size=args.vocab_size).close()
+        keywords = distinct_keywords(db_path)
+        print(f"{len(keywords)} distinct keywords in {args.rows} rows")
+
+        start = time.perf_counter()
+        for keyword in keywords[:args.single_sample]:
+            fetch([keyword])
+        per_keyword = (time.perf_counter() - start) / args.single_sample
+        print(f"{'one request per keyword':<28} {len(keywords) * per_keyword:>9.1f} s (extrapolated)")
+
+        for batch_size in args.batch_sizes:
+            for concurrency in args.concurrency:
+                build = VocabularyBuild(keywords, os.path.join(tmp, f'ckpt_{batch_size}_{concurrency}'),
+                                        batch_size=batch_size, concurrency=concurrency, fetch=fetch)
+                start = time.perf_counter()
+                build.run()
+                seconds = time.perf_counter() - start
+                print(f"batch {batch_size:<5} x {concurrency} in flight {seconds:>9.1f} s "
+                      f"({build.requests} requests, {len(keywords) / seconds:.0f} keywords/s)")
+                build.cleanup()
+
+        # Resume: fail after a few batches, then run again with a working endpoint
+        checkpoints = os.path.join(tmp, 'ckpt_resume')
+        calls = {'n': 0}
+
+        def failing_fetch(texts):
+            calls['n'] += 1
+            if calls['n'] > 3:
+                raise InjectedFailure("endpoint went away")
+            return fetch(texts)
+
+        matrix_path, keywords_path = os.path.join(tmp, 'v.npy'), os.path.join(tmp, 'v.json')
+        # A CSV in the layout of v2_key.csv, whose rows the rebuild replaces
+        csv_path = os.path.join(tmp, 'v.csv')
+        with open(csv_path, 'w', encoding='utf-8') as f:
+            f.write('keyword,embedding\n')
+        try:
+            build_vocabulary(db_path, rebuild=True, matrix_path=matrix_path, keywords_path=keywords_path,
+                             csv_path=csv_path, checkpoint_directory=checkpoints, batch_size=500, concurrency=1,
+                             max_retries=0, fetch=failing_fetch)
+        except InjectedFailure:
+            kept = len([f for f in os.listdir(checkpoints) if f.startswith('batch_')])
+            print(f"interrupted with {kept} batches checkpointed")
+        before = state.requests['embeddings.create']
+        stats = build_vocabulary(db_path, rebuild=True, matrix_path=matrix_path, keywords_path=keywords_path,
+                                 csv_path=csv_path, checkpoint_directory=checkpoints, batch_size=500, concurrency=4, fetch=fetch)
+        print(f"resumed with {state.requests['embeddings.create'] - before} requests: {stats}")
+
+        index = KeywordIndex.load(matrix_path, keywords_path)
+        expected = np.vstack([stub_embedding(k, args.dim) for k in index.keywords])
+        assert index.keywords == keywords
+        assert np.allclose(index.matrix, expected, atol=1e-6), "resumed vocabulary differs from a clean build"
+        print("resumed vocabulary matches the stub embeddings")
+
+        # New packages: their keywords are appended to the index and the CSV alike
+        conn = db.connect(db_path, read_only=False)
+        with conn:
+            conn.execute("INSERT INTO data_pengadaan (kode_rup, filtered_keywords) VALUES (1, 'kata baru,lain baru')")
+        stats = build_vocabulary(db_path, matrix_path=matrix_path, keywords_path=keywords_path, csv_path=csv_path,
+                                 checkpoint_directory=checkpoints, fetch=fetch)
+        index = KeywordIndex.load(matrix_path, keywords_path)
+        from_csv = KeywordIndex.from_csv(csv_path)
+        assert stats['new_keywords'] == 2 and index.keywords[-2:] == ['kata baru', 'lain baru']
+        assert from_csv.keywords == index.keywords, "the CSV lost keywords the index has"
+        assert np.allclose(from_csv.matrix, index.matrix, atol=1e-6)
+        print("v2_key.csv layout rebuilds the same vocabulary")
+        db.connections.close_all()
+
+
+if __name__ == '__main__':
+    main()
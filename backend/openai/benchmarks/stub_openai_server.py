@@ -0,0 +1,249 @@
+"""
+Local stand-in for the parts of the OpenAI API the backend uses: threads,
+messages, Assistants runs (polled or streamed) and embeddings.
+
+Runs replay a recorded event timeline (see recordings/ and
+run_driver.EventRecorder): every run walks through the recording's
+segments, one per stream, with the recorded gaps between events. Polling
+clients see the same timeline through GET .../runs/<id>. Embeddings are
+deterministic pseudo-random unit vectors seeded by the input text.
+
+    python benchmarks/stub_openai_server.py --port 8765
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 python main.py
+"""
+import os
+import re
+import sys
+import json
+import time
+import base64
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings')
+
+
+def stub_embedding(text: str, dim: int = 3072) -> np.ndarray:
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class StubState:
+    def __init__(self, recording: dict, speed: float = 1.0, embedding_dim: int = 3072, embedding_latency: float = 0.0):
+        self.recording = recording
+        self.speed = speed
+        self.embedding_dim = embedding_dim
+        self.embedding_latency = embedding_latency
+        self.runs = {}
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self._ids = 0
+
+    def new_id(self, prefix):
+        with self.lock:
+            self._ids += 1
+            return f'{prefix}_{self._ids}'
+
+    def segment_events(self, run):
+        """Recorded events of the run's current segment with their offsets in seconds."""
+        offset, events = 0.0, []
+        for event in self.recording['segments'][run['segment']]:
+            offset += event['after_ms'] / 1000 / self.speed
+            events.append((offset, event))
+        return events
+
+    def run_object(self, run, event=None):
+        if event is None:
+            elapsed = time.monotonic() - run['segment_started']
+            seen = [e for offset, e in self.segment_events(run) if offset <= elapsed]
+            event = seen[-1] if seen else {'event': 'thread.run.queued'}
+
+        status = event['event'].rsplit('.', 1)[1]
+        required_action = None
+        if status == 'requires_action':
+            required_action = {
+                'type': 'submit_tool_outputs',
+                'submit_tool_outputs': {'tool_calls': [
+                    {
+                        'id': f"call_{run['segment']}_{i}",
+                        'type': 'function',
+                        'function': {'name': call['name'], 'arguments': json.dumps(call['arguments'])}
+                    }
+                    for i, call in enumerate(event.get('tool_calls', []))
+                ]}
+            }
+        return {
+            'id': run['id'],
+            'object': 'thread.run',
+            'created_at': run['created_at'],
+            'thread_id': run['thread_id'],
+            'assistant_id': run['assistant_id'],
+            'status': status,
+            'required_action': required_action,
+            'model': 'gpt-4o',
+            'instructions': '',
+            'tools': [],
+        }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_segment(self, run):
+        # Server-sent events with the recorded gaps; the connection closes at the end
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+        started = run['segment_started']
+        for offset, event in self.state.segment_events(run):
+            delay = started + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            data = json.dumps(self.state.run_object(run, event))
+            self.wfile.write(f"event: {event['event']}\ndata: {data}\n\n".encode('utf-8'))
+            self.wfile.flush()
+        self.wfile.write(b"event: done\ndata: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _message(self, thread_id, role, text):
+        return {
+            'id': self.state.new_id('msg'),
+            'object': 'thread.message',
+            'created_at': int(time.time()),
+            'thread_id': thread_id,
+            'role': role,
+            'content': [{'type': 'text', 'text': {'value': text, 'annotations': []}}],
+            'attachments': [],
+            'metadata': {},
+        }
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if match := re.fullmatch(r'/v1/threads/([^/]+)/runs/([^/]+)', path):
+            self.state.requests['runs.retrieve'] += 1
+            run = self.state.runs[match.group(2)]
+            return self._send_json(self.state.run_object(run))
+        if match := re.fullmatch(r'/v1/threads/([^/]+)/messages', path):
+            self.state.requests['messages.list'] += 1
+            message = self._message(match.group(1), 'assistant', self.state.recording.get('final_message') or '')
+            return self._send_json({
+                'object': 'list', 'data': [message],
+                'first_id': message['id'], 'last_id': message['id'], 'has_more': False
+            })
+        self._send_json({'error': {'message': f'no stub for GET {path}'}}, 404)
+
+    def do_POST(self):
+        path = self.path.split('?', 1)[0]
+        body = self._json_body()
+
+        if path == '/v1/threads':
+            self.state.requests['threads.create'] += 1
+            return self._send_json({
+                'id': self.state.new_id('thread'), 'object': 'thread',
+                'created_at': int(time.time()), 'metadata': {}
+            })
+
+        if match := re.fullmatch(r'/v1/threads/([^/]+)/messages', path):
+            self.state.requests['messages.create'] += 1
+            return self._send_json(self._message(match.group(1), body.get('role', 'user'), str(body.get('content'))))
+
+        if match := re.fullmatch(r'/v1/threads/([^/]+)/runs', path):
+            self.state.requests['runs.create'] += 1
+            run = {
+                'id': self.state.new_id('run'), 'thread_id': match.group(1),
+                'assistant_id': body.get('assistant_id'), 'created_at': int(time.time()),
+                'segment': 0, 'segment_started': time.monotonic(),
+            }
+            self.state.runs[run['id']] = run
+            if body.get('stream'):
+                return self._stream_segment(run)
+            return self._send_json(self.state.run_object(run))
+
+        if match := re.fullmatch(r'/v1/threads/([^/]+)/runs/([^/]+)/submit_tool_outputs', path):
+            self.state.requests['runs.submit_tool_outputs'] += 1
+            run = self.state.runs[match.group(2)]
+            if self.state.run_object(run)['status'] != 'requires_action':
+                return self._send_json({'error': {'message': 'run is not waiting for tool outputs'}}, 400)
+            run['segment'] += 1
+            run['segment_started'] = time.monotonic()
+            if body.get('stream'):
+                return self._stream_segment(run)
+            return self._send_json(self.state.run_object(run))
+
+        if path == '/v1/embeddings':
+            self.state.requests['embeddings.create'] += 1
+            if self.state.embedding_latency:
+                time.sleep(self.state.embedding_latency)
+            inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+            dim = body.get('dimensions') or self.state.embedding_dim
+            data = []
+            for i, text in enumerate(inputs):
+                vector = stub_embedding(str(text), dim)
+                if body.get('encoding_format') == 'base64':
+                    embedding = base64.b64encode(vector.astype('<f4').tobytes()).decode('ascii')
+                else:
+                    embedding = vector.tolist()
+                data.append({'object': 'embedding', 'index': i, 'embedding': embedding})
+            return self._send_json({
+                'object': 'list', 'data': data, 'model': body.get('model'),
+                'usage': {'prompt_tokens': 0, 'total_tokens': 0}
+            })
+
+        self._send_json({'error': {'message': f'no stub for POST {path}'}}, 404)
+
+
+def start_stub_server(recording_path: str = None, port: int = 0, speed: float = 1.0, embedding_dim: int = 3072,
+                      embedding_latency: float = 0.0):
+    """Starts the server on a daemon thread; returns (server, state, base_url)."""
+    recording = {'final_message': '', 'segments': []}
+    if recording_path:
+        with open(recording_path, encoding='utf-8') as f:
+            recording = json.load(f)
+
+    state = StubState(recording, speed, embedding_dim, embedding_latency)
+    handler = type('BoundStubHandler', (StubHandler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f'http://127.0.0.1:{server.server_address[1]}/v1'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--recording', default=os.path.join(RECORDINGS_DIR, 'perbaikan_gedung.json'))
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed-up factor.')
+    parser.add_argument('--embedding-dim', type=int, default=3072)
+    parser.add_argument('--embedding-latency-ms', type=float, default=0, help='Delay before each embeddings response.')
+    args = parser.parse_args()
+
+    server, state, base_url = start_stub_server(args.recording, args.port, args.speed, args.embedding_dim,
+                                                args.embedding_latency_ms / 1000)
+    print(f"Stub OpenAI API listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        sys.exit(0)
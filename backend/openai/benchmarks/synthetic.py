@@ -0,0 +1,143 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+EMBEDDING_DIM = 3072
+
+SYLLABLES = [c + v for c in 'bcdfghjklmnprstwy' for v in 'aeiou'] + [v + c for v in 'aeiou' for c in 'klmnrst']
+
+
+def synthetic_keywords(n: int, seed: int = 0) -> list:
+    """Distinct pronounceable pseudo-words, stable for a given seed."""
+    rng = np.random.default_rng(seed)
+    keywords, seen = [], set()
+    while len(keywords) < n:
+        word = ''.join(rng.choice(SYLLABLES, size=rng.integers(2, 5)))
+        if word not in seen:
+            seen.add(word)
+            keywords.append(word)
+    return keywords
+
+
+def synthetic_embeddings(n: int, dim: int = EMBEDDING_DIM, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return rng.standard_normal((n, dim), dtype=np.float32)
+
+
+def clustered_embeddings(n: int, dim: int = EMBEDDING_DIM, clusters: int = None, spread: float = 0.5,
+                         seed: int = 0, chunk_rows: int = 100_000) -> np.ndarray:
+    """
+    Unit rows scattered around random topic centres, closer to how real
+    keyword embeddings bunch together than i.i.d. noise (on which no
+    approximate index can beat a full scan). Generated in chunks so 1M rows
+    do not need a float64 copy.
+    """
+    rng = np.random.default_rng(seed)
+    clusters = clusters or max(1, n // 200)
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    matrix = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, chunk_rows):
+        rows = min(chunk_rows, n - start)
+        block = centres[rng.integers(0, clusters, rows)]
+        block += rng.standard_normal((rows, dim), dtype=np.float32) * (spread / np.sqrt(dim))
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        matrix[start:start + rows] = block
+    return matrix
+
+
+def perturbed_queries(matrix: np.ndarray, count: int, noise: float, seed: int = 1) -> np.ndarray:
+    """Queries near existing keywords, like a user's phrase near vocabulary terms."""
+    rng = np.random.default_rng(seed)
+    queries = matrix[rng.integers(0, matrix.shape[0], count)].copy()
+    queries += rng.standard_normal(queries.shape, dtype=np.float32) * (noise / np.sqrt(matrix.shape[1]))
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def write_keyword_csv(path: str, n: int, dim: int = EMBEDDING_DIM, seed: int = 0):
+    """Writes a file in the same layout as v2_key.csv: keyword, '[...]' embedding."""
+    keywords = synthetic_keywords(n, seed)
+    vectors = synthetic_embeddings(n, dim, seed)
+    embeddings = ['[' + ', '.join(f'{v:.8f}' for v in row) + ']' for row in vectors]
+    pd.DataFrame({'keyword': keywords, 'embedding': embeddings}).to_csv(path, index=False)
+    return keywords, vectors
+
+
+SATUAN_KERJA = [
+    'Badan Kepegawaian dan Pengembangan Sumber Daya Manusia',
+    'Dinas Pekerjaan Umum dan Penataan Ruang',
+    'Dinas Kesehatan',
+    'Dinas Pendidikan',
+    'Sekretariat Daerah',
+    'Badan Perencanaan Pembangunan Daerah',
+    'Dinas Perhubungan',
+    'Rumah Sakit Umum Daerah',
+]
+
+# Real terms from the prompt examples, so benchmark SQL reads like the agent's
+DOMAIN_KEYWORDS = [
+    'perbaikan', 'rehabilitasi', 'pemeliharaan', 'gedung', 'bangunan', 'kantor',
+    'alat', 'peralatan', 'belanja', 'jasa', 'tenaga', 'kebersihan', 'internet', 'konsultansi',
+]
+
+PENGADAAN_SCHEMA = """
+CREATE TABLE IF NOT EXISTS data_pengadaan (
+    kode_rup INTEGER,
+    nama_paket TEXT,
+    nama_klpd TEXT,
+    satuan_kerja TEXT,
+    uraian_pekerjaan TEXT,
+    spesifikasi_pekerjaan TEXT,
+    total_pagu INTEGER,
+    tanggal_umumkan_paket TIMESTAMP,
+    filtered_keywords TEXT
+)
+"""
+
+
+def synthetic_pengadaan_rows(n: int, vocab_size: int = 5000, seed: int = 0, start: int = 0):
+    """Yields data_pengadaan tuples with Zipf-distributed keywords."""
+    rng = np.random.default_rng(seed + start)
+    vocabulary = synthetic_keywords(vocab_size, seed)
+    # Domain terms sit in the middle of the frequency curve, like real package vocabulary
+    for rank, keyword in zip(range(5, 5 + 15 * len(DOMAIN_KEYWORDS), 15), DOMAIN_KEYWORDS):
+        vocabulary.insert(rank, keyword)
+    weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+    base_date = np.datetime64('2023-01-01T08:00:00')
+
+    for i in range(start, start + n):
+        words = rng.choice(len(vocabulary), size=rng.integers(4, 12), replace=False, p=weights)
+        keywords = [vocabulary[w] for w in words]
+        satker = SATUAN_KERJA[rng.integers(len(SATUAN_KERJA))]
+        announced = base_date + np.timedelta64(int(rng.integers(0, 730 * 24 * 3600)), 's')
+        yield (
+            40000000 + i,
+            'Belanja ' + ' '.join(keywords[:4]),
+            'Pemerintah Daerah',
+            satker,
+            'Pekerjaan ' + ' '.join(keywords),
+            'Spesifikasi ' + ', '.join(keywords) + ' sesuai ketentuan yang berlaku',
+            int(rng.integers(10_000_000, 5_000_000_000)),
+            str(announced).replace('T', ' '),
+            # Like the shipped data, a few packages have no keywords at all
+            ','.join(keywords) if i % 1000 != 999 else None,
+        )
+
+
+def create_pengadaan_db(path: str, n: int, vocab_size: int = 5000, seed: int = 0, batch_size: int = 50_000):
+    """Creates (or replaces) a data_pengadaan database with n synthetic rows."""
+    import sqlite3
+
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute(PENGADAAN_SCHEMA)
+    for start in range(0, n, batch_size):
+        rows = synthetic_pengadaan_rows(min(batch_size, n - start), vocab_size, seed, start)
+        with conn:
+            conn.executemany("INSERT INTO data_pengadaan VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    return conn
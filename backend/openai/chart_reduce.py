@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+import config
+
+
+def top_n_with_others(df: pd.DataFrame, label_column: str, value_column: str, n: int,
+                      others_label: str = 'Lainnya') -> pd.DataFrame:
+    """Keeps the n largest rows by value (in their original order) and sums the rest into one row."""
+    if len(df) <= n or value_column not in df.columns:
+        return df
+    values = pd.to_numeric(df[value_column], errors='coerce').fillna(0)
+    keep = values.nlargest(n - 1).index
+    kept = df.loc[df.index.isin(keep)]
+    others = {column: None for column in df.columns}
+    others[label_column] = others_label
+    others[value_column] = values[~df.index.isin(keep)].sum()
+    return pd.concat([kept, pd.DataFrame([others])], ignore_index=True)
+
+
+def _epoch_ns(dates: pd.Series) -> np.ndarray:
+    return dates.to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+
+def _numeric_axis(series: pd.Series) -> np.ndarray:
+    if pd.api.types.is_numeric_dtype(series):
+        return series.to_numpy(dtype=float)
+    dates = pd.to_datetime(series, errors='coerce', format='mixed')
+    if dates.notna().all():
+        return _epoch_ns(dates).astype(float)
+    return np.arange(len(series), dtype=float)
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of `threshold` points that keep the series' shape."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        next_end = max(next_end, next_start + 1)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        areas = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+
+def downsample_line(df: pd.DataFrame, x_column: str, y_column: str, max_points: int) -> pd.DataFrame:
+    if len(df) <= max_points or x_column not in df.columns or y_column not in df.columns:
+        return df
+    x = _numeric_axis(df[x_column])
+    y = pd.to_numeric(df[y_column], errors='coerce').fillna(0).to_numpy(dtype=float)
+    order = np.argsort(x, kind='stable')
+    keep = order[lttb_indices(x[order], y[order], max_points)]
+    return df.iloc[np.sort(keep)].reset_index(drop=True)
+
+
+def _date_label_format(width: pd.Timedelta) -> str:
+    # As fine as the bins are wide, so neighbouring bins never share a label
+    if width >= pd.Timedelta(days=366):
+        return '%Y'
+    if width >= pd.Timedelta(days=31):
+        return '%Y-%m'
+    if width >= pd.Timedelta(days=1):
+        return '%Y-%m-%d'
+    return '%Y-%m-%d %H:%M'
+
+
+def histogram_bins(df: pd.DataFrame, x_column: str, bins: int, max_points: int, top_n: int) -> tuple:
+    """Returns (records, bin_type) with one record per bin: bin_start, bin_end, label, count."""
+    series = df[x_column].dropna()
+    bins = max(1, min(int(bins or 12), max_points))
+
+    if pd.api.types.is_numeric_dtype(series):
+        counts, edges = np.histogram(series.to_numpy(dtype=float), bins=bins)
+        return [
+            {'bin_start': float(edges[i]), 'bin_end': float(edges[i + 1]),
+             'label': f'{edges[i]:,.0f} - {edges[i + 1]:,.0f}', 'count': int(counts[i])}
+            for i in range(len(counts))
+        ], 'numeric'
+
+    dates = pd.to_datetime(series, errors='coerce', format='mixed').dropna()
+    if len(dates) and len(dates) >= len(series) * 0.9:
+        counts, edges = np.histogram(_epoch_ns(dates), bins=bins)
+        edges = pd.to_datetime(edges)
+        label_format = _date_label_format(edges[1] - edges[0])
+        return [
+            {'bin_start': edges[i].isoformat(), 'bin_end': edges[i + 1].isoformat(),
+             'label': edges[i].strftime(label_format), 'count': int(counts[i])}
+            for i in range(len(counts))
+        ], 'datetime'
+
+    counts = series.astype(str).value_counts()
+    if len(counts) > top_n:
+        counts = pd.concat([counts.iloc[:top_n - 1], pd.Series({config.CHART_OTHERS_LABEL: counts.iloc[top_n - 1:].sum()})])
+    return [
+        {'bin_start': label, 'bin_end': label, 'label': label, 'count': int(count)}
+        for label, count in counts.items()
+    ], 'category'
+
+
+def reduce_chart_data(chart_type: str, df: pd.DataFrame, visualization: dict,
+                      max_points: int = None, top_n: int = None) -> tuple:
+    """
+    Shrinks a chart's rows before they are serialized for the browser.
+    Returns (records, reduction) where reduction describes what was done.
+    """
+    max_points = max_points or config.CHART_MAX_POINTS
+    top_n = min(top_n or config.CHART_TOP_N, max_points)
+    original = len(df)
+    method = None
+
+    if chart_type == 'bar' and len(df) > top_n:
+        df = top_n_with_others(df, visualization.get('x_column'), visualization.get('y_column'), top_n,
+                               config.CHART_OTHERS_LABEL)
+        method = 'top_n'
+    elif chart_type == 'pie' and len(df) > top_n:
+        df = top_n_with_others(df, visualization.get('label_column'), visualization.get('value_column'), top_n,
+                               config.CHART_OTHERS_LABEL)
+        method = 'top_n'
+    elif chart_type == 'line' and len(df) > max_points:
+        y_columns = visualization.get('y_columns') or [visualization.get('y_column')]
+        df = downsample_line(df, visualization.get('x_column'), y_columns[0], max_points)
+        method = 'lttb'
+    elif chart_type == 'histogram' and visualization.get('x_column') in df.columns:
+        records, bin_type = histogram_bins(df, visualization['x_column'], visualization.get('bins'), max_points, top_n)
+        return records, {'method': 'bins', 'bin_type': bin_type, 'original_points': original,
+                         'returned_points': len(records)}
+
+    if len(df) > max_points:
+        df = df.head(max_points)
+        method = method or 'truncate'
+
+    records = df.astype(object).where(df.notna(), None).to_dict(orient='records')
+    return records, {'method': method, 'original_points': original, 'returned_points': len(records)}
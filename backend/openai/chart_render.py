@@ -0,0 +1,317 @@
+import os
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+import config
+from metrics import span
+
+RENDER_MODES = ('inline', 'deferred', 'pool', 'data')
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+def _pyplot():
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    return plt
+
+
+def _save(plt, image_path, **savefig_kwargs):
+    try:
+        plt.savefig(image_path, format='png', bbox_inches='tight', **savefig_kwargs)
+    finally:
+        plt.close('all')
+
+
+def render_bar(df, image_path, x_column, y_column, x_label, y_label, chart_title):
+    plt = _pyplot()
+    df.plot(kind='bar', x=x_column, y=y_column, xlabel=x_label, ylabel=y_label, title=chart_title, legend=False)
+    plt.xticks(rotation=45)
+    _save(plt, image_path)
+
+
+def render_line(df, image_path, x_column, y_columns, x_label, y_labels, chart_title, figsize=(12, 6)):
+    plt = _pyplot()
+    fig, ax1 = plt.subplots(figsize=figsize)
+
+    # Plot first y-axis (Total Budget)
+    color1 = '#2E86C1'
+    ax1.set_xlabel(x_label)
+    ax1.set_ylabel(y_labels[0])
+    line1 = ax1.plot(df[x_column], df[y_columns[0]], color=color1, marker='o')
+    ax1.tick_params(axis='y', labelcolor=color1)
+
+    # Format y-axis as billions
+    def format_billions(x, p):
+        return f'Rp {x/1e9:.1f}B'
+    ax1.yaxis.set_major_formatter(plt.FuncFormatter(format_billions))
+
+    # Create second y-axis for number of packages
+    ax2 = ax1.twinx()
+    color2 = '#E74C3C'
+    ax2.set_ylabel(y_labels[1])
+    line2 = ax2.plot(df[x_column], df[y_columns[1]], color=color2, marker='s')
+    ax2.tick_params(axis='y', labelcolor=color2)
+
+    ax1.legend(line1 + line2, y_labels, loc='upper left')
+    plt.xticks(rotation=45, ha='right')
+    plt.title(chart_title, pad=20)
+    plt.tight_layout()
+    _save(plt, image_path, dpi=300)
+
+
+def render_pie(df, image_path, label_column, value_column, chart_title):
+    plt = _pyplot()
+    df.set_index(label_column)[value_column].plot(kind='pie', autopct='%1.1f%%', title=chart_title)
+    plt.ylabel('')  # Hide the y-label for a cleaner look
+    _save(plt, image_path)
+
+
+def histogram_values(df, x_column, bins):
+    """
+    Picks what histogram_tool plots for x_column: numeric values as they
+    are, dates as month numbers with one bin per month, anything else as
+    categories. Returns (df, values, bins).
+    """
+    if pd.api.types.is_numeric_dtype(df[x_column]):
+        return df, df[x_column], bins
+    if pd.api.types.is_datetime64_any_dtype(df[x_column]) or pd.api.types.is_object_dtype(df[x_column]):
+        df = df.copy()
+        df[x_column] = pd.to_datetime(df[x_column], errors='coerce')
+        # Drop rows where conversion failed
+        df = df.dropna(subset=[x_column])
+        return df, df[x_column].dt.month, np.arange(1, 14) - 0.5  # Edges between months
+    return df, df[x_column], bins
+
+
+def render_histogram(df, image_path, x_column, x_label, y_label, chart_title, bins=12):
+    plt = _pyplot()
+    df, values, bins = histogram_values(df, x_column, bins)
+    if pd.api.types.is_numeric_dtype(df[x_column]) or pd.api.types.is_datetime64_any_dtype(df[x_column]):
+        plt.figure()
+        plt.hist(values, bins=bins, edgecolor='black')
+        plt.title(chart_title)
+        plt.xlabel(x_label)
+        plt.ylabel(y_label)
+        if pd.api.types.is_datetime64_any_dtype(df[x_column]) or 'Month' in df.columns:
+            plt.xticks(range(1, 13), MONTH_NAMES)
+    else:
+        # Bar plot of counts for categorical data
+        values.value_counts().sort_index().plot(kind='bar', title=chart_title, width=1.0)
+        plt.xlabel(x_label)
+        plt.ylabel(y_label)
+        plt.xticks(rotation=45)
+    _save(plt, image_path)
+
+
+RENDERERS = {
+    'bar': render_bar,
+    'line': render_line,
+    'pie': render_pie,
+    'histogram': render_histogram,
+}
+
+
+def _warm_worker():
+    # Pay the matplotlib import and backend setup once per worker, not per chart
+    _pyplot()
+
+
+def _ping():
+    return os.getpid()
+
+
+def chart_filename(session_id: str, image_filename: str) -> str:
+    """
+    The session's own name for a chart image, so two sessions that pick the
+    same image_filename (e.g. chart.png) never overwrite each other's chart.
+    """
+    session_key = hashlib.sha1(str(session_id).encode('utf-8')).hexdigest()[:12]
+    return f"{session_key}_{os.path.basename(image_filename)}"
+
+
+class _PendingImage:
+    """An image that is rendered on first request (deferred) or by a pool worker."""
+
+    def __init__(self, path, render=None, future=None, size_bytes: int = 0):
+        self.path = path
+        self.render = render
+        self.future = future
+        # Memory of the frame the render closure keeps alive
+        self.size_bytes = size_bytes
+        self.lock = threading.Lock()
+
+    def wait(self, timeout=None) -> str:
+        if self.future is not None:
+            self.future.result(timeout)
+            return self.path
+        with self.lock:
+            if self.render is not None:
+                self.render()
+                # Drop the frame once the file exists
+                self.render = None
+                self.size_bytes = 0
+        return self.path
+
+
+class ChartRenderer:
+    """
+    Produces the PNGs behind the chart tools in one of four modes
+    (SIRUPA_CHART_RENDER_MODE):
+
+    - inline: render during the tool call, as before
+    - deferred: remember the chart and render it on the first GET /images/<file>
+    - pool: hand the chart to worker processes that already imported matplotlib
+    - data: never rasterize; the frontend draws chart_data itself
+
+    Only inline keeps figure creation and savefig inside the tool call, so
+    it is the only mode whose render errors reach the assistant; it is the
+    default. Deferred charts hold their frame until rendered, bounded by
+    max_pending charts and max_pending_bytes.
+    """
+
+    def __init__(self, mode: str = 'inline', workers: int = 2, max_pending: int = 256,
+                 max_pending_bytes: int = 64 * 1024 * 1024, image_directory: str = './images'):
+        if mode not in RENDER_MODES:
+            raise ValueError(f"Unknown chart render mode '{mode}', expected one of {', '.join(RENDER_MODES)}")
+        self.mode = mode
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_pending_bytes = max_pending_bytes
+        self.image_directory = image_directory
+        self._pending = OrderedDict()
+        self._pending_lock = threading.Lock()
+        # pyplot keeps global figure state, so in-process renders take turns
+        self._pyplot_lock = threading.Lock()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def start_pool(self):
+        """
+        Starts the worker processes and waits until each has imported
+        matplotlib. Call it before the server starts any thread (warm-up
+        does): the workers are forked.
+        """
+        with self._pool_lock:
+            if self._pool is None:
+                # fork: workers must not re-import the server's __main__ module
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('fork'),
+                    initializer=_warm_worker
+                )
+                for future in [self._pool.submit(_ping) for _ in range(self.workers)]:
+                    future.result()
+        return self._pool
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _render_locked(self, chart_type, df, image_path, params):
+        with self._pyplot_lock, span('chart.render', chart=chart_type):
+            RENDERERS[chart_type](df, image_path, **params)
+
+    def _remember(self, filename, pending):
+        with self._pending_lock:
+            self._pending[filename] = pending
+            self._pending.move_to_end(filename)
+            # Oldest first; an evicted chart that was never rendered is gone (404)
+            total = sum(p.size_bytes for p in self._pending.values())
+            while len(self._pending) > self.max_pending or total > self.max_pending_bytes:
+                _, evicted = self._pending.popitem(last=False)
+                total -= evicted.size_bytes
+
+    def _submit_to_pool(self, renderer, df, image_path, params):
+        """
+        The pool's future for the render, or None when there is no pool. The
+        pool is never forked again from here: request threads of a
+        multithreaded server must not fork, so after a worker dies charts are
+        rendered in-process until the server restarts.
+        """
+        with self._pool_lock:
+            pool = self._pool
+        if pool is None:
+            return None
+        try:
+            return pool.submit(renderer, df, image_path, **params)
+        except BrokenProcessPool:
+            print("Chart render pool is broken; rendering charts in-process from now on")
+            self.shutdown()
+            return None
+
+    def submit(self, chart_type: str, df: pd.DataFrame, image_directory: str, image_filename: str,
+               session_id: str = 'default', **params):
+        """
+        Renders or schedules the chart image under the session's own file
+        name (chart_filename). Returns the image path, or None in data mode.
+        """
+        if self.mode == 'data':
+            return None
+
+        os.makedirs(image_directory, exist_ok=True)
+        filename = chart_filename(session_id, image_filename)
+        image_path = os.path.join(image_directory, filename)
+        renderer = RENDERERS[chart_type]
+
+        size_bytes = int(df.memory_usage(index=True, deep=True).sum())
+        # A frame too large to hold on to is rendered right away
+        if self.mode == 'inline' or size_bytes > self.max_pending_bytes:
+            self._render_locked(chart_type, df, image_path, params)
+            return image_path
+
+        future = self._submit_to_pool(renderer, df, image_path, params) if self.mode == 'pool' else None
+        if future is not None:
+            self._remember(filename, _PendingImage(image_path, future=future))
+            return image_path
+
+        self._remember(filename, _PendingImage(
+            image_path, render=lambda: self._render_locked(chart_type, df, image_path, params),
+            size_bytes=size_bytes
+        ))
+        return image_path
+
+    def describe(self, image_path) -> str:
+        """How the tool output tells the assistant where the image is."""
+        if image_path is None:
+            return "Chart data was sent to the frontend (no image rendered)."
+        if self.mode == 'inline':
+            return f"Image saved at {image_path}."
+        return f"Image available at /images/{os.path.basename(image_path)}."
+
+    def image_path(self, filename: str, timeout: float = None):
+        """
+        Path of a rendered image by its session-scoped file name, rendering it
+        first if it is still pending. Returns None for charts this process
+        never saw.
+        """
+        with self._pending_lock:
+            pending = self._pending.get(filename)
+        if pending is not None:
+            with span('chart.image_wait'):
+                return pending.wait(timeout)
+        return None
+
+    def stats(self) -> dict:
+        with self._pending_lock:
+            pending = sum(1 for p in self._pending.values()
+                          if p.render is not None or (p.future is not None and not p.future.done()))
+            return {'mode': self.mode, 'tracked': len(self._pending), 'pending': pending,
+                    'pending_bytes': sum(p.size_bytes for p in self._pending.values()),
+                    'workers': self.workers if self._pool is not None else 0}
+
+
+chart_renderer = ChartRenderer(
+    mode=config.CHART_RENDER_MODE,
+    workers=config.CHART_RENDER_WORKERS,
+    max_pending=config.CHART_RENDER_MAX_PENDING,
+    max_pending_bytes=config.CHART_RENDER_MAX_PENDING_BYTES,
+    image_directory=config.CHART_IMAGE_DIRECTORY
+)
@@ -0,0 +1,132 @@
+import os
+
+
+def _int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _float(name, default):
+    return float(os.environ.get(name, default))
+
+
+EMBEDDING_MODEL = os.environ.get('SIRUPA_EMBEDDING_MODEL', 'text-embedding-3-large')
+# Texts per embeddings request when several are embedded at once (the API accepts up to 2048)
+EMBEDDING_BATCH_SIZE = _int('SIRUPA_EMBEDDING_BATCH_SIZE', 256)
+
+# Embedding cache: in-process LRU in front of a persistent SQLite store
+EMBEDDING_CACHE_PATH = os.environ.get('SIRUPA_EMBEDDING_CACHE_PATH', 'data/embedding_cache.db')
+EMBEDDING_CACHE_MAX_ENTRIES = _int('SIRUPA_EMBEDDING_CACHE_MAX_ENTRIES', 4096)
+EMBEDDING_CACHE_MAX_BYTES = _int('SIRUPA_EMBEDDING_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+
+# Per-session intermediary results, held in in-memory SQLite databases
+RESULT_STORE_MAX_SESSIONS = _int('SIRUPA_RESULT_STORE_MAX_SESSIONS', 256)
+RESULT_STORE_MAX_BYTES = _int('SIRUPA_RESULT_STORE_MAX_BYTES', 512 * 1024 * 1024)
+RESULT_STORE_TTL_SECONDS = _float('SIRUPA_RESULT_STORE_TTL_SECONDS', 3600)
+
+# Chat sessions (session_id -> OpenAI thread), shared by every worker process
+SESSION_STORE_PATH = os.environ.get('SIRUPA_SESSION_STORE_PATH', 'data/sessions.db')
+SESSION_MAX = _int('SIRUPA_SESSION_MAX', 10000)
+SESSION_TTL_SECONDS = _float('SIRUPA_SESSION_TTL_SECONDS', 24 * 3600)
+
+# Tool calls of one run step run concurrently on a shared pool
+TOOL_WORKERS = _int('SIRUPA_TOOL_WORKERS', 8)
+TOOL_TIMEOUT_SECONDS = _float('SIRUPA_TOOL_TIMEOUT_SECONDS', 120)
+TOOL_TIMEOUTS = {
+    'mini_retrieve_similar_keywords': _float('SIRUPA_KEYWORD_TOOL_TIMEOUT_SECONDS', 30),
+    'schema_check': _float('SIRUPA_SCHEMA_TOOL_TIMEOUT_SECONDS', 10),
+}
+
+# search_pengadaan: vocabulary keywords considered per concept, and the similarity
+# a keyword needs to be searched for along with its concept
+SEARCH_KEYWORDS_PER_CONCEPT = _int('SIRUPA_SEARCH_KEYWORDS_PER_CONCEPT', 10)
+SEARCH_SIMILARITY_THRESHOLD = _float('SIRUPA_SEARCH_SIMILARITY_THRESHOLD', 0.6)
+
+# Follow runs through streamed events; set to 0 to fall back to adaptive polling
+RUN_STREAMING = os.environ.get('SIRUPA_RUN_STREAMING', '1') == '1'
+# When set, the event timeline of every streamed run is saved here for offline replay
+RUN_RECORDING_DIR = os.environ.get('SIRUPA_RUN_RECORDING_DIR')
+
+# Asynchronous /chat jobs
+JOB_WORKERS = _int('SIRUPA_JOB_WORKERS', 4)
+JOB_QUEUE_DEPTH = _int('SIRUPA_JOB_QUEUE_DEPTH', 32)
+JOB_TTL_SECONDS = _float('SIRUPA_JOB_TTL_SECONDS', 3600)
+
+# SQLite
+DATA_DB_PATH = os.environ.get('SIRUPA_DATA_DB_PATH', 'data_pengadaan_copy.db')
+SQLITE_MMAP_SIZE = _int('SIRUPA_SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+SQLITE_CACHE_KIB = _int('SIRUPA_SQLITE_CACHE_KIB', 64 * 1024)
+SQLITE_STATEMENT_CACHE = _int('SIRUPA_SQLITE_STATEMENT_CACHE', 256)
+SQLITE_BUSY_TIMEOUT_MS = _int('SIRUPA_SQLITE_BUSY_TIMEOUT_MS', 30000)
+
+# Chart payloads sent to the frontend
+CHART_MAX_POINTS = _int('SIRUPA_CHART_MAX_POINTS', 500)
+CHART_TOP_N = _int('SIRUPA_CHART_TOP_N', 20)
+CHART_OTHERS_LABEL = os.environ.get('SIRUPA_CHART_OTHERS_LABEL', 'Lainnya')
+
+# Query engine for data_pengadaan and chart aggregations: 'sqlite' or 'duckdb'
+# (columnar, reads a Parquet snapshot of data_pengadaan; needs `pip install duckdb`)
+ANALYTICS_ENGINE = os.environ.get('SIRUPA_ANALYTICS_ENGINE', 'sqlite')
+PARQUET_SNAPSHOT_PATH = os.environ.get('SIRUPA_PARQUET_SNAPSHOT_PATH', 'data/data_pengadaan.parquet')
+DUCKDB_THREADS = _int('SIRUPA_DUCKDB_THREADS', os.cpu_count() or 4)
+
+# Chart PNGs: 'inline' (render in the tool call, so render errors reach the
+# assistant), 'deferred' (render on the first GET /images/<file>), 'pool'
+# (pre-warmed worker processes) or 'data' (no image; the frontend draws chart_data).
+# Deferred charts keep their data until rendered, bounded by count and bytes.
+CHART_RENDER_MODE = os.environ.get('SIRUPA_CHART_RENDER_MODE', 'inline')
+CHART_RENDER_WORKERS = _int('SIRUPA_CHART_RENDER_WORKERS', 2)
+CHART_RENDER_MAX_PENDING = _int('SIRUPA_CHART_RENDER_MAX_PENDING', 256)
+CHART_RENDER_MAX_PENDING_BYTES = _int('SIRUPA_CHART_RENDER_MAX_PENDING_BYTES', 64 * 1024 * 1024)
+CHART_RENDER_TIMEOUT_SECONDS = _float('SIRUPA_CHART_RENDER_TIMEOUT_SECONDS', 60)
+CHART_IMAGE_DIRECTORY = os.environ.get('SIRUPA_CHART_IMAGE_DIRECTORY', './images')
+
+# Startup: seconds from process start to ready before a warning is logged
+# (and `python warmup.py` exits non-zero)
+STARTUP_BUDGET_SECONDS = _float('SIRUPA_STARTUP_BUDGET_SECONDS', 20)
+DEBUG = os.environ.get('SIRUPA_DEBUG', '1') == '1'
+
+# Per-request stage traces kept for GET /traces/<request_id>
+METRICS_MAX_TRACES = _int('SIRUPA_METRICS_MAX_TRACES', 1000)
+
+# Result delivery: /chat carries the first page, /results/<id> pages the rest
+RESULT_PAGE_SIZE = _int('SIRUPA_RESULT_PAGE_SIZE', 100)
+RESULT_PAGE_MAX = _int('SIRUPA_RESULT_PAGE_MAX', 1000)
+RESULT_STREAM_BATCH = _int('SIRUPA_RESULT_STREAM_BATCH', 500)
+
+# Result cache for intermediary_dataframe_retrieval queries (0 disables it)
+QUERY_CACHE_MAX_BYTES = _int('SIRUPA_QUERY_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+QUERY_CACHE_MAX_ENTRY_BYTES = _int('SIRUPA_QUERY_CACHE_MAX_ENTRY_BYTES', 64 * 1024 * 1024)
+
+# Query guard for the SQL the assistant writes (0 turns a limit off). The
+# timeout is below the tool timeout so a runaway query frees its worker.
+QUERY_MAX_ROWS = _int('SIRUPA_QUERY_MAX_ROWS', 200_000)
+QUERY_TIMEOUT_SECONDS = _float('SIRUPA_QUERY_TIMEOUT_SECONDS', 60)
+
+# ingest.py: rows per upsert transaction, and processes deriving filtered_keywords (0 = one per core)
+INGEST_BATCH_ROWS = _int('SIRUPA_INGEST_BATCH_ROWS', 5000)
+INGEST_WORKERS = _int('SIRUPA_INGEST_WORKERS', 0)
+
+# vocabulary_builder.py: keywords per embeddings request, requests in flight, retries per batch
+VOCABULARY_BATCH_SIZE = _int('SIRUPA_VOCABULARY_BATCH_SIZE', 1000)
+VOCABULARY_CONCURRENCY = _int('SIRUPA_VOCABULARY_CONCURRENCY', 4)
+VOCABULARY_MAX_RETRIES = _int('SIRUPA_VOCABULARY_MAX_RETRIES', 5)
+VOCABULARY_CHECKPOINT_DIRECTORY = os.environ.get('SIRUPA_VOCABULARY_CHECKPOINT_DIRECTORY', 'data/vocabulary_build')
+
+# Keyword search: 'exact' scores every keyword, 'ivf' only the nprobe closest of
+# nlist clusters (0 = about 4 * sqrt(vocabulary size)); see ann_index.py. The IVF
+# index takes appended keywords into its lists and is retrained once they exceed
+# MAX_TAIL of the keywords its centroids were trained on.
+KEYWORD_ANN = os.environ.get('SIRUPA_KEYWORD_ANN', 'exact')
+KEYWORD_IVF_NLIST = _int('SIRUPA_KEYWORD_IVF_NLIST', 0)
+KEYWORD_IVF_NPROBE = _int('SIRUPA_KEYWORD_IVF_NPROBE', 16)
+KEYWORD_IVF_MAX_TAIL = _float('SIRUPA_KEYWORD_IVF_MAX_TAIL', 0.1)
+
+# Exhaustive keyword search over a compact copy of the matrix: 'float32' (the
+# matrix itself), 'float16', 'int8' (with a scale per keyword) or 'pq' (one byte
+# per subspace; 0 = DIMS / 16), optionally of only the first DIMS dimensions
+# (0 = all). The best top_k * RESCORE_FACTOR are rescored against the float32
+# rows (0 = no rescoring); see quantization.py. Only for SIRUPA_KEYWORD_ANN=exact.
+KEYWORD_STORAGE = os.environ.get('SIRUPA_KEYWORD_STORAGE', 'float32')
+KEYWORD_STORAGE_DIMS = _int('SIRUPA_KEYWORD_STORAGE_DIMS', 0)
+KEYWORD_PQ_SUBSPACES = _int('SIRUPA_KEYWORD_PQ_SUBSPACES', 0)
+KEYWORD_RESCORE_FACTOR = _int('SIRUPA_KEYWORD_RESCORE_FACTOR', 20)
@@ -0,0 +1,97 @@
+import atexit
+import sqlite3
+import threading
+from pathlib import Path
+import config
+
+
+class ConnectionManager:
+    """
+    Per-thread pool of SQLite connections, one per (database, mode).
+
+    Tools run on long-lived Flask and tool-pool threads, so a thread keeps
+    reusing its connection, and with it the page cache, the memory map and
+    sqlite3's compiled-statement cache. Read-only connections use a
+    mode=ro URI plus query_only; writable ones switch the file to WAL so
+    readers are never blocked by a writer. Connections of finished threads
+    are closed on the next connect, and everything is closed at exit.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def connect(self, path: str, read_only: bool = True) -> sqlite3.Connection:
+        key = (str(Path(path).resolve()), read_only)
+        pool = getattr(self._local, 'connections', None)
+        if pool is None:
+            pool = self._local.connections = {}
+
+        conn = pool.get(key)
+        if conn is None:
+            self._close_dead_threads()
+            conn = self._open(key[0], read_only)
+            pool[key] = conn
+            with self._lock:
+                self._connections.append((threading.get_ident(), key, conn))
+        return conn
+
+    def _open(self, path: str, read_only: bool) -> sqlite3.Connection:
+        if read_only:
+            conn = sqlite3.connect(
+                Path(path).as_uri() + '?mode=ro', uri=True,
+                check_same_thread=False, cached_statements=config.SQLITE_STATEMENT_CACHE
+            )
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn = sqlite3.connect(
+                path, check_same_thread=False, cached_statements=config.SQLITE_STATEMENT_CACHE
+            )
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {config.SQLITE_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA mmap_size = {config.SQLITE_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = -{config.SQLITE_CACHE_KIB}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _close_dead_threads(self):
+        alive = {t.ident for t in threading.enumerate()}
+        with self._lock:
+            dead = [entry for entry in self._connections if entry[0] not in alive]
+            self._connections = [entry for entry in self._connections if entry[0] in alive]
+        for _, _, conn in dead:
+            conn.close()
+
+    def close_thread(self):
+        """Closes the calling thread's connections."""
+        pool = getattr(self._local, 'connections', {})
+        with self._lock:
+            self._connections = [e for e in self._connections if e[2] not in pool.values()]
+        for conn in pool.values():
+            conn.close()
+        pool.clear()
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for _, _, conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+        self._local = threading.local()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'open_connections': len(self._connections)}
+
+
+connections = ConnectionManager()
+atexit.register(connections.close_all)
+
+
+def connect(path: str = None, read_only: bool = True) -> sqlite3.Connection:
+    """Pooled connection for the calling thread; do not close it."""
+    return connections.connect(path or config.DATA_DB_PATH, read_only)
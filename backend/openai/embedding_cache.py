@@ -0,0 +1,141 @@
+import os
+import db
+import threading
+from collections import OrderedDict
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    # Case and whitespace differences should not cost another embedding call
+    return ' '.join(str(text).casefold().split())
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache for embedding vectors.
+
+    Tier 1 is an in-process LRU bounded by entry count and total bytes.
+    Tier 2 is a SQLite file shared by every process, so restarts and other
+    workers start warm. Both tiers are keyed by (model, normalized text).
+    """
+
+    def __init__(self, path: str, max_entries: int = 4096, max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _connection(self):
+        # Pooled per-thread connection; WAL lets several processes share the file
+        if not self._schema_ready:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = db.connect(self.path, read_only=False)
+        if not self._schema_ready:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    PRIMARY KEY (model, text)
+                )
+            """)
+            conn.commit()
+            self._schema_ready = True
+        return conn
+
+    def _remember(self, key, vector):
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key).nbytes
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+        while self._memory and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def get(self, model: str, text: str):
+        key = (model, normalize_text(text))
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return vector
+
+        # The pooled connection is per thread, so disk reads need no lock of ours
+        row = self._connection().execute(
+            "SELECT vector FROM embeddings WHERE model = ? AND text = ?", key
+        ).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            vector = np.frombuffer(row[0], dtype=np.float32)
+            self._remember(key, vector)
+            self.disk_hits += 1
+        return vector
+
+    def put(self, model: str, text: str, embedding) -> np.ndarray:
+        key = (model, normalize_text(text))
+        vector = np.asarray(embedding, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            self._remember(key, vector)
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+                (*key, vector.tobytes())
+            )
+        return vector
+
+    def put_many(self, model: str, texts: list, embeddings) -> list:
+        """put() for several texts, written in one transaction."""
+        keys = [(model, normalize_text(text)) for text in texts]
+        vectors = []
+        for embedding in embeddings:
+            vector = np.asarray(embedding, dtype=np.float32)
+            vector.setflags(write=False)
+            vectors.append(vector)
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text, vector) VALUES (?, ?, ?)",
+                [(*key, vector.tobytes()) for key, vector in zip(keys, vectors)]
+            )
+        return vectors
+
+    def get_or_compute(self, model: str, text: str, compute) -> np.ndarray:
+        # The normalized text is what gets embedded, so every variant of it maps to the same vector
+        vector = self.get(model, text)
+        if vector is None:
+            normalized = normalize_text(text)
+            vector = self.put(model, normalized, compute(normalized))
+        return vector
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+            }
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
@@ -1,3 +1,5 @@
+import config
+
 mini_retrieve_similar_keywords_definition = {
     'type': 'function',
     'function': {
@@ -5,7 +7,9 @@ mini_retrieve_similar_keywords_definition = {
         'description': (
             "Use this tool to find available keywords on the database"
             "The tool performs a search to retrieve the most similar keywords. "
-            "Input: Query and top_k. Output: A DataFrame with the most similar keywords and their similarity scores."
+            "Input: Query (or a list of queries, one per concept) and top_k. "
+            "Output: A DataFrame with the most similar keywords and their similarity scores; "
+            "with queries, one group of keywords per query."
         ),
         'parameters': {
             'type': 'object',
@@ -14,13 +18,21 @@ mini_retrieve_similar_keywords_definition = {
                     'type': 'string',
                     'description': 'The search query keyword to find similar ones.'
                 },
+                'queries': {
+                    'type': 'array',
+                    'items': {'type': 'string'},
+                    'description': (
+                        'Several concepts to look up in one call, e.g. ["perbaikan", "gedung"]. '
+                        'Prefer this over one call per concept.'
+                    )
+                },
                 'top_k': {
                     'type': 'integer',
                     'description': 'Number of top similar results to return. Default is 10.',
                     'default': 10
                 }
             },
-            'required': ['query'],
+            'required': [],
             'additionalProperties': False
         }
     }
@@ -57,6 +69,52 @@ intermediary_dataframe_retrieval_definition = {
     }
 }
 
+search_pengadaan_definition = {
+    'type': 'function',
+    'function': {
+        'name': 'search_pengadaan',
+        'description': (
+            "Searches data_pengadaan in one step. Each concept is expanded into similar database keywords "
+            f"(similarity above {config.SEARCH_SIMILARITY_THRESHOLD:g}), concepts are combined with AND, "
+            "synonyms within a concept with OR, exclusions with AND NOT, and the optional date range and "
+            "satuan_kerja filter are applied. Exclusions are matched as written and not expanded, so list "
+            "every variant to exclude. "
+            "The result is kept as the intermediary_table for the chart tools. "
+            "Output: The keywords used, the query, the row count, total pagu, the largest work units and the first rows."
+        ),
+        'parameters': {
+            'type': 'object',
+            'properties': {
+                'concepts': {
+                    'type': 'array',
+                    'items': {'type': 'string'},
+                    'description': 'One entry per concept the packages must match, e.g. ["perbaikan", "gedung"].'
+                },
+                'exclusions': {
+                    'type': 'array',
+                    'items': {'type': 'string'},
+                    'description': 'Keywords the packages must not contain, matched as written (not expanded), '
+                                   'e.g. ["alat", "peralatan"].'
+                },
+                'date_from': {
+                    'type': 'string',
+                    'description': 'First announcement date (tanggal_umumkan_paket) to include, as YYYY-MM-DD.'
+                },
+                'date_to': {
+                    'type': 'string',
+                    'description': 'Last announcement date to include, as YYYY-MM-DD.'
+                },
+                'satuan_kerja': {
+                    'type': 'string',
+                    'description': 'Part of the work unit name to filter on, e.g. "Badan Kepegawaian".'
+                }
+            },
+            'required': ['concepts'],
+            'additionalProperties': False
+        }
+    }
+}
+
 schema_check_definition = {
     'type': 'function',
     'function': {
@@ -81,11 +139,11 @@ bar_chart_tool_definition = {
         'name': 'bar_chart_tool',
         'description': (
             """
-            Creates a bar chart from data queried from the 'intermediary_table' in the 'intermediary.db'.
+            Creates a bar chart from data queried from the 'intermediary_table' of the current session.
             if the user doesn't specify the request, x-axis is satuan_kerja and y-axis is total_pagu. 
             
             - **Inputs**: SQL query, x-axis column, y-axis column, chart title, x label, y label, image filename, and optional image directory.
-            - **Output**: Path to the saved image.
+            - **Output**: Where the image can be fetched (unless images are disabled), plus data insights.
 
             **Example Usage:**
             ```python
@@ -223,10 +281,10 @@ pie_chart_tool_definition = {
         'description': (
             """
             Creates a pie chart. If the user doesn't specify, shows the distribution of procurement packages based on the work unit category.
-            Uses data queried from 'intermediary_table' in 'intermediary.db'.
+            Uses data queried from 'intermediary_table' of the current session.
             
             - **Inputs**: SQL query, label column (work unit), value column (package count), chart title, image filename, optional image directory.
-            - **Output**: Path to the saved image.
+            - **Output**: Where the image can be fetched (unless images are disabled), plus data insights.
 
             **Example Usage:**
             ```python
@@ -282,10 +340,10 @@ histogram_tool_definition = {
         'description': (
             """
             Creates a histogram. If the user, doesn't specify, shows the distribution of procurement announcement dates over the months.
-            Uses data queried from 'intermediary_table' in 'intermediary.db'.
+            Uses data queried from 'intermediary_table' of the current session.
             
             - **Inputs**: SQL query, x-axis column, chart title, x label, y label, image filename, optional image directory, and number of bins.
-            - **Output**: Path to the saved image.
+            - **Output**: Where the image can be fetched (unless images are disabled), plus data insights.
 
             **Example Usage:**
             ```python
@@ -0,0 +1,103 @@
+"""
+One-step package search for the assistant: the concepts of a request are
+expanded into vocabulary keywords by embedding similarity, turned into a
+parameterized filter over data_pengadaan and executed, in place of the
+keyword, schema and SQL round trips the prompt otherwise walks through.
+
+Each concept becomes an OR group of itself and the vocabulary keywords at
+or above the similarity threshold; groups are joined with AND, exclusions
+with AND NOT, and the date range and satuan_kerja filter are bound as
+parameters. On SQLite with the full-text index, keyword groups are
+answered from the index.
+"""
+import datetime
+import pandas as pd
+from analytics_engine import SOURCE_TABLE
+from keyword_fts import keyword_lookup
+
+LIKE_ESCAPE = '\\'
+
+
+def expand_concepts(index, embeddings, concepts: list, threshold: float, top_k: int) -> dict:
+    """{concept: [concept, similar keyword, ...]} from one batched search of the keyword index."""
+    groups = {}
+    for concept, matches in zip(concepts, index.search_many(embeddings, top_k)):
+        terms = [concept.strip().lower()] + [keyword for keyword, similarity in matches if similarity >= threshold]
+        groups[concept] = list(dict.fromkeys(term for term in terms if term))
+    return groups
+
+
+def _like_pattern(term: str) -> str:
+    # The term is matched literally, wildcards included
+    for character in (LIKE_ESCAPE, '%', '_'):
+        term = term.replace(character, LIKE_ESCAPE + character)
+    return f'%{term}%'
+
+
+def _keyword_filter(terms: list, fts: bool):
+    lookup = keyword_lookup(terms) if fts else None
+    if lookup is not None:
+        return lookup[0], [lookup[1]]
+    like = f"filtered_keywords LIKE ? ESCAPE '{LIKE_ESCAPE}'"
+    return '(' + ' OR '.join(like for _ in terms) + ')', [_like_pattern(term) for term in terms]
+
+
+def _date(value, name: str) -> datetime.date:
+    try:
+        return datetime.date.fromisoformat(str(value).strip()[:10])
+    except ValueError:
+        raise ValueError(f"{name} must be a date written as YYYY-MM-DD, got '{value}'") from None
+
+
+def build_search_query(groups: list, exclusions: list = None, date_from: str = None, date_to: str = None,
+                       satuan_kerja: str = None, fts: bool = False):
+    """(sql, params) selecting the packages that match every keyword group and none of the exclusions."""
+    conditions, params = [], []
+    for terms in groups:
+        sql, values = _keyword_filter(terms, fts)
+        conditions.append(sql)
+        params += values
+
+    exclusions = [term.strip().lower() for term in exclusions or [] if term and term.strip()]
+    if exclusions:
+        sql, values = _keyword_filter(exclusions, fts)
+        # As with NOT ... LIKE, packages without keywords are not returned; the
+        # index lookup alone would let them through
+        conditions.append(f'(filtered_keywords IS NOT NULL AND NOT {sql})')
+        params += values
+
+    if date_from:
+        conditions.append('tanggal_umumkan_paket >= ?')
+        params.append(_date(date_from, 'date_from').isoformat())
+    if date_to:
+        # Up to the end of the last day, whatever the time of announcement
+        conditions.append('tanggal_umumkan_paket < ?')
+        params.append((_date(date_to, 'date_to') + datetime.timedelta(days=1)).isoformat())
+    if satuan_kerja and satuan_kerja.strip():
+        conditions.append(f"LOWER(satuan_kerja) LIKE ? ESCAPE '{LIKE_ESCAPE}'")
+        params.append(_like_pattern(satuan_kerja.strip().lower()))
+
+    if not conditions:
+        raise ValueError("Give at least one concept, exclusion, date or satuan_kerja to search by")
+    return f"SELECT * FROM {SOURCE_TABLE} WHERE " + ' AND '.join(conditions), params
+
+
+def summarize(df: pd.DataFrame, sample_rows: int = 5, top_units: int = 5) -> dict:
+    """Row count, budget, announcement dates and the largest work units of a search result."""
+    summary = {'rows': len(df)}
+    if len(df) and 'total_pagu' in df.columns:
+        pagu = pd.to_numeric(df['total_pagu'], errors='coerce')
+        summary['total_pagu'] = float(pagu.sum())
+        if 'satuan_kerja' in df.columns:
+            units = pagu.groupby(df['satuan_kerja']).agg(['size', 'sum']).sort_values('sum', ascending=False)
+            summary['top_satuan_kerja'] = [
+                {'satuan_kerja': name, 'packages': int(row['size']), 'total_pagu': float(row['sum'])}
+                for name, row in units.head(top_units).iterrows()
+            ]
+    if len(df) and 'tanggal_umumkan_paket' in df.columns:
+        dates = df['tanggal_umumkan_paket'].dropna()
+        if len(dates):
+            summary['tanggal_umumkan_paket'] = {'first': str(dates.min()), 'last': str(dates.max())}
+    summary['schema'] = {'columns': list(df.columns)}
+    summary['first_rows'] = df.head(sample_rows).to_dict(orient='records')
+    return summary
@@ -0,0 +1,238 @@
+"""
+Loads a SiRUP delta (new and changed packages) into data_pengadaan.
+
+    python ingest.py delta.csv                 # or .jsonl / .parquet
+    python ingest.py delta.jsonl --no-vocabulary
+
+Rows are upserted by kode_rup in batched transactions; packages whose
+columns are all unchanged are left alone, and columns the delta does not
+carry keep their stored values. filtered_keywords is derived from the
+package text on worker processes for rows that do not bring their own,
+when the delta carries that text. Keywords the vocabulary has not seen yet are embedded in
+batched requests and appended to the keyword index, whose saved IVF index
+and compact copy are extended rather than rebuilt; running servers reload
+the vocabulary once its version marker is written. The unique kode_rup
+index and the full-text index (through its triggers) are maintained by
+SQLite as rows are written; the Parquet snapshot of the duckdb engine is
+rebuilt on its next start, since it is older than the database.
+"""
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import config
+import db
+import keyword_index
+from analytics_engine import SOURCE_TABLE, SQLITE_TIMESTAMP_FORMAT
+
+COLUMNS = [
+    'kode_rup', 'nama_paket', 'nama_klpd', 'satuan_kerja', 'uraian_pekerjaan',
+    'spesifikasi_pekerjaan', 'total_pagu', 'tanggal_umumkan_paket', 'filtered_keywords'
+]
+TEXT_COLUMNS = ['nama_paket', 'uraian_pekerjaan', 'spesifikasi_pekerjaan']
+KEY_INDEX = f'{SOURCE_TABLE}_kode_rup'
+
+# Quantities keep their unit as one keyword, e.g. '20 mbps'
+UNITS = ('mbps', 'gbps', 'kbps', 'gb', 'tb', 'mb', 'kg', 'ton', 'm2', 'm3', 'cm', 'mm', 'km',
+         'kva', 'kw', 'kwh', 'watt', 'pk', 'inch', 'liter', 'lt', 'gram', 'ml', 'mg')
+_TERM = re.compile(r'(\d+(?:[.,]\d+)?)\s*(' + '|'.join(UNITS) + r')\b|([a-z][a-z\-]*[a-z])')
+
+STOPWORDS = frozenset("""
+    adalah akan atas atau bagi bahwa bagian baik banyak beberapa belum berupa bisa dalam dan dapat
+    dari dengan di hal hanya harus hingga ini itu jika juga kami ke kepada lain lainnya
+    lebih maka masing melalui menjadi menurut merupakan nya oleh pada para per sampai satu secara
+    sebagai sebelum sedang sehingga sekitar selama semua serta setiap sudah tahun tanggal tentang
+    terhadap termasuk tersebut untuk yaitu yang
+""".split())
+
+
+def upsert_statement(columns: list) -> str:
+    """
+    INSERT ... ON CONFLICT for the columns a delta carries; stored values of
+    the other columns are left as they are.
+    """
+    updated = [c for c in columns if c != 'kode_rup']
+    statement = (
+        f"INSERT INTO {SOURCE_TABLE} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+        f"ON CONFLICT(kode_rup) DO "
+    )
+    if not updated:
+        return statement + "NOTHING"
+    return statement + (
+        f"UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in updated)} "
+        f"WHERE {' OR '.join(f'{SOURCE_TABLE}.{c} IS NOT excluded.{c}' for c in updated)}"
+    )
+
+
+def derive_keywords(*texts) -> str:
+    """
+    filtered_keywords for one package: lowercased words of its name and
+    descriptions in order of appearance, without stopwords, numbers or
+    duplicates, joined by commas.
+    """
+    keywords = {}
+    for text in texts:
+        if not isinstance(text, str):
+            continue
+        for match in _TERM.finditer(text.lower()):
+            if match.group(3):
+                term = match.group(3)
+                if len(term) < 3 or term in STOPWORDS:
+                    continue
+            else:
+                term = f"{match.group(1)} {match.group(2)}"
+            keywords.setdefault(term, None)
+    return ','.join(keywords)
+
+
+def _derive_chunk(rows: list) -> list:
+    return [derive_keywords(*texts) for texts in rows]
+
+
+def read_delta(path: str, chunk_rows: int):
+    """DataFrames of up to chunk_rows packages from a CSV, JSON Lines or Parquet file."""
+    if path.endswith('.parquet'):
+        df = pd.read_parquet(path)
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+    elif path.endswith(('.jsonl', '.ndjson', '.json')):
+        yield from pd.read_json(path, lines=True, chunksize=chunk_rows, dtype=False)
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows, dtype={'kode_rup': 'Int64'})
+
+
+def prepare(df: pd.DataFrame, pool, workers: int) -> pd.DataFrame:
+    """
+    The delta's columns in table order with SQLite's timestamp format.
+    Missing filtered_keywords are derived only when the delta carries all
+    of TEXT_COLUMNS; a partial delta cannot say what the package is about.
+    """
+    if 'kode_rup' not in df.columns:
+        raise ValueError("The delta has no kode_rup column")
+    derivable = all(c in df.columns for c in TEXT_COLUMNS)
+    columns = [c for c in COLUMNS if c in df.columns or (c == 'filtered_keywords' and derivable)]
+    df = df.reindex(columns=columns).copy()
+    df = df[df['kode_rup'].notna()]
+    df['kode_rup'] = df['kode_rup'].astype('int64')
+    if 'tanggal_umumkan_paket' in df.columns:
+        # Deltas mix date-only and full timestamps
+        df['tanggal_umumkan_paket'] = pd.to_datetime(df['tanggal_umumkan_paket'], errors='coerce', format='mixed') \
+            .dt.strftime(SQLITE_TIMESTAMP_FORMAT)
+    # The last occurrence of a package in the delta wins
+    df = df.drop_duplicates('kode_rup', keep='last')
+
+    if derivable:
+        df['filtered_keywords'] = df['filtered_keywords'].astype(object)
+        missing = df['filtered_keywords'].isna() | (df['filtered_keywords'].astype(str).str.strip() == '')
+        if missing.any():
+            texts = list(df.loc[missing, TEXT_COLUMNS].itertuples(index=False, name=None))
+            size = max(1, -(-len(texts) // (workers * 4)))
+            chunks = [texts[i:i + size] for i in range(0, len(texts), size)]
+            derived = [keywords for chunk in pool.map(_derive_chunk, chunks) for keywords in chunk]
+            df.loc[missing, 'filtered_keywords'] = derived
+    return df.astype(object).where(df.notna(), None)
+
+
+def ensure_key_index(conn):
+    """The unique index ON CONFLICT(kode_rup) needs; fails if the table already has duplicate codes."""
+    with conn:
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {KEY_INDEX} ON {SOURCE_TABLE}(kode_rup)")
+
+
+def upsert(conn, df: pd.DataFrame, batch_rows: int) -> dict:
+    """Writes the rows in transactions of batch_rows; returns counts of inserted, updated and unchanged rows."""
+    counts = {'inserted': 0, 'updated': 0, 'unchanged': 0}
+    columns = list(df.columns)
+    statement = upsert_statement(columns)
+    rows = list(df.itertuples(index=False, name=None))
+    for start in range(0, len(rows), batch_rows):
+        batch = rows[start:start + batch_rows]
+        codes = [row[0] for row in batch]
+        with conn:
+            existing = {}
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(codes), 900):
+                part = codes[i:i + 900]
+                existing.update((row[0], row) for row in conn.execute(
+                    f"SELECT {', '.join(columns)} FROM {SOURCE_TABLE} "
+                    f"WHERE kode_rup IN ({', '.join('?' for _ in part)})", part
+                ))
+            conn.executemany(statement, batch)
+        for row in batch:
+            current = existing.get(row[0])
+            if current is None:
+                counts['inserted'] += 1
+            elif current != row:
+                counts['updated'] += 1
+            else:
+                counts['unchanged'] += 1
+    return counts
+
+
+def new_keywords(frames_keywords, known) -> list:
+    """Keywords in the ingested rows that the vocabulary does not have, in order of first appearance."""
+    seen = {}
+    for value in frames_keywords:
+        if not value:
+            continue
+        for keyword in str(value).split(','):
+            keyword = keyword.strip()
+            if keyword and keyword not in known:
+                seen.setdefault(keyword, None)
+    return list(seen)
+
+
+def extend_vocabulary(keywords: list, batch_size: int = None) -> int:
+    """Embeds the keywords in batched requests and appends them to the keyword index."""
+    if not keywords:
+        return 0
+    from list_of_tools import get_embeddings
+    embeddings = get_embeddings(keywords, batch_size)
+    keyword_index.append_keywords(keywords, embeddings)
+    return len(keywords)
+
+
+def ingest(path: str, db_path: str = None, batch_rows: int = None, workers: int = None,
+           update_vocabulary: bool = True) -> dict:
+    db_path = db_path or config.DATA_DB_PATH
+    batch_rows = batch_rows or config.INGEST_BATCH_ROWS
+    workers = workers or config.INGEST_WORKERS or os.cpu_count() or 1
+    started = time.perf_counter()
+
+    conn = db.connect(db_path, read_only=False)
+    ensure_key_index(conn)
+    known = set(keyword_index.vocabulary()) if update_vocabulary else set()
+    counts = {'rows': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0}
+    pending_keywords = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Several transactions per chunk read; the pool stays busy across chunks
+        for chunk in read_delta(path, batch_rows * 4):
+            df = prepare(chunk, pool, workers)
+            for key, value in upsert(conn, df, batch_rows).items():
+                counts[key] += value
+            counts['rows'] += len(df)
+            if update_vocabulary and 'filtered_keywords' in df.columns:
+                for keyword in new_keywords(df['filtered_keywords'], known):
+                    pending_keywords.setdefault(keyword, None)
+            print(f"{counts['rows']} rows ({counts['inserted']} new, {counts['updated']} updated)")
+
+    counts['new_keywords'] = extend_vocabulary(list(pending_keywords)) if update_vocabulary else 0
+    counts['seconds'] = round(time.perf_counter() - started, 3)
+    return counts
+
+
+if __name__ == '__main__':
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', help='Delta file: .csv, .jsonl or .parquet with data_pengadaan columns.')
+    parser.add_argument('--db', default=config.DATA_DB_PATH)
+    parser.add_argument('--batch-rows', type=int, default=config.INGEST_BATCH_ROWS)
+    parser.add_argument('--workers', type=int, default=config.INGEST_WORKERS)
+    parser.add_argument('--no-vocabulary', action='store_true', help='Do not embed new keywords.')
+    args = parser.parse_args()
+
+    print(json.dumps(ingest(args.path, args.db, args.batch_rows, args.workers, not args.no_vocabulary), indent=2))
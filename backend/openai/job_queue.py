@@ -0,0 +1,109 @@
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, session_id=None):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        # status is read first: it is set last, so a finished status comes with its times and result
+        status = self.status
+        job = {
+            'job_id': self.id,
+            'session_id': self.session_id,
+            'status': status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+        if status == 'done':
+            job['result'] = self.result
+        if status == 'failed':
+            job['error'] = self.error
+        return job
+
+
+class JobQueue:
+    """
+    Bounded background execution for long requests. At most max_workers jobs
+    run at once and at most max_depth are queued or running; beyond that
+    submit raises QueueFull. Finished jobs stay retrievable for ttl_seconds.
+    """
+
+    def __init__(self, max_workers: int = 4, max_depth: int = 32, ttl_seconds: float = 3600):
+        self.max_depth = max_depth
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, session_id=None, on_done=None, **kwargs) -> Job:
+        """Runs fn(*args, **kwargs) in the background; on_done(job) is called when it finishes."""
+        job = Job(session_id)
+        with self._lock:
+            self._prune()
+            if self._pending >= self.max_depth:
+                raise QueueFull(f"Job queue is full ({self.max_depth} jobs queued or running)")
+            self._pending += 1
+            self._jobs[job.id] = job
+
+        def run():
+            job.started_at = time.time()
+            job.status = 'running'
+            result, error, status = None, 'interrupted', 'failed'
+            try:
+                result = fn(*args, **kwargs)
+                error, status = None, 'done'
+            except Exception as e:
+                error, status = str(e), 'failed'
+            finally:
+                # finished_at and the result before the status, all under the lock
+                # the TTL sweep and stats take, so no reader sees a half-finished job
+                with self._lock:
+                    job.finished_at = time.time()
+                    job.result, job.error = result, error
+                    job.status = status
+                    self._pending -= 1
+            if on_done:
+                try:
+                    on_done(job)
+                except Exception as e:
+                    print(f"Error in job callback: {e}")
+
+        self._executor.submit(run)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _prune(self):
+        # Caller holds self._lock
+        cutoff = time.time() - self.ttl_seconds
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = [j.status for j in self._jobs.values()]
+            return {
+                'pending': self._pending,
+                'queued': statuses.count('queued'),
+                'running': statuses.count('running'),
+                'max_depth': self.max_depth,
+            }
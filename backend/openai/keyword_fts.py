@@ -0,0 +1,173 @@
+import re
+import sqlite3
+import db
+import config
+
+SOURCE_TABLE = 'data_pengadaan'
+FTS_TABLE = 'data_pengadaan_fts'
+
+# Trigram tokens make MATCH '"gedung"' a case-insensitive substring search,
+# i.e. the same rows as filtered_keywords LIKE '%gedung%', but answered from an
+# inverted index instead of a full table scan. The table is external-content,
+# so the keyword text itself is not stored twice.
+CREATE_FTS = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+    filtered_keywords,
+    content='{SOURCE_TABLE}',
+    content_rowid='rowid',
+    tokenize='trigram'
+)
+"""
+
+# Keep the index in sync with every write to data_pengadaan
+CREATE_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {SOURCE_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, filtered_keywords) VALUES (new.rowid, new.filtered_keywords);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {SOURCE_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, filtered_keywords) VALUES ('delete', old.rowid, old.filtered_keywords);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF filtered_keywords ON {SOURCE_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, filtered_keywords) VALUES ('delete', old.rowid, old.filtered_keywords);
+        INSERT INTO {FTS_TABLE}(rowid, filtered_keywords) VALUES (new.rowid, new.filtered_keywords);
+    END
+    """,
+]
+
+# Trigram search needs at least three characters; shorter terms and terms with
+# LIKE wildcards inside are left as plain LIKE.
+_LIKE_ATOM = re.compile(
+    r"(?:\b\w+\.)?\bfiltered_keywords\s+(NOT\s+)?LIKE\s+'%([^'%_]{3,})%'",
+    re.IGNORECASE
+)
+_PLACEHOLDER = r'__fts_(\d+)__'
+_OR_GROUP = re.compile(r'\(\s*' + _PLACEHOLDER + r'(?:\s+OR\s+' + _PLACEHOLDER + r')*\s*\)', re.IGNORECASE)
+_AND_GROUP = re.compile(r'\(\s*' + _PLACEHOLDER + r'(?:\s+AND\s+' + _PLACEHOLDER + r')*\s*\)', re.IGNORECASE)
+_SINGLE_TABLE = re.compile(r'\bFROM\s+' + SOURCE_TABLE + r'\b(?!\s*,)', re.IGNORECASE)
+
+
+def create_keyword_fts(conn: sqlite3.Connection, rebuild: bool = True):
+    """Creates the FTS table and its sync triggers, then indexes existing rows."""
+    with conn:
+        conn.execute(CREATE_FTS)
+        for trigger in CREATE_TRIGGERS:
+            conn.execute(trigger)
+        if rebuild:
+            conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def rebuild_keyword_fts(conn: sqlite3.Connection):
+    # Needed after VACUUM: data_pengadaan has no INTEGER PRIMARY KEY, so rowids may change
+    with conn:
+        conn.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def has_keyword_fts(conn: sqlite3.Connection) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+    ).fetchone()
+    return row is not None
+
+
+def _phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def keyword_lookup(terms: list):
+    """
+    A parameterized filter for rows whose filtered_keywords contain any of
+    the terms, answered from the full-text index: (sql, parameter), or None
+    when a term is too short for trigram search.
+    """
+    if not terms or any(len(term) < 3 for term in terms):
+        return None
+    return (
+        f"rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ?)",
+        ' OR '.join(_phrase(term) for term in terms)
+    )
+
+
+def rewrite_keyword_filters(query: str) -> str:
+    """
+    Rewrites `filtered_keywords LIKE '%x%'` boolean chains into FTS lookups.
+
+    Parenthesised groups made only of LIKE terms joined by OR (or only by
+    AND) collapse into one MATCH expression, so the prompt's usual
+    `(a OR b OR c) AND (d OR e) AND NOT (f OR g)` becomes three indexed
+    rowid lookups. Negated lookups keep LIKE's NULL semantics, so rows
+    without keywords are excluded from both sides of a NOT as before.
+    Everything else in the statement is left untouched.
+    """
+    if not _SINGLE_TABLE.search(query) or re.search(r'\bJOIN\b', query, re.IGNORECASE):
+        return query
+
+    expressions = []
+    negated = set()
+
+    def atom(match):
+        expressions.append(_phrase(match.group(2)))
+        if match.group(1):
+            negated.add(len(expressions) - 1)
+        return f'__fts_{len(expressions) - 1}__'
+
+    rewritten = _LIKE_ATOM.sub(atom, query)
+    if not expressions:
+        return query
+
+    def merge(operator):
+        def replace(match):
+            ids = [int(i) for i in re.findall(_PLACEHOLDER, match.group(0))]
+            if any(i in negated for i in ids):
+                return match.group(0)
+            expressions.append('(' + f' {operator} '.join(expressions[i] for i in ids) + ')')
+            return f'__fts_{len(expressions) - 1}__'
+        return replace
+
+    # Merge innermost groups first and repeat until nothing changes
+    while True:
+        merged = _OR_GROUP.sub(merge('OR'), rewritten)
+        merged = _AND_GROUP.sub(merge('AND'), merged)
+        if merged == rewritten:
+            break
+        rewritten = merged
+
+    # A NOT in front of a lookup is taken into it: rows without keywords are in
+    # no lookup, but NOT filtered_keywords LIKE ... is NULL for them, not true.
+    # Any other NOT over a parenthesised expression could hide a lookup, so
+    # such statements are left as written.
+    negations = re.compile(r'\b(NOT\s+)?' + _PLACEHOLDER, re.IGNORECASE)
+    if re.search(r'\bNOT\s*\(', negations.sub('', rewritten), re.IGNORECASE):
+        return query
+
+    def emit(match):
+        i = int(match.group(2))
+        lookup = (
+            f"rowid IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH "
+            f"'{expressions[i].replace(chr(39), chr(39) * 2)}')"
+        )
+        if bool(match.group(1)) != (i in negated):
+            return f'(filtered_keywords IS NOT NULL AND NOT {lookup})'
+        return lookup
+
+    return negations.sub(emit, rewritten)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Create or rebuild the filtered_keywords full-text index.")
+    parser.add_argument('--db', default=config.DATA_DB_PATH)
+    parser.add_argument('--rebuild', action='store_true', help='Re-index all rows of an existing index.')
+    args = parser.parse_args()
+
+    conn = db.connect(args.db, read_only=False)
+    if args.rebuild and has_keyword_fts(conn):
+        rebuild_keyword_fts(conn)
+    else:
+        create_keyword_fts(conn)
+    print(f"Keyword index {FTS_TABLE} is ready in {args.db}")
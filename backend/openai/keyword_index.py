@@ -0,0 +1,411 @@
+import os
+import json
+import hashlib
+import itertools
+import threading
+import numpy as np
+import pandas as pd
+import config
+
+CSV_PATH = 'v2_key.csv'
+MATRIX_PATH = 'v2_key.npy'
+KEYWORDS_PATH = 'v2_key.keywords.json'
+VERSION_PATH = 'v2_key.version.json'
+
+
+def vocabulary_fingerprint(keywords: list) -> str:
+    """Identifies a keyword list, so files built for another vocabulary are not reused."""
+    return hashlib.sha256('\n'.join(keywords).encode('utf-8')).hexdigest()
+
+
+def version_path(matrix_path: str = MATRIX_PATH) -> str:
+    """The version marker of a matrix file, e.g. v2_key.version.json for v2_key.npy."""
+    base = matrix_path[:-len('.npy')] if matrix_path.endswith('.npy') else matrix_path
+    return base + '.version.json'
+
+
+def write_version(keywords: list, matrix_path: str = MATRIX_PATH):
+    """
+    Commits a vocabulary write. The marker is replaced last, after the
+    matrix, keyword list and sidecars, and loads only trust the first
+    `rows` entries of each; an interrupted write therefore leaves the
+    previous vocabulary readable, or is detected by the fingerprint.
+    """
+    path = version_path(matrix_path)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'rows': len(keywords), 'fingerprint': vocabulary_fingerprint(keywords)}, f)
+    os.replace(path + '.tmp', path)
+
+
+class KeywordIndex:
+    """
+    Keyword vocabulary held as one contiguous float32 matrix whose rows are
+    L2-normalized, so cosine similarity is a single matrix-vector product.
+
+    The matrix is stored as a .npy file next to a JSON keyword list and is
+    memory-mapped on load, so worker processes share the same pages. With
+    an `ann` index attached (see ann_index.py), search scores only the rows
+    it selects instead of all of them; with a `quantized` copy (see
+    quantization.py), it scans that copy and reads only the float32 rows of
+    the candidates it rescores.
+    """
+
+    def __init__(self, keywords: list, matrix: np.ndarray, ann=None, quantized=None):
+        if len(keywords) != matrix.shape[0]:
+            raise ValueError(f"{len(keywords)} keywords but {matrix.shape[0]} embedding rows")
+        self.keywords = keywords
+        self.matrix = matrix
+        self.ann = ann
+        self.quantized = quantized
+
+    def __len__(self):
+        return len(self.keywords)
+
+    @property
+    def dim(self) -> int:
+        return self.matrix.shape[1]
+
+    @classmethod
+    def from_csv(cls, csv_path: str = CSV_PATH) -> 'KeywordIndex':
+        # Same input as the original tool: 'keyword' plus a '[...]' embedding string
+        df = pd.read_csv(csv_path)
+        matrix = np.vstack([
+            np.fromstring(x.strip('[]'), sep=',', dtype=np.float32)
+            for x in df['embedding']
+        ])
+        return cls(df['keyword'].astype(str).tolist(), normalize_rows(matrix))
+
+    @classmethod
+    def load(cls, matrix_path: str = MATRIX_PATH, keywords_path: str = KEYWORDS_PATH,
+             mmap: bool = True) -> 'KeywordIndex':
+        """
+        Loads the vocabulary as of its version marker: rows appended after
+        the marker was written are ignored until the next one commits them.
+        Raises ValueError when the files do not match their marker.
+        """
+        matrix = np.load(matrix_path, mmap_mode='r' if mmap else None)
+        with open(keywords_path, encoding='utf-8') as f:
+            keywords = json.load(f)
+        if os.path.exists(version_path(matrix_path)):
+            with open(version_path(matrix_path), encoding='utf-8') as f:
+                version = json.load(f)
+            rows = version['rows']
+            if matrix.shape[0] < rows or len(keywords) < rows \
+                    or vocabulary_fingerprint(keywords[:rows]) != version['fingerprint']:
+                raise ValueError(f"{matrix_path} and {keywords_path} do not match {version_path(matrix_path)}")
+            matrix, keywords = matrix[:rows], keywords[:rows]
+        return cls(keywords, matrix)
+
+    def save(self, matrix_path: str = MATRIX_PATH, keywords_path: str = KEYWORDS_PATH):
+        # Write to temp files first so a concurrent load never sees half a matrix
+        np.save(matrix_path + '.tmp.npy', np.ascontiguousarray(self.matrix, dtype=np.float32))
+        with open(keywords_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.keywords, f, ensure_ascii=False)
+        os.replace(matrix_path + '.tmp.npy', matrix_path)
+        os.replace(keywords_path + '.tmp', keywords_path)
+        write_version(self.keywords, matrix_path)
+
+    def search(self, query_embedding, top_k: int = 10) -> list:
+        """Returns [(keyword, similarity), ...] sorted by descending similarity."""
+        return self.search_many([np.asarray(query_embedding, dtype=np.float32).ravel()], top_k)[0]
+
+    def search_many(self, query_embeddings, top_k: int = 10) -> list:
+        """
+        search() for several queries at once: one list of (keyword,
+        similarity) per query. The exhaustive search scores every query in
+        a single matrix product.
+        """
+        queries = normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+
+        if self.ann is not None:
+            results = [self.ann.search(self.matrix, query, top_k) for query in queries]
+        elif self.quantized is not None:
+            results = self.quantized.search_many(self.matrix, queries, top_k)
+        else:
+            results = []
+            for row in queries @ self.matrix.T:
+                top = top_k_indices(row, top_k)
+                results.append((top, row[top]))
+        return [[(self.keywords[i], float(score)) for i, score in zip(top, scores)] for top, scores in results]
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    # argpartition is O(n); only the k winners get fully sorted
+    top_k = max(0, min(top_k, scores.shape[0]))
+    if top_k == 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < scores.shape[0]:
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(scores.shape[0])
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def build_index(csv_path: str = CSV_PATH, matrix_path: str = MATRIX_PATH,
+                keywords_path: str = KEYWORDS_PATH) -> KeywordIndex:
+    index = KeywordIndex.from_csv(csv_path)
+    index.save(matrix_path, keywords_path)
+    return index
+
+
+def _is_stale(csv_path, matrix_path, keywords_path) -> bool:
+    if not (os.path.exists(matrix_path) and os.path.exists(keywords_path)):
+        return True
+    if not os.path.exists(csv_path):
+        return False
+    return os.path.getmtime(csv_path) > os.path.getmtime(matrix_path)
+
+
+def vocabulary(csv_path: str = CSV_PATH, matrix_path: str = MATRIX_PATH,
+               keywords_path: str = KEYWORDS_PATH) -> list:
+    """Keywords currently in the vocabulary, without loading their embeddings."""
+    if not _is_stale(csv_path, matrix_path, keywords_path):
+        with open(keywords_path, encoding='utf-8') as f:
+            return json.load(f)
+    if os.path.exists(csv_path):
+        return pd.read_csv(csv_path, usecols=['keyword'])['keyword'].astype(str).tolist()
+    return []
+
+
+def _embedding_literal(vector) -> str:
+    return '[' + ', '.join(f'{x:.8f}' for x in vector) + ']'
+
+
+def matrix_chunks(matrix: np.ndarray, chunk_rows: int = 65536):
+    for start in range(0, matrix.shape[0], chunk_rows):
+        yield matrix[start:start + chunk_rows]
+
+
+def write_index(keywords: list, parts, dim: int, matrix_path: str = MATRIX_PATH,
+                keywords_path: str = KEYWORDS_PATH):
+    """
+    Writes the binary index from an iterable of normalized row blocks, one
+    block at a time, so the whole matrix is never held in memory at once.
+    Loads keep seeing the previous vocabulary until write_version commits
+    this one.
+    """
+    matrix = np.lib.format.open_memmap(matrix_path + '.tmp.npy', mode='w+', dtype=np.float32,
+                                       shape=(len(keywords), dim))
+    written = 0
+    for part in parts:
+        matrix[written:written + part.shape[0]] = part
+        written += part.shape[0]
+    if written != len(keywords):
+        raise ValueError(f"{len(keywords)} keywords but {written} embedding rows")
+    matrix.flush()
+    del matrix
+    with open(keywords_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(keywords, f, ensure_ascii=False)
+    # The matrix is replaced last, so it stays newer than the CSV it now matches
+    os.replace(keywords_path + '.tmp', keywords_path)
+    os.replace(matrix_path + '.tmp.npy', matrix_path)
+
+
+def append_csv(keywords: list, rows: np.ndarray, csv_path: str = CSV_PATH):
+    """Appends keywords and their rows to a CSV in the layout of v2_key.csv, keeping its columns."""
+    columns = pd.read_csv(csv_path, nrows=0).columns
+    appended = pd.DataFrame({'keyword': keywords, 'embedding': [_embedding_literal(row) for row in rows]})
+    appended.reindex(columns=columns).to_csv(csv_path, mode='a', header=False, index=False)
+
+
+def append_keywords(keywords: list, embeddings, csv_path: str = CSV_PATH, matrix_path: str = MATRIX_PATH,
+                    keywords_path: str = KEYWORDS_PATH):
+    """
+    Adds keywords to the vocabulary without rebuilding it. The rows are
+    appended to the CSV (when there is one), and the binary index is
+    rewritten as the existing rows, copied in chunks, followed by the new
+    normalized rows, so the CSV is never re-parsed. The saved IVF index
+    and compact copy are extended with the new rows, and the version marker
+    written last makes running servers reload the vocabulary.
+    """
+    rows = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    if len(keywords) != rows.shape[0]:
+        raise ValueError(f"{len(keywords)} keywords but {rows.shape[0]} embedding rows")
+    if not keywords:
+        return
+    if csv_path and _is_stale(csv_path, matrix_path, keywords_path) and os.path.exists(csv_path):
+        build_index(csv_path, matrix_path, keywords_path)
+
+    if csv_path and os.path.exists(csv_path):
+        append_csv(keywords, rows, csv_path)
+
+    old_keywords, old_parts = [], []
+    if os.path.exists(matrix_path):
+        existing = KeywordIndex.load(matrix_path, keywords_path)
+        if existing.dim != rows.shape[1]:
+            raise ValueError(f"Vocabulary has {existing.dim} dims, new embeddings have {rows.shape[1]}")
+        old_keywords, old_parts = existing.keywords, matrix_chunks(existing.matrix)
+    all_keywords = old_keywords + list(keywords)
+    write_index(all_keywords, itertools.chain(old_parts, [rows]), rows.shape[1], matrix_path, keywords_path)
+    update_sidecars(KeywordIndex(all_keywords, np.load(matrix_path, mmap_mode='r')), matrix_path)
+    write_version(all_keywords, matrix_path)
+
+
+def update_sidecars(index: KeywordIndex, matrix_path: str = MATRIX_PATH):
+    """
+    Brings the saved IVF index and compact copy of the configured search
+    up to date with the vocabulary, extending them with its appended rows
+    (see load_ivf, load_quantized). Sidecars that do not exist yet are left
+    for the server to build.
+    """
+    from ann_index import ivf_path
+    from quantization import storage_path
+
+    path = ivf_path(matrix_path)
+    if config.KEYWORD_ANN == 'ivf' and os.path.exists(path):
+        load_ivf(index, path)
+    path = storage_path(config.KEYWORD_STORAGE, config.KEYWORD_STORAGE_DIMS, matrix_path)
+    if config.KEYWORD_ANN == 'exact' and (config.KEYWORD_STORAGE != 'float32' or config.KEYWORD_STORAGE_DIMS) \
+            and os.path.exists(path):
+        load_quantized(index, path)
+
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+_NO_VERSION = (0, 0)
+
+
+def _version_signature():
+    try:
+        stat = os.stat(version_path(MATRIX_PATH))
+    except FileNotFoundError:
+        return _NO_VERSION
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _load_index() -> KeywordIndex:
+    if config.KEYWORD_ANN not in ('exact', 'ivf'):
+        raise ValueError(f"Unknown SIRUPA_KEYWORD_ANN '{config.KEYWORD_ANN}', expected exact or ivf")
+    if config.KEYWORD_ANN == 'ivf' and (config.KEYWORD_STORAGE != 'float32' or config.KEYWORD_STORAGE_DIMS):
+        # IVF scores its probed rows in float32, so a compact copy would only take up memory
+        raise ValueError("SIRUPA_KEYWORD_STORAGE and SIRUPA_KEYWORD_STORAGE_DIMS apply to exact search only; "
+                         "unset them or set SIRUPA_KEYWORD_ANN=exact")
+    if _is_stale(CSV_PATH, MATRIX_PATH, KEYWORDS_PATH):
+        print(f"Building keyword index from {CSV_PATH}")
+        build_index()
+    try:
+        index = KeywordIndex.load()
+    except ValueError as e:
+        # An interrupted full rebuild; the CSV is still complete
+        if not os.path.exists(CSV_PATH):
+            raise
+        print(f"{e}; rebuilding keyword index from {CSV_PATH}")
+        build_index()
+        index = KeywordIndex.load()
+    if config.KEYWORD_ANN == 'ivf':
+        index.ann = load_ivf(index)
+    elif config.KEYWORD_STORAGE != 'float32' or config.KEYWORD_STORAGE_DIMS:
+        index.quantized = load_quantized(index)
+    return index
+
+
+def get_keyword_index() -> KeywordIndex:
+    """
+    Process-wide index, loaded once and again whenever the vocabulary's
+    version marker changes (ingest.py or vocabulary_builder.py committed new
+    keywords), so a running server sees them without a restart. Searches
+    already under way finish on the index they started with. The binary
+    matrix is (re)built from the CSV only when it is missing or older than
+    the CSV.
+    """
+    global _index, _index_version
+    version = _version_signature()
+    # An index set from outside (benchmarks) has no version and is kept
+    if _index is None or (_index_version is not None and version != _index_version):
+        with _index_lock:
+            if _index is None or (_index_version is not None and version != _index_version):
+                if _index is not None:
+                    print("Keyword vocabulary changed; reloading the keyword index")
+                _index = _load_index()
+                _index_version = version
+    return _index
+
+
+def load_ivf(index: KeywordIndex, path: str = None):
+    """
+    The saved IVF index for this vocabulary. Keywords appended since it was
+    saved are assigned to its lists and the file is saved again; it is
+    retrained from scratch when it is missing, belongs to another
+    vocabulary, or the vocabulary grew by more than MAX_TAIL since its
+    centroids were trained.
+    """
+    from ann_index import IVFIndex, IVF_PATH
+
+    path = path or IVF_PATH
+    ahead = False
+    if os.path.exists(path):
+        ivf = IVFIndex.load(path, config.KEYWORD_IVF_NPROBE)
+        ahead = ivf.count > len(index)
+        if ivf.matches(index.keywords) and len(index) - ivf.trained <= config.KEYWORD_IVF_MAX_TAIL * ivf.trained:
+            if ivf.count == len(index):
+                return ivf
+            print(f"Adding {len(index) - ivf.count} keywords to the IVF index")
+            ivf = ivf.extend(index.matrix, index.keywords)
+            ivf.save(path)
+            return ivf
+    print(f"Building IVF index for {len(index)} keywords")
+    ivf = IVFIndex.build(index.matrix, config.KEYWORD_IVF_NLIST or None, nprobe=config.KEYWORD_IVF_NPROBE,
+                         keywords=index.keywords)
+    # A file with more rows than this vocabulary was written by a newer one; leave it be
+    if not ahead:
+        ivf.save(path)
+    return ivf
+
+
+def load_quantized(index: KeywordIndex, path: str = None):
+    """
+    The saved compact copy of this vocabulary in the configured storage.
+    Keywords appended since it was saved are quantized with its existing
+    scales or codebooks and the file is saved again; it is rebuilt when it
+    is missing or was built for other keywords.
+    """
+    from quantization import QuantizedMatrix, storage_path
+
+    path = path or storage_path(config.KEYWORD_STORAGE, config.KEYWORD_STORAGE_DIMS)
+    ahead = False
+    if os.path.exists(path):
+        quantized = QuantizedMatrix.load(path, config.KEYWORD_RESCORE_FACTOR)
+        ahead = quantized.count > len(index)
+        if quantized.matches(index.keywords):
+            if quantized.count == len(index):
+                return quantized
+            print(f"Quantizing {len(index) - quantized.count} appended keywords to {quantized.storage}")
+            quantized = quantized.extend(index.matrix, index.keywords)
+            quantized.save(path)
+            return QuantizedMatrix.load(path, config.KEYWORD_RESCORE_FACTOR)
+    print(f"Quantizing {len(index)} keywords to {config.KEYWORD_STORAGE}")
+    quantized = QuantizedMatrix.build(index.matrix, config.KEYWORD_STORAGE, config.KEYWORD_STORAGE_DIMS,
+                                      config.KEYWORD_PQ_SUBSPACES, keywords=index.keywords,
+                                      rescore=config.KEYWORD_RESCORE_FACTOR)
+    if ahead:
+        return quantized
+    quantized.save(path)
+    # Searched from the saved file, so worker processes share its pages
+    return QuantizedMatrix.load(path, config.KEYWORD_RESCORE_FACTOR)
+
+
+def reset_keyword_index():
+    global _index, _index_version
+    with _index_lock:
+        _index = None
+        _index_version = None
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Convert the keyword embedding CSV into the binary index.")
+    parser.add_argument('--csv', default=CSV_PATH)
+    parser.add_argument('--matrix', default=MATRIX_PATH)
+    parser.add_argument('--keywords', default=KEYWORDS_PATH)
+    args = parser.parse_args()
+
+    index = build_index(args.csv, args.matrix, args.keywords)
+    print(f"Wrote {len(index)} keywords x {index.dim} dims to {args.matrix}")
@@ -4,50 +4,101 @@ import sqlite3
 import json
 import base64
 from openai import OpenAI
-from sklearn.metrics.pairwise import cosine_similarity
 from sqlalchemy import create_engine, inspect
 import api_keys
+import config
+import db
+from embedding_cache import EmbeddingCache, normalize_text
+from keyword_index import get_keyword_index
+from keyword_fts import has_keyword_fts
+from analytics_engine import get_engine
+from fused_search import expand_concepts, build_search_query, summarize
+from query_cache import query_cache
+from result_store import result_store
+from chart_render import chart_renderer, histogram_values
+from metrics import span
 import warnings
 
 warnings.filterwarnings("ignore", category=UserWarning, module="matplotlib.projections")
 client = OpenAI(api_key=api_keys.openai_key)
-def get_embedding(text):
-    response = client.embeddings.create(
-        input=text,
-        model="text-embedding-3-large" 
-    )
+embedding_cache = EmbeddingCache(
+    config.EMBEDDING_CACHE_PATH,
+    max_entries=config.EMBEDDING_CACHE_MAX_ENTRIES,
+    max_bytes=config.EMBEDDING_CACHE_MAX_BYTES
+)
+
+def _fetch_embedding(text):
+    with span('embedding.api'):
+        response = client.embeddings.create(
+            input=text,
+            model=config.EMBEDDING_MODEL
+        )
     return response.data[0].embedding
 
-def mini_retrieve_similar_keywords(query: str, top_k: int = 10) -> str:
-    # Load DataFrame from CSV
-    df = pd.read_csv('v2_key.csv')
-
-    # Convert 'embedding' column to numeric vectors
-    df['embedding'] = df['embedding'].apply(lambda x: np.fromstring(x.strip('[]'), sep=','))
+def get_embedding(text):
+    # Served from the LRU / on-disk cache when the normalized text was seen before
+    with span('embedding'):
+        return embedding_cache.get_or_compute(config.EMBEDDING_MODEL, text, _fetch_embedding)
+
+def _fetch_embeddings(texts):
+    with span('embedding.api', batch=len(texts)):
+        response = client.embeddings.create(
+            input=texts,
+            model=config.EMBEDDING_MODEL
+        )
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+def get_embeddings(texts, batch_size=None):
+    """
+    Embeddings for several texts, in input order. Cached ones come from the
+    embedding cache; the rest are fetched with one request per batch.
+    """
+    batch_size = batch_size or config.EMBEDDING_BATCH_SIZE
+    with span('embedding', batch=len(texts)):
+        normalized = [normalize_text(text) for text in texts]
+        vectors = [embedding_cache.get(config.EMBEDDING_MODEL, text) for text in normalized]
+        missing = list(dict.fromkeys(text for text, vector in zip(normalized, vectors) if vector is None))
+        fetched = {}
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            fetched.update(zip(batch, embedding_cache.put_many(config.EMBEDDING_MODEL, batch, _fetch_embeddings(batch))))
+        return [vector if vector is not None else fetched[text] for text, vector in zip(normalized, vectors)]
+
+def mini_retrieve_similar_keywords(query: str = None, top_k: int = 10, queries: list = None) -> str:
+    # Keyword matrix is loaded once per process and memory-mapped
+    index = get_keyword_index()
+
+    # Several concepts in one call: one embeddings request and one matrix product for all of them
+    if queries:
+        queries = list(dict.fromkeys(([query] if query else []) + [str(q) for q in queries]))
+        embeddings = get_embeddings(queries)
+        with span('keyword_index.search', queries=len(queries)):
+            groups = index.search_many(embeddings, top_k)
+        return json.dumps([
+            {'query': q, 'keywords': [{'keyword': keyword, 'similarity': round(similarity, 10)} for keyword, similarity in group]}
+            for q, group in zip(queries, groups)
+        ])
+    if not query:
+        raise ValueError("Pass the concept to look up as 'query', or several as 'queries'")
 
     # Get embedding for the query
     query_embedding = get_embedding(query)
 
-    # Calculate cosine similarity
-    similarities = df['embedding'].apply(lambda x: cosine_similarity([query_embedding], [x])[0][0])
-
-    # Add similarity scores to the DataFrame
-    df['similarity'] = similarities
-
-    # Sort and retrieve top_k results
-    results = df.sort_values(by='similarity', ascending=False).head(top_k)
+    # Cosine similarity against every keyword in one matrix-vector product
+    with span('keyword_index.search'):
+        results = pd.DataFrame(index.search(query_embedding, top_k), columns=['keyword', 'similarity'])
 
     # Return the DataFrame with keyword and similarity
-    return results[['keyword', 'similarity']].to_json(orient='records')
+    return results.to_json(orient='records')
 
-def intermediary_dataframe_retrieval(query: str) -> str:
+def intermediary_dataframe_retrieval(query: str, session_id: str = 'default') -> str:
 
-    # Define your database path
-    db_path = 'data_pengadaan_copy.db'  # Update with your actual database path
-    conn = sqlite3.connect(db_path)
-    df = pd.read_sql_query(query, conn)
+    # SQLite (with the keyword index) or the columnar engine, per deployment; repeated
+    # queries on unchanged data are answered from the result cache
+    df = query_cache.get_or_query(get_engine(), query)
 
-    df.to_sql('intermediary_table', sqlite3.connect('intermediary.db'), if_exists='replace', index=False)
+    # Keep the result in this session's own store for the chart tools and /chat
+    result_store.put(session_id, df)
 
     # Get the first 5 rows from the intermediary_table
     first_rows = df.head(5).to_dict(orient='records')
@@ -62,9 +113,32 @@ def intermediary_dataframe_retrieval(query: str) -> str:
     return json.dumps(output, indent=4)
 
 
+def search_pengadaan(concepts: list = None, exclusions: list = None, date_from: str = None, date_to: str = None,
+                     satuan_kerja: str = None, session_id: str = 'default') -> str:
+    # Every concept expanded in one embeddings request and one product against the keyword index
+    concepts = list(dict.fromkeys(str(c).strip() for c in concepts or [] if str(c).strip()))
+    groups = {}
+    if concepts:
+        with span('fused_search.expand', concepts=len(concepts)):
+            groups = expand_concepts(get_keyword_index(), get_embeddings(concepts), concepts,
+                                     config.SEARCH_SIMILARITY_THRESHOLD, config.SEARCH_KEYWORDS_PER_CONCEPT)
+
+    # Values are bound as parameters; keyword groups use the full-text index when SQLite has one
+    engine = get_engine()
+    fts = engine.name == 'sqlite' and has_keyword_fts(db.connect(config.DATA_DB_PATH))
+    sql, params = build_search_query(list(groups.values()), exclusions, date_from, date_to, satuan_kerja, fts)
+    df = query_cache.get_or_query(engine, sql, params)
+
+    # Same session store as intermediary_dataframe_retrieval, so the chart tools work on the result
+    result_store.put(session_id, df)
+
+    output = {'keywords': groups, 'excluded': exclusions or [], 'query': sql, 'parameters': params, **summarize(df)}
+    return json.dumps(output, indent=4)
+
+
 def schema_check() -> str:
-    # Create database engine
-    conn = sqlite3.connect("data_pengadaan_copy.db")
+    # Pooled read-only connection to data_pengadaan_copy.db
+    conn = db.connect(config.DATA_DB_PATH)
     cursor = conn.cursor()
 
     # Initialize schema dictionary
@@ -93,12 +167,18 @@ def schema_check() -> str:
             }
             schema_info[table_name].append(column_info)
 
-    # Close connection
-    conn.close()
+    # Release the cursor; the connection stays in the pool
+    cursor.close()
 
     # Return the schema information as formatted JSON
     return json.dumps({"schema": schema_info}, indent=4)
 
+def load_chart_data(sql_query: str, session_id: str = 'default', data: pd.DataFrame = None) -> pd.DataFrame:
+    # get_answer passes the result it already fetched for the frontend, so the query runs once
+    if data is not None:
+        return data
+    return result_store.query(session_id, sql_query)
+
 def bar_chart_tool(
     sql_query: str,
     x_column: str,
@@ -107,27 +187,15 @@ def bar_chart_tool(
     y_label: str, 
     chart_title: str,
     image_filename: str,
-    image_directory: str = './images'
+    image_directory: str = './images',
+    session_id: str = 'default',
+    data: pd.DataFrame = None
 ) -> str:
-    import pandas as pd
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    import os
-    import sqlite3
-
-    # Define the path for the intermediary database
-
-    db_path = 'intermediary.db'
-
-    # Connect to SQLite database and execute the SQL query
+    # Execute the SQL query against this session's intermediary_table
     try:
-        conn = sqlite3.connect(db_path)
-        df = pd.read_sql_query(sql_query, conn)
+        df = load_chart_data(sql_query, session_id, data)
     except Exception as e:
         return f"Error executing SQL query: {e}"
-    finally:
-        conn.close()
 
     # Verify that columns exist
     if x_column not in df.columns:
@@ -135,27 +203,14 @@ def bar_chart_tool(
     if y_column not in df.columns:
         return f"Error: Column '{y_column}' not found in DataFrame."
 
-    # Create the bar chart
-    plt.figure()
+    # Render now, on first request or in the render pool, depending on the render mode
     try:
-        df.plot(kind='bar', x=x_column, y=y_column, xlabel=x_label, ylabel=y_label, title=chart_title, legend=False)
-        plt.xticks(rotation=45)
+        image_path = chart_renderer.submit(
+            'bar', df, image_directory, image_filename, session_id=session_id,
+            x_column=x_column, y_column=y_column, x_label=x_label, y_label=y_label, chart_title=chart_title
+        )
     except Exception as e:
         return f"Error creating bar chart: {e}"
-
-    # Ensure the image directory exists
-    try:
-        os.makedirs(image_directory, exist_ok=True)
-    except OSError as e:
-        return f"Error creating directory '{image_directory}': {e}"
-
-    # Save the chart
-    image_path = os.path.join(image_directory, image_filename)
-    try:
-        plt.savefig(image_path, format='png', bbox_inches='tight')
-        plt.close()
-    except Exception as e:
-        return f"Error saving image: {e}"
     
     insights = f"""
     Data Insights:
@@ -166,7 +221,7 @@ def bar_chart_tool(
     - Total budget: Rp {df[y_column].sum()/1e9:.1f}B
     """
     
-    return f"Image saved at {image_path}. explain in a paragraph this: {insights}"
+    return f"{chart_renderer.describe(image_path)} explain in a paragraph this: {insights}"
 
 
 def line_chart_tool(
@@ -177,7 +232,10 @@ def line_chart_tool(
     y_labels: list,
     chart_title: str,
     image_filename: str,
-    figsize: tuple = (12, 6)
+    image_directory: str = './images',
+    figsize: tuple = (12, 6),
+    session_id: str = 'default',
+    data: pd.DataFrame = None
 ) -> str:
     """
     Creates a dual-axis line chart from time series data queried from the database.
@@ -198,86 +256,29 @@ def line_chart_tool(
         Title for the chart
     image_filename : str
         Filename for saving the image
+    image_directory : str
+        Directory for saving the image
     figsize : tuple
         Figure size in inches (width, height)
     """
-    import pandas as pd
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    import os
-    import sqlite3
-    from datetime import datetime
-
-    # Define the path for the database
-    db_path = 'intermediary.db'
-    print("line chart tool:")
-    print(sql_query)
-    print(db_path)
-    print(x_column)
-    print(y_columns)
-    print(x_label)
-    print(y_labels)
-    print(chart_title)
-    # Connect to SQLite database and execute the SQL query
+    # Execute the SQL query against this session's intermediary_table
     try:
-        conn = sqlite3.connect(db_path)
-        df = pd.read_sql_query(sql_query, conn)
+        df = load_chart_data(sql_query, session_id, data)
     except Exception as e:
         return f"Error executing SQL query: {e}"
-    finally:
-        conn.close()
 
     # Convert date string to datetime
     df[x_column] = pd.to_datetime(df[x_column])
 
-    # Create the line chart with dual y-axes
-    fig, ax1 = plt.subplots(figsize=figsize)
-    
+    # Render now, on first request or in the render pool, depending on the render mode
     try:
-        # Plot first y-axis (Total Budget)
-        color1 = '#2E86C1'
-        ax1.set_xlabel(x_label)
-        ax1.set_ylabel(y_labels[0])
-        line1 = ax1.plot(df[x_column], df[y_columns[0]], color=color1, marker='o')
-        ax1.tick_params(axis='y', labelcolor=color1)
-        
-        # Format y-axis as billions
-        def format_billions(x, p):
-            return f'Rp {x/1e9:.1f}B'
-        ax1.yaxis.set_major_formatter(plt.FuncFormatter(format_billions))
-        
-        # Create second y-axis for number of packages
-        ax2 = ax1.twinx()
-        color2 = '#E74C3C'
-        ax2.set_ylabel(y_labels[1])
-        line2 = ax2.plot(df[x_column], df[y_columns[1]], color=color2, marker='s')
-        ax2.tick_params(axis='y', labelcolor=color2)
-        
-        # Add legend
-        lines = line1 + line2
-        labels = y_labels
-        ax1.legend(lines, labels, loc='upper left')
-        
-        # Rotate x-axis labels
-        plt.xticks(rotation=45, ha='right')
-        
-        # Add title with padding
-        plt.title(chart_title, pad=20)
-        
-        # Adjust layout
-        plt.tight_layout()
-        
+        image_path = chart_renderer.submit(
+            'line', df, image_directory, image_filename, session_id=session_id,
+            x_column=x_column, y_columns=y_columns, x_label=x_label, y_labels=y_labels,
+            chart_title=chart_title, figsize=tuple(figsize)
+        )
     except Exception as e:
         return f"Error creating line chart: {e}"
-
-    # Save the chart to the current working directory
-    image_path = os.path.join(os.getcwd(), f'images/{image_filename}')
-    try:
-        plt.savefig(image_path, format='png', bbox_inches='tight', dpi=300)
-        plt.close()
-    except Exception as e:
-        return f"Error saving image: {e}"
     
     # Generate insights
     insights = f"""
@@ -291,7 +292,7 @@ def line_chart_tool(
     - Peak packages month: {df.loc[df[y_columns[1]].idxmax(), x_column].strftime('%Y-%m')} ({df[y_columns[1]].max():,.0f} packages)
     """
     
-    return f"Image saved at {image_path}, explain in a paragraph this {insights}"
+    return f"{chart_renderer.describe(image_path)} explain in a paragraph this {insights}"
 
 
 def pie_chart_tool(
@@ -300,26 +301,15 @@ def pie_chart_tool(
     value_column: str,
     chart_title: str,
     image_filename: str,
-    image_directory: str = './images'
+    image_directory: str = './images',
+    session_id: str = 'default',
+    data: pd.DataFrame = None
 ) -> str:
-    import pandas as pd
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    import os
-    import sqlite3
-
-    # Define the path for the intermediary database
-    db_path = 'intermediary.db'
-
-    # Connect to SQLite database and execute the SQL query
+    # Execute the SQL query against this session's intermediary_table
     try:
-        conn = sqlite3.connect(db_path)
-        df = pd.read_sql_query(sql_query, conn)
+        df = load_chart_data(sql_query, session_id, data)
     except Exception as e:
         return f"Error executing SQL query: {e}"
-    finally:
-        conn.close()
 
     # Verify that the required columns exist
     if label_column not in df.columns:
@@ -327,27 +317,14 @@ def pie_chart_tool(
     if value_column not in df.columns:
         return f"Error: Column '{value_column}' not found in DataFrame."
 
-    # Create the pie chart
-    plt.figure()
+    # Render now, on first request or in the render pool, depending on the render mode
     try:
-        df.set_index(label_column)[value_column].plot(kind='pie', autopct='%1.1f%%', title=chart_title)
-        plt.ylabel('')  # Hide the y-label for a cleaner look
+        image_path = chart_renderer.submit(
+            'pie', df, image_directory, image_filename, session_id=session_id,
+            label_column=label_column, value_column=value_column, chart_title=chart_title
+        )
     except Exception as e:
         return f"Error creating pie chart: {e}"
-
-    # Ensure the image directory exists
-    try:
-        os.makedirs(image_directory, exist_ok=True)
-    except OSError as e:
-        return f"Error creating directory '{image_directory}': {e}"
-
-    # Save the chart
-    image_path = os.path.join(image_directory, image_filename)
-    try:
-        plt.savefig(image_path, format='png', bbox_inches='tight')
-        plt.close()
-    except Exception as e:
-        return f"Error saving image: {e}"
     
     insights = f"""
     Data Insights:
@@ -357,7 +334,7 @@ def pie_chart_tool(
     - Total packages: {df[value_column].sum()}
     """
     
-    return f"Image saved at {image_path}. explain in a paragraph this: {insights}"
+    return f"{chart_renderer.describe(image_path)} explain in a paragraph this: {insights}"
 
 
 def histogram_tool(
@@ -368,84 +345,31 @@ def histogram_tool(
     chart_title: str,
     image_filename: str,
     image_directory: str = './images',
-    bins: int = 12
+    bins: int = 12,
+    session_id: str = 'default',
+    data: pd.DataFrame = None
 ) -> str:
-    import os
-    import sqlite3
-    import pandas as pd
-    import matplotlib
-    matplotlib.use('Agg')
-    import matplotlib.pyplot as plt
-    import numpy as np
-
-    # Define the path for the intermediary database
-    db_path = 'intermediary.db'
-
-    # Step 1: Connect to SQLite database and execute the SQL query
-    conn = sqlite3.connect(db_path)
-    df = pd.read_sql_query(sql_query, conn)
-    conn.close()
+    # Step 1: Execute the SQL query against this session's intermediary_table
+    try:
+        df = load_chart_data(sql_query, session_id, data)
+    except Exception as e:
+        return f"Error executing SQL query: {e}"
 
     # Step 2: Verify that the x_column exists
     if x_column not in df.columns:
         return f"Error: Column '{x_column}' not found in DataFrame."
 
-    # Step 3: Determine the data type of x_column and process accordingly
-    if pd.api.types.is_numeric_dtype(df[x_column]):
-        # Numeric data: use directly
-        data_to_plot = df[x_column]
-
-    elif pd.api.types.is_datetime64_any_dtype(df[x_column]) or pd.api.types.is_object_dtype(df[x_column]):
-        # Datetime data: convert to datetime if not already
-        df[x_column] = pd.to_datetime(df[x_column], errors='coerce')
-        # Drop rows where conversion failed
-        df = df.dropna(subset=[x_column])
-        # Extract month numbers
-        data_to_plot = df[x_column].dt.month
-        bins = np.arange(1, 14) - 0.5  # Edges between months
-
-    else:
-        # Categorical data: use as is
-        data_to_plot = df[x_column]
-
-    # Step 4: Create the histogram
+    # Step 3: Render now, on first request or in the render pool, depending on the render mode
     try:
-        if pd.api.types.is_numeric_dtype(df[x_column]) or pd.api.types.is_datetime64_any_dtype(df[x_column]):
-            # Use histogram for numeric/datetime data
-            plt.figure()
-            plt.hist(data_to_plot, bins=bins, edgecolor='black')
-            plt.title(chart_title)
-            plt.xlabel(x_label)
-            plt.ylabel(y_label)
-            if pd.api.types.is_datetime64_any_dtype(df[x_column]) or 'Month' in df.columns:
-                # Set x-ticks to month names
-                plt.xticks(range(1,13), ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 
-                                         'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'])
-        else:
-            # Use bar plot for categorical data
-            counts = data_to_plot.value_counts().sort_index()
-            counts.plot(kind='bar', title=chart_title, width=1.0)
-            plt.xlabel(x_label)
-            plt.ylabel(y_label)
-            plt.xticks(rotation=45)
+        image_path = chart_renderer.submit(
+            'histogram', df, image_directory, image_filename, session_id=session_id,
+            x_column=x_column, x_label=x_label, y_label=y_label, chart_title=chart_title, bins=bins
+        )
     except Exception as e:
         return f"Error creating histogram: {e}"
 
-    # Step 5: Ensure the image directory exists
-    try:
-        os.makedirs(image_directory, exist_ok=True)
-    except OSError as e:
-        return f"Error creating directory '{image_directory}': {e}"
-
-    # Step 6: Save the chart
-    image_path = os.path.join(image_directory, image_filename)
-    try:
-        plt.savefig(image_path, format='png', bbox_inches='tight')
-        plt.close()
-    except Exception as e:
-        return f"Error saving image: {e}"
-        
-    # Data insights
+    # Step 4: Data insights, from the same values the histogram plots
+    df, data_to_plot, _ = histogram_values(df, x_column, bins)
     insights = f"Data Insights:\n- Total records: {len(df)}"
     if pd.api.types.is_datetime64_any_dtype(df[x_column]):
         month_counts = data_to_plot.value_counts().sort_index()
@@ -460,4 +384,4 @@ def histogram_tool(
         insights += f"\n- Most frequent category: {most_frequent_category}"
 
     # Completion message
-    return f"Histogram successfully created and saved at {image_path}. {insights}"
+    return f"Histogram successfully created. {chart_renderer.describe(image_path)} {insights}"
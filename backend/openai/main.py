@@ -1,13 +1,17 @@
+import time
+# Start of the startup budget (see warmup.py); recorded before the heavy imports
+STARTED = time.perf_counter()
 import openai
 import os
+import json
 import api_keys
-import sqlite3
-import pandas as pd
+import config
 from flask_cors import CORS
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory, stream_with_context
 from flask_socketio import SocketIO 
 from function_definition import (
     mini_retrieve_similar_keywords_definition,
+    search_pengadaan_definition,
     intermediary_dataframe_retrieval_definition,
     schema_check_definition,
     bar_chart_tool_definition,
@@ -16,6 +20,15 @@ from function_definition import (
     pie_chart_tool_definition
 )
 from basic_functions import deploy_assistant, add_message, run_assistant, get_answer
+from result_store import result_store, NoResultError
+from job_queue import JobQueue, QueueFull
+from session_store import SessionStore, SessionThread
+from chart_render import chart_renderer
+from warmup import Warmup
+import metrics
+from metrics import span
+from list_of_tools import embedding_cache
+from query_cache import query_cache
 
 app = Flask(__name__)
 CORS(app)
@@ -24,6 +37,7 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 os.environ['OPENAI_API_KEY'] = api_keys.openai_key
 
 all_tools = [mini_retrieve_similar_keywords_definition, 
+             search_pengadaan_definition,
              schema_check_definition, 
              intermediary_dataframe_retrieval_definition, 
              bar_chart_tool_definition,
@@ -31,64 +45,224 @@ all_tools = [mini_retrieve_similar_keywords_definition,
              histogram_tool_definition,
              pie_chart_tool_definition]
 
-threads = {}
+# Evicted sessions give up their intermediary_table too
+session_store = SessionStore(
+    config.SESSION_STORE_PATH,
+    max_sessions=config.SESSION_MAX,
+    ttl_seconds=config.SESSION_TTL_SECONDS,
+    on_evict=result_store.drop
+)
 
-def get_intermediary_data():
-    try:
-        conn = sqlite3.connect('intermediary.db')
-        df = pd.read_sql_query("SELECT * FROM intermediary_table", conn)
-        return df.to_dict(orient='records')
-    except:
-        return None
-    finally:
-        conn.close()
+startup = Warmup(STARTED)
 
-@app.route('/chat', methods=['POST'])
-def chat():
-    data = request.json
-    session_id = data.get('session_id', 'default')
-    question = data.get('message')
-    
-    if session_id not in threads:
-        threads[session_id] = openai.beta.threads.create()
-    
-    thread = threads[session_id]
-    
-    def progress_callback(status, msg):
-        print(f"Sending progress update: {msg}")  
-        socketio.emit('progress', {
-            'session_id': session_id,
-            'message': msg
-        })
-
-        socketio.sleep(0)
-    
-    add_message(thread, question, role='user')
-    run = run_assistant(
-        assistant_id="asst_2Pna3kraHtUxZZSBXRljNQJM",
-        thread=thread,
-        question=question
-    )
-    
-    annotations, message_content, charts_info = get_answer(run, thread, progress_callback)
-    add_message(thread, message_content, role='assistant')
+job_queue = JobQueue(
+    max_workers=config.JOB_WORKERS,
+    max_depth=config.JOB_QUEUE_DEPTH,
+    ttl_seconds=config.JOB_TTL_SECONDS
+)
+
+# Point-in-time gauges, read on every scrape of /metrics
+metrics.REGISTRY.gauge('sirupa_sessions_active', 'Chat sessions with a live thread, across all workers.',
+                       lambda: session_store.stats()['active'])
+metrics.REGISTRY.gauge('sirupa_result_store_sessions', 'Sessions holding an intermediary_table.',
+                       lambda: result_store.stats()['sessions'])
+metrics.REGISTRY.gauge('sirupa_result_store_bytes', 'Approximate bytes held by intermediary tables.',
+                       lambda: result_store.stats()['bytes'])
+metrics.REGISTRY.gauge('sirupa_jobs_queued', 'Async chat jobs waiting for a worker.',
+                       lambda: job_queue.stats()['queued'])
+metrics.REGISTRY.gauge('sirupa_jobs_running', 'Async chat jobs being processed.',
+                       lambda: job_queue.stats()['running'])
+metrics.REGISTRY.gauge('sirupa_query_cache_hit_rate', 'Share of data_pengadaan queries served from the result cache.',
+                       lambda: query_cache.stats()['hit_rate'])
+metrics.REGISTRY.gauge('sirupa_query_cache_bytes', 'Approximate bytes held by the query result cache.',
+                       lambda: query_cache.stats()['bytes'])
+metrics.REGISTRY.gauge('sirupa_embedding_cache_hit_rate', 'Share of embedding lookups served from the cache.',
+                       lambda: embedding_cache.stats()['hit_rate'])
+
+def get_intermediary_data(session_id):
+    # A handle plus the first page; the rest is fetched from /results/<result_id>
+    result = result_store.first_page(session_id, limit=config.RESULT_PAGE_SIZE)
+    if result is None:
+        return None, None
+    first_page = result.pop('first_page')
+    result['page_url'] = f"/results/{result['result_id']}"
+    result['stream_url'] = f"/results/{result['result_id']}/stream"
+    return first_page, result
+
+def requested_columns():
+    columns = request.args.get('columns')
+    return [c.strip() for c in columns.split(',') if c.strip()] if columns else None
+
+def get_thread(session_id):
+    # Created on the session's first message (or after it expired) and kept in the session store
+    return SessionThread(session_store.get_or_create(session_id, lambda: openai.beta.threads.create().id))
+
+def emit_progress(session_id, msg, **extra):
+    print(f"Sending progress update: {msg}")  
+    socketio.emit('progress', {
+        'session_id': session_id,
+        'message': msg,
+        **extra
+    })
+
+    socketio.sleep(0)
+
+def process_chat(session_id, question):
+    # One run per thread at a time: OpenAI rejects new messages while a run is active
+    with session_store.lock(session_id):
+        thread = get_thread(session_id)
+
+        def progress_callback(status, msg):
+            emit_progress(session_id, msg)
+        
+        add_message(thread, question, role='user')
+        run = run_assistant(
+            assistant_id="asst_2Pna3kraHtUxZZSBXRljNQJM",
+            thread=thread,
+            question=question
+        )
+        
+        annotations, message_content, charts_info = get_answer(run, thread, progress_callback, session_id)
+        add_message(thread, message_content, role='assistant')
     
-    df_data = get_intermediary_data()
+    with span('result.collect'):
+        df_data, result = get_intermediary_data(session_id)
     
     response = {
         'response': message_content,
         'session_id': session_id
     }
+
+    trace = metrics.current_trace()
+    if trace is not None:
+        response['request_id'] = trace.request_id
     
     if df_data:
         response['data'] = df_data
+    if result:
+        response['result'] = result
     
     if charts_info:
         if not isinstance(charts_info, list):
             charts_info = [charts_info]
         response['charts_info'] = charts_info
     
-    return jsonify(response)
+    return response
+
+def on_job_done(job):
+    if job.status == 'done':
+        emit_progress(job.session_id, 'done', job_id=job.id, status=job.status, result=job.result)
+    else:
+        emit_progress(job.session_id, f"Error: {job.error}", job_id=job.id, status=job.status)
+
+@app.route('/chat', methods=['POST'])
+def chat():
+    started = time.perf_counter()
+    # Until warm-up has finished a request would pay the loading itself
+    if not startup.accepting_traffic:
+        return jsonify({'error': 'Server is warming up', 'startup': startup.report()}), 503
+    data = request.json
+    session_id = data.get('session_id', 'default')
+    question = data.get('message')
+    # Every stage of this request is traced under its id; see GET /traces/<request_id>
+    request_id = request.headers.get('X-Request-ID') or metrics.new_request_id()
+
+    # Asynchronous mode: answer immediately with a job id, deliver the result later
+    if data.get('async') or request.args.get('async') == '1':
+        try:
+            job = job_queue.submit(
+                metrics.traced, request_id, 'chat', process_chat, session_id, question,
+                session_id=session_id, on_done=on_job_done
+            )
+        except QueueFull as e:
+            return jsonify({'error': str(e)}), 429
+        response = jsonify({**job.to_dict(), 'request_id': request_id}), 202
+    else:
+        with metrics.trace(request_id, 'chat'):
+            result = process_chat(session_id, question)
+            with span('jsonify'):
+                response = jsonify(result)
+
+    metrics.http_seconds.observe(time.perf_counter() - started, endpoint='/chat')
+    return response
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job '{job_id}'"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/images/<path:filename>', methods=['GET'])
+def get_image(filename):
+    # Deferred and pooled charts are rendered (or awaited) here, on first request
+    try:
+        image_path = chart_renderer.image_path(filename, timeout=config.CHART_RENDER_TIMEOUT_SECONDS)
+    except Exception as e:
+        return jsonify({'error': f"Error rendering image: {e}"}), 500
+    if image_path is not None:
+        return send_file(os.path.abspath(image_path), mimetype='image/png')
+    return send_from_directory(os.path.abspath(chart_renderer.image_directory), filename)
+
+@app.route('/results/<result_id>', methods=['GET'])
+def get_result_page(result_id):
+    # Keyset pagination: pass the previous page's next_cursor as ?after=
+    try:
+        limit = min(max(int(request.args.get('limit', config.RESULT_PAGE_SIZE)), 1), config.RESULT_PAGE_MAX)
+        after = request.args.get('after')
+        page = result_store.page(result_id, after=int(after) if after else None, limit=limit,
+                                 columns=requested_columns())
+    except NoResultError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
+
+@app.route('/results/<result_id>/stream', methods=['GET'])
+def stream_result(result_id):
+    # NDJSON, one row per line, read from a single cursor in batches
+    try:
+        rows = result_store.stream(result_id, batch_size=config.RESULT_STREAM_BATCH, columns=requested_columns())
+        first = next(rows, None)
+    except NoResultError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def generate():
+        if first is None:
+            return
+        yield json.dumps(first, ensure_ascii=False, default=str) + '\n'
+        try:
+            for row in rows:
+                yield json.dumps(row, ensure_ascii=False, default=str) + '\n'
+        except NoResultError as e:
+            yield json.dumps({'error': str(e)}) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/traces/<request_id>', methods=['GET'])
+def get_trace(request_id):
+    trace = metrics.traces.get(request_id)
+    if trace is None:
+        return jsonify({'error': f"Unknown request id '{request_id}'"}), 404
+    return jsonify(trace.to_dict())
+
+@app.route('/healthz/live', methods=['GET'])
+def healthz_live():
+    return jsonify({'status': 'ok'})
+
+@app.route('/healthz/ready', methods=['GET'])
+def healthz_ready():
+    # Not ready until the keyword index, databases and plotting stack are loaded;
+    # skipped steps (nothing to load) do not count against readiness
+    report = startup.report()
+    return jsonify(report), 200 if report['ready'] else 503
+
 @socketio.on('connect')
 def handle_connect():
     print('Client connected to WebSocket')
@@ -97,4 +271,7 @@ def handle_connect():
 def handle_disconnect():
     print('Client disconnected from WebSocket')
 if __name__ == '__main__':
-    socketio.run(app, debug=True, port=5000)  # Change this line
\ No newline at end of file
+    # With the debug reloader the app runs in a child process; only that one warms up
+    if not config.DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        startup.start()
+    socketio.run(app, debug=config.DEBUG, port=5000)  # Change this line
\ No newline at end of file
@@ -0,0 +1,333 @@
+"""
+In-process metrics and per-request traces.
+
+Counters, gauges and histograms are rendered in the Prometheus text format
+by `render()` (served at GET /metrics). `span(stage)` times a block: the
+duration goes into the stage histogram and, when a request trace is
+active, into that trace, so GET /traces/<request_id> shows where one
+answer spent its time.
+"""
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict
+import config
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _label_key(label_names, labels):
+    if set(labels) != set(label_names):
+        raise ValueError(f"Expected labels {label_names}, got {sorted(labels)}")
+    return tuple(str(labels[name]) for name in label_names)
+
+
+def _format_labels(label_names, key, extra=None):
+    pairs = list(zip(label_names, key)) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = (
+        f'{name}="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(self.label_names, labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.label_names, key), value)
+                    for key, value in sorted(self._values.items())]
+
+
+class Gauge:
+    """A gauge read from a callback at scrape time."""
+    type = 'gauge'
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self):
+        try:
+            return [(self.name, '', self.read())]
+        except Exception as e:
+            print(f"Error reading gauge {self.name}: {e}")
+            return []
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(self.label_names, labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._series.get(_label_key(self.label_names, labels))
+            return series['count'] if series else 0
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series['counts']):
+                    cumulative += count
+                    labels = _format_labels(self.label_names, key, [('le', _format_value(bound))])
+                    samples.append((self.name + '_bucket', labels, cumulative))
+                labels = _format_labels(self.label_names, key)
+                samples.append((self.name + '_sum', labels, series['sum']))
+                samples.append((self.name + '_count', labels, series['count']))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, read):
+        return self.register(Gauge(name, help, read))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+stage_seconds = REGISTRY.histogram(
+    'sirupa_stage_duration_seconds', 'Duration of each stage of answering a chat request.', ['stage'])
+stage_errors = REGISTRY.counter(
+    'sirupa_stage_errors_total', 'Stages that ended with an exception.', ['stage'])
+tool_calls = REGISTRY.counter(
+    'sirupa_tool_calls_total', 'Tool calls by tool and outcome (ok, error, timeout).', ['tool', 'outcome'])
+tool_seconds = REGISTRY.histogram(
+    'sirupa_tool_duration_seconds', 'Tool call duration by tool.', ['tool'])
+run_state_seconds = REGISTRY.histogram(
+    'sirupa_run_state_duration_seconds', 'Time an assistant run spent in each status.', ['status'])
+run_transitions = REGISTRY.counter(
+    'sirupa_run_transitions_total', 'Assistant run status changes by the status entered.', ['status'])
+http_seconds = REGISTRY.histogram(
+    'sirupa_http_request_duration_seconds', 'HTTP request duration by endpoint.', ['endpoint'])
+
+
+class Trace:
+    """Stage durations of one request, in the order the stages started."""
+
+    def __init__(self, request_id: str, name: str):
+        self.request_id = request_id
+        self.name = name
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, stage, start, duration, error=None, **attributes):
+        span = {'stage': stage, 'start_ms': round((start - self._start) * 1000, 3),
+                'duration_ms': round(duration * 1000, 3), **attributes}
+        if error:
+            span['error'] = error
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        by_stage = {}
+        for span in spans:
+            by_stage[span['stage']] = round(by_stage.get(span['stage'], 0) + span['duration_ms'], 3)
+        return {
+            'request_id': self.request_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': round(self.duration * 1000, 3) if self.duration is not None else None,
+            'stage_totals_ms': by_stage,
+            'spans': spans,
+        }
+
+
+class TraceStore:
+    """The most recent traces, bounded by count."""
+
+    def __init__(self, max_traces: int = 1000):
+        self.max_traces = max_traces
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces[trace.request_id] = trace
+            self._traces.move_to_end(trace.request_id)
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+
+    def get(self, request_id: str):
+        with self._lock:
+            return self._traces.get(request_id)
+
+
+traces = TraceStore(config.METRICS_MAX_TRACES)
+_current_trace = contextvars.ContextVar('sirupa_trace', default=None)
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def trace(request_id: str, name: str):
+    """Makes a new trace current for the block; spans inside are recorded on it."""
+    t = Trace(request_id, name)
+    traces.add(t)
+    token = _current_trace.set(t)
+    try:
+        yield t
+    finally:
+        t.finish()
+        _current_trace.reset(token)
+
+
+def traced(request_id: str, name: str, fn, *args, **kwargs):
+    """Calls fn inside a new trace; for work handed to another thread, such as a job."""
+    with trace(request_id, name):
+        return fn(*args, **kwargs)
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        stage_seconds.observe(duration, stage=stage)
+        t = _current_trace.get()
+        if t is not None:
+            t.add(stage, start, duration, error, **attributes)
+
+
+def record_tool_call(tool: str, seconds: float, outcome: str):
+    tool_calls.inc(tool=tool, outcome=outcome)
+    tool_seconds.observe(seconds, tool=tool)
+    t = _current_trace.get()
+    if t is not None:
+        t.add(f'tool.{tool}', time.perf_counter() - seconds, seconds, None if outcome == 'ok' else outcome)
+
+
+class RunStateTimer:
+    """
+    Times how long a run stays in each status. Feed it every run object
+    seen; a status change closes the previous status as a span.
+    """
+
+    def __init__(self, terminal_statuses=()):
+        self.terminal_statuses = set(terminal_statuses)
+        self.status = None
+        self.since = None
+
+    def observe(self, status: str):
+        if status == self.status:
+            return
+        now = time.perf_counter()
+        self._close(now)
+        run_transitions.inc(status=status)
+        self.status = status
+        self.since = now
+
+    def _close(self, now):
+        # A terminal status has no duration of its own
+        if self.status is None or self.status in self.terminal_statuses:
+            return
+        duration = now - self.since
+        run_state_seconds.observe(duration, status=self.status)
+        t = _current_trace.get()
+        if t is not None:
+            t.add(f'run.{self.status}', self.since, duration)
+
+    def finish(self):
+        self._close(time.perf_counter())
+        self.status = None
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,262 @@
+"""
+Compact copies of the keyword matrix for exhaustive search, so a worker
+scans 2-64x fewer bytes than the float32 matrix holds.
+
+    float16   2 bytes per dimension
+    int8      1 byte per dimension, plus one float32 scale per keyword
+    pq        product quantization: one byte per subspace of the embedding
+
+Any of them can also keep only the first `dims` dimensions, renormalized;
+text-embedding-3 vectors are trained so that a prefix is still a usable
+embedding. The compact copy only picks candidates: the best
+top_k * rescore of them are scored again against their full float32 rows,
+which stay memory-mapped on disk, so only those rows are ever read.
+
+    python quantization.py --storage int8             # build v2_key.int8.npy for the current vocabulary
+    python quantization.py --storage pq --dims 1024
+"""
+import os
+import numpy as np
+from keyword_index import MATRIX_PATH, normalize_rows, top_k_indices, vocabulary_fingerprint
+
+STORAGE_MODES = ('float32', 'float16', 'int8', 'pq')
+PQ_CENTROIDS = 256
+
+
+def storage_path(storage: str, dims: int = 0, matrix_path: str = MATRIX_PATH) -> str:
+    """Where the compact copy of matrix_path lives, e.g. v2_key.int8.npy or v2_key.pq-1024.npy."""
+    base = matrix_path[:-len('.npy')] if matrix_path.endswith('.npy') else matrix_path
+    return f"{base}.{storage}{f'-{dims}' if dims else ''}.npy"
+
+
+def _meta_path(path: str) -> str:
+    return path[:-len('.npy')] + '.meta.npz' if path.endswith('.npy') else path + '.meta.npz'
+
+
+def _truncate(rows: np.ndarray, dims: int) -> np.ndarray:
+    return normalize_rows(rows[:, :dims]) if dims < rows.shape[1] else np.asarray(rows, dtype=np.float32)
+
+
+def _kmeans(sample: np.ndarray, k: int, iterations: int, rng) -> np.ndarray:
+    """Euclidean k-means for one PQ subspace; empty clusters are reseeded from random rows."""
+    centroids = sample[rng.choice(sample.shape[0], k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _nearest(sample, centroids)
+        counts = np.bincount(labels, minlength=k)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        empty = counts == 0
+        centroids[~empty] = np.add.reduceat(sample[np.argsort(labels, kind='stable')], starts[~empty], axis=0) \
+            / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = sample[rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+    return centroids
+
+
+def _nearest(rows: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # argmin |x - c|^2 = argmin |c|^2 - 2 x.c
+    return np.argmin((centroids * centroids).sum(axis=1) - 2 * (rows @ centroids.T), axis=1)
+
+
+class QuantizedMatrix:
+    """
+    `codes` has one row per keyword: float16 or int8 values of the
+    (possibly truncated) embedding, or for pq the index of the closest
+    codebook entry in each subspace. int8 rows are scaled back by `scales`;
+    pq subspace j is described by codebooks[j], of shape (256, dims / subspaces).
+    `fingerprint` identifies the keywords the codes were built for.
+    """
+
+    def __init__(self, storage: str, codes: np.ndarray, dims: int, scales: np.ndarray = None,
+                 codebooks: np.ndarray = None, fingerprint: str = '', rescore: int = 20):
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage '{storage}', expected one of {', '.join(STORAGE_MODES)}")
+        self.storage = storage
+        self.codes = codes
+        self.dims = dims
+        self.scales = scales
+        self.codebooks = codebooks
+        self.fingerprint = fingerprint
+        self.rescore = rescore
+
+    @property
+    def count(self) -> int:
+        return self.codes.shape[0]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.codes, self.scales, self.codebooks) if a is not None)
+
+    def matches(self, keywords: list) -> bool:
+        """Whether the codes were built for these keywords, possibly before more were appended."""
+        return self.count <= len(keywords) and self.fingerprint == vocabulary_fingerprint(keywords[:self.count])
+
+    @classmethod
+    def build(cls, matrix: np.ndarray, storage: str, dims: int = 0, subspaces: int = 0, keywords: list = None,
+              rescore: int = 20, iterations: int = 10, train_rows: int = 16384, seed: int = 0,
+              chunk_rows: int = 16384) -> 'QuantizedMatrix':
+        """Quantizes the (L2-normalized) rows chunk by chunk; pq first trains its codebooks on a sample."""
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage '{storage}', expected one of {', '.join(STORAGE_MODES)}")
+        rows = matrix.shape[0]
+        dims = min(dims or matrix.shape[1], matrix.shape[1])
+        fingerprint = vocabulary_fingerprint(keywords) if keywords is not None else ''
+        scales = codebooks = None
+
+        if storage == 'pq':
+            subspaces = subspaces or max(1, dims // 16)
+            if dims % subspaces:
+                raise ValueError(f"{dims} dimensions do not split into {subspaces} equal subspaces")
+            width = dims // subspaces
+            rng = np.random.default_rng(seed)
+            sample_ids = np.sort(rng.choice(rows, min(rows, max(train_rows, PQ_CENTROIDS)), replace=False))
+            sample = _truncate(np.asarray(matrix[sample_ids], dtype=np.float32), dims)
+            k = min(PQ_CENTROIDS, sample.shape[0])
+            codebooks = np.stack([_kmeans(sample[:, j * width:(j + 1) * width], k, iterations, rng)
+                                  for j in range(subspaces)])
+            codes = np.empty((rows, subspaces), dtype=np.uint8)
+        elif storage == 'int8':
+            codes = np.empty((rows, dims), dtype=np.int8)
+            scales = np.empty(rows, dtype=np.float32)
+        else:
+            codes = np.empty((rows, dims), dtype=np.float16 if storage == 'float16' else np.float32)
+
+        quantized = cls(storage, codes, dims, scales, codebooks, fingerprint, rescore)
+        quantized._encode(matrix, 0, chunk_rows)
+        return quantized
+
+    def _encode(self, matrix: np.ndarray, first: int, chunk_rows: int):
+        """Fills codes (and scales) from row `first` on with the quantized rows of the matrix."""
+        for start in range(first, matrix.shape[0], chunk_rows):
+            block = _truncate(np.asarray(matrix[start:start + chunk_rows], dtype=np.float32), self.dims)
+            end = start + block.shape[0]
+            if self.storage == 'pq':
+                width = self.codebooks.shape[2]
+                for j in range(self.codebooks.shape[0]):
+                    self.codes[start:end, j] = _nearest(block[:, j * width:(j + 1) * width], self.codebooks[j])
+            elif self.storage == 'int8':
+                # One scale per keyword, so the largest component maps to +-127
+                scale = np.abs(block).max(axis=1) / 127
+                scale[scale == 0] = 1.0
+                self.codes[start:end] = np.rint(block / scale[:, None])
+                self.scales[start:end] = scale
+            else:
+                self.codes[start:end] = block
+
+    def extend(self, matrix: np.ndarray, keywords: list, chunk_rows: int = 16384) -> 'QuantizedMatrix':
+        """
+        A copy that also holds rows count.. of the matrix, quantized the same
+        way; pq codebooks are reused as they are, not retrained.
+        """
+        rows = matrix.shape[0]
+        codes = np.empty((rows,) + self.codes.shape[1:], dtype=self.codes.dtype)
+        codes[:self.count] = self.codes
+        scales = None
+        if self.scales is not None:
+            scales = np.empty(rows, dtype=np.float32)
+            scales[:self.count] = self.scales
+        extended = QuantizedMatrix(self.storage, codes, self.dims, scales, self.codebooks,
+                                   vocabulary_fingerprint(keywords[:rows]), self.rescore)
+        extended._encode(matrix, self.count, chunk_rows)
+        return extended
+
+    def scores(self, queries: np.ndarray, chunk_rows: int = 4096) -> np.ndarray:
+        """
+        Approximate similarity of every row to full-length queries, one
+        column per query: shape (rows, queries). Each block of codes is
+        widened once for all the queries.
+        """
+        queries = normalize_rows(np.atleast_2d(queries)[:, :self.dims])
+        scores = np.empty((self.count, queries.shape[0]), dtype=np.float32)
+
+        if self.storage == 'pq':
+            subspaces, k, width = self.codebooks.shape
+            # Table of query . codebook entry per subspace; a row's score is the sum of its entries
+            tables = np.einsum('jkd,qjd->qjk', self.codebooks, queries.reshape(-1, subspaces, width))
+            tables = tables.reshape(queries.shape[0], -1)
+            offsets = np.arange(subspaces, dtype=np.intp) * k
+            for start in range(0, self.count, chunk_rows):
+                block = self.codes[start:start + chunk_rows].astype(np.intp) + offsets
+                for i, table in enumerate(tables):
+                    scores[start:start + block.shape[0], i] = table[block].sum(axis=1)
+            return scores
+
+        if self.codes.dtype == np.float32:
+            return self.codes @ queries.T
+        # numpy has no BLAS product for float16 or int8, so blocks are widened into one reused buffer
+        buffer = np.empty((min(chunk_rows, self.count), self.dims), dtype=np.float32)
+        for start in range(0, self.count, chunk_rows):
+            block = self.codes[start:start + chunk_rows]
+            rows = buffer[:block.shape[0]]
+            np.copyto(rows, block, casting='unsafe')
+            scores[start:start + block.shape[0]] = rows @ queries.T
+        if self.scales is not None:
+            scores *= self.scales[:, None]
+        return scores
+
+    def search_many(self, matrix: np.ndarray, queries: np.ndarray, top_k: int, rescore: int = None) -> list:
+        """
+        (row indices, scores) of the top_k rows per normalized query; the
+        candidates are rescored in float32 unless rescore is 0.
+        """
+        rescore = self.rescore if rescore is None else rescore
+        approximate = self.scores(queries)
+        results = []
+        for i, query in enumerate(queries):
+            column = approximate[:, i]
+            if not rescore:
+                top = top_k_indices(column, top_k)
+                results.append((top, column[top]))
+                continue
+            ids = np.sort(top_k_indices(column, top_k * rescore))
+            exact = matrix[ids] @ query
+            top = top_k_indices(exact, top_k)
+            results.append((ids[top], exact[top]))
+        return results
+
+    def search(self, matrix: np.ndarray, query: np.ndarray, top_k: int, rescore: int = None):
+        return self.search_many(matrix, query[None, :], top_k, rescore)[0]
+
+    def save(self, path: str):
+        # The codes stay a plain .npy, so they can be memory-mapped and shared between workers
+        np.save(path + '.tmp.npy', self.codes)
+        meta = {'storage': np.array(self.storage), 'dims': np.int64(self.dims), 'fingerprint': np.array(self.fingerprint)}
+        if self.scales is not None:
+            meta['scales'] = self.scales
+        if self.codebooks is not None:
+            meta['codebooks'] = self.codebooks
+        np.savez(_meta_path(path + '.tmp.npy'), **meta)
+        os.replace(_meta_path(path + '.tmp.npy'), _meta_path(path))
+        os.replace(path + '.tmp.npy', path)
+
+    @classmethod
+    def load(cls, path: str, rescore: int = 20, mmap: bool = True) -> 'QuantizedMatrix':
+        codes = np.load(path, mmap_mode='r' if mmap else None)
+        with np.load(_meta_path(path)) as meta:
+            return cls(str(meta['storage']), codes, int(meta['dims']),
+                       meta['scales'] if 'scales' in meta else None,
+                       meta['codebooks'] if 'codebooks' in meta else None,
+                       str(meta['fingerprint']), rescore)
+
+
+if __name__ == '__main__':
+    import time
+    import argparse
+    import config
+    from keyword_index import get_keyword_index
+
+    parser = argparse.ArgumentParser(description="Build a compact copy of the keyword matrix.")
+    parser.add_argument('--storage', choices=STORAGE_MODES, default=config.KEYWORD_STORAGE)
+    parser.add_argument('--dims', type=int, default=config.KEYWORD_STORAGE_DIMS)
+    parser.add_argument('--subspaces', type=int, default=config.KEYWORD_PQ_SUBSPACES)
+    args = parser.parse_args()
+    if args.storage == 'float32' and not args.dims:
+        parser.error("float32 storage is the matrix itself; pass --dims to keep fewer dimensions")
+
+    vocabulary = get_keyword_index()
+    start = time.perf_counter()
+    quantized = QuantizedMatrix.build(vocabulary.matrix, args.storage, args.dims, args.subspaces,
+                                      keywords=vocabulary.keywords)
+    path = storage_path(args.storage, args.dims)
+    quantized.save(path)
+    print(f"Quantized {quantized.count} keywords to {quantized.nbytes / 2**20:.1f} MB "
+          f"({vocabulary.matrix.nbytes / 2**20:.1f} MB as float32) in {time.perf_counter() - start:.1f}s: {path}")
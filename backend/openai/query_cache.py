@@ -0,0 +1,205 @@
+import re
+import threading
+from collections import OrderedDict
+import pandas as pd
+import config
+
+_TOKEN = re.compile(r"""
+    (?P<space>\s+|--[^\n]*|/\*.*?\*/)
+  | (?P<quoted>'(?:[^']|'')*'|"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<word>[A-Za-z_][A-Za-z_0-9$]*)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)
+  | (?P<param>[?:@$][A-Za-z_0-9]*)
+  | (?P<op><=|>=|<>|!=|==|\|\||<<|>>|[-+*/%<>=,;.()~&|])
+""", re.VERBOSE | re.DOTALL)
+
+# Clauses that end a WHERE/HAVING condition at the same nesting level
+_CLAUSE_END = {'group', 'order', 'limit', 'offset', 'having', 'union', 'except', 'intersect', 'window'}
+# Tokens that make a parenthesised group something other than a plain boolean expression
+_NOT_BOOLEAN = {',', 'case', 'when', 'then', 'else', 'end'}
+
+
+def _tokenize(sql: str) -> list:
+    """Unquoted words are casefolded (SQL keywords and identifiers are case-insensitive); literals are kept as written."""
+    tokens, pos = [], 0
+    while pos < len(sql):
+        match = _TOKEN.match(sql, pos)
+        if match is None:
+            raise ValueError(f"Unexpected character {sql[pos]!r} at {pos}")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == 'space':
+            continue
+        text = match.group()
+        tokens.append(text.casefold() if kind == 'word' else text)
+    return tokens
+
+
+def _nest(tokens: list) -> list:
+    """Turns parentheses into nested lists."""
+    stack = [[]]
+    for token in tokens:
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) == 1:
+                raise ValueError("Unbalanced parentheses")
+            group = stack.pop()
+            stack[-1].append(group)
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1:
+        raise ValueError("Unbalanced parentheses")
+    return stack[0]
+
+
+def _plain(items) -> str:
+    return ' '.join(item if isinstance(item, str) else '(' + _group(item) + ')' for item in items)
+
+
+def _expression(items) -> str:
+    # OR is commutative, and binds looser than AND/NOT, so top-level OR terms can be sorted
+    top_level = {item for item in items if isinstance(item, str)}
+    if 'or' not in top_level or top_level & _NOT_BOOLEAN:
+        return _plain(items)
+    terms, term = [], []
+    for item in items:
+        if item == 'or':
+            terms.append(term)
+            term = []
+        else:
+            term.append(item)
+    terms.append(term)
+    return ' or '.join(sorted(_plain(t) for t in terms))
+
+
+def _statement(items) -> str:
+    parts, i = [], 0
+    while i < len(items):
+        item = items[i]
+        if item in ('where', 'having'):
+            end = i + 1
+            while end < len(items) and not (isinstance(items[end], str) and items[end] in _CLAUSE_END):
+                end += 1
+            parts.append(item)
+            parts.append(_expression(items[i + 1:end]))
+            i = end
+            continue
+        parts.append(item if isinstance(item, str) else '(' + _group(item) + ')')
+        i += 1
+    return ' '.join(parts)
+
+
+def _group(items) -> str:
+    if 'select' in items:
+        return _statement(items)
+    return _expression(items)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Canonical text for a query, used as the cache key: comments and extra
+    whitespace dropped, keywords and identifiers casefolded, and the terms
+    of every OR chain in WHERE/HAVING conditions sorted. String literals
+    are left untouched. The original text is what gets executed.
+    """
+    try:
+        return _statement(_nest(_tokenize(sql.strip().rstrip(';'))))
+    except ValueError:
+        return ' '.join(sql.split())
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class QueryCache:
+    """
+    Result sets of data_pengadaan queries, keyed by engine and normalized
+    SQL, in an LRU bounded by total DataFrame memory. Every lookup checks
+    the engine's data version and drops all entries once it changes, so a
+    write to data_pengadaan (or a new Parquet snapshot) is never served
+    stale.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, max_entry_bytes: int = None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 4
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_version(self, version):
+        # Caller holds self._lock
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get_or_query(self, engine, sql: str, params=()) -> pd.DataFrame:
+        """engine.query(sql, params), served from the cache when an equivalent query already ran on the same data."""
+        if self.max_bytes <= 0:
+            return engine.query(sql, params)
+        version = engine.data_version()
+        # normalize_sql reorders OR terms, which would detach positional parameters from their placeholders
+        key = (engine.name, normalize_sql(sql) if not params else sql, tuple(params))
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                # Callers may modify the frame they get back
+                return entry[0].copy()
+            self.misses += 1
+
+        df = engine.query(sql, params)
+        size = _frame_bytes(df)
+        if size > self.max_entry_bytes:
+            return df
+
+        with self._lock:
+            # The data may have changed while the query ran
+            if engine.data_version() != self._version:
+                return df
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            self._entries[key] = (df.copy(), size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return df
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+query_cache = QueryCache(
+    max_bytes=config.QUERY_CACHE_MAX_BYTES,
+    max_entry_bytes=config.QUERY_CACHE_MAX_ENTRY_BYTES
+)
@@ -0,0 +1,201 @@
+"""
+Limits on the SQL the assistant writes, applied before and while it runs:
+
+- only a single read statement (SELECT/WITH) is accepted
+- plans that join two tables without any join condition are rejected
+- a result may have at most SIRUPA_QUERY_MAX_ROWS rows
+- execution is cancelled after SIRUPA_QUERY_TIMEOUT_SECONDS
+
+A violation raises QueryRejected, whose text is short and says what to
+change, since it goes back to the assistant as the tool output.
+"""
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+import pandas as pd
+import config
+from metrics import REGISTRY
+
+# SQLite VM instructions between two deadline checks
+PROGRESS_STEPS = 10_000
+
+# Authorizer actions a read statement needs; anything else (writes, ATTACH, PRAGMA, ...) is denied
+_READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+rejections = REGISTRY.counter(
+    'sirupa_query_rejections_total', 'Assistant queries rejected by the query guard, by reason.', ['reason'])
+
+HINTS = {
+    'not_read_only': "Only a single SELECT statement is allowed.",
+    'cartesian_product': "Add a join condition (ON/WHERE) relating the tables, or aggregate one side in a subquery first.",
+    'too_many_rows': "Filter with WHERE, aggregate with GROUP BY, or add a LIMIT.",
+    'timeout': "Narrow the WHERE filters or aggregate over fewer rows.",
+}
+
+
+class QueryRejected(Exception):
+    def __init__(self, reason: str, detail: str):
+        self.reason = reason
+        self.detail = detail
+        super().__init__(f"Query rejected ({reason}): {detail} {HINTS[reason]}")
+
+
+def reject(reason: str, detail: str):
+    rejections.inc(reason=reason)
+    raise QueryRejected(reason, detail)
+
+
+def check_row_count(rows: int, max_rows: int):
+    if max_rows and rows > max_rows:
+        reject('too_many_rows', f"the result has more than {max_rows} rows.")
+
+
+def _authorize_read(action, arg1, arg2, db_name, trigger):
+    if action in _READ_ACTIONS:
+        return sqlite3.SQLITE_OK
+    # The full-text index's own statements when it is opened: a schema
+    # lookup (SQLite refuses user writes to sqlite_master regardless) and
+    # a read-only pragma
+    if (action == sqlite3.SQLITE_UPDATE and arg1 == 'sqlite_master') or \
+            (action == sqlite3.SQLITE_PRAGMA and arg1 == 'data_version' and arg2 is None):
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+
+def _sqlite_cartesian(plan) -> list:
+    """
+    Tables that one SELECT of an EXPLAIN QUERY PLAN reads with a full scan
+    next to another full scan, i.e. a nested loop with nothing to search on.
+    CTEs, subqueries, constant rows and virtual tables are not counted.
+    """
+    derived = set()
+    scans = {}
+    for _, parent, _, detail in plan:
+        for prefix in ('MATERIALIZE ', 'CO-ROUTINE '):
+            if detail.startswith(prefix):
+                derived.add(detail[len(prefix):])
+        if not detail.startswith('SCAN ') or 'VIRTUAL TABLE' in detail or 'CONSTANT ROW' in detail:
+            continue
+        name = detail[len('SCAN '):].split(' ')[0]
+        if name.startswith('(') or name in derived:
+            continue
+        scans.setdefault(parent, []).append(name)
+    for names in scans.values():
+        if len(names) > 1:
+            return names
+    return []
+
+
+def _interrupt_after(conn: sqlite3.Connection, timeout: float):
+    deadline = time.monotonic() + timeout
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, PROGRESS_STEPS)
+    return deadline
+
+
+def sqlite_read(conn: sqlite3.Connection, sql: str, max_rows: int = None, timeout: float = None,
+                params=()) -> pd.DataFrame:
+    """pd.read_sql_query(sql, conn, params=params) within the guard's limits."""
+    max_rows = config.QUERY_MAX_ROWS if max_rows is None else max_rows
+    timeout = config.QUERY_TIMEOUT_SECONDS if timeout is None else timeout
+    conn.set_authorizer(_authorize_read)
+    deadline = _interrupt_after(conn, timeout) if timeout else None
+    try:
+        plan = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        tables = _sqlite_cartesian(plan)
+        if tables:
+            reject('cartesian_product', f"{' and '.join(tables)} are joined without a usable join condition.")
+
+        cursor = conn.execute(sql, params)
+        columns = [column[0] for column in cursor.description or []]
+        rows = []
+        while True:
+            batch = cursor.fetchmany(config.RESULT_STREAM_BATCH)
+            if not batch:
+                break
+            rows.extend(batch)
+            check_row_count(len(rows), max_rows)
+        # What pd.read_sql_query builds from the same rows
+        return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    except sqlite3.DatabaseError as e:
+        message = str(e)
+        if 'one statement at a time' in message:
+            reject('not_read_only', "the text contains more than one statement.")
+        if 'not authorized' in message:
+            reject('not_read_only', "the statement is not a read.")
+        if deadline is not None and 'interrupted' in message and time.monotonic() > deadline:
+            reject('timeout', f"the query ran longer than {timeout:g} seconds.")
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+        conn.set_authorizer(None)
+
+
+def _estimated_rows(node):
+    """DuckDB's estimate for the rows a plan node produces (the closest estimate below it)."""
+    info = node.get('extra_info')
+    if isinstance(info, dict) and 'Estimated Cardinality' in info:
+        return int(info['Estimated Cardinality'])
+    for child in node.get('children', []):
+        estimate = _estimated_rows(child)
+        if estimate is not None:
+            return estimate
+    return None
+
+
+def _reads_table(node) -> bool:
+    info = node.get('extra_info')
+    # Stored tables, and the Parquet snapshot behind the data_pengadaan view
+    if isinstance(info, dict) and ('Table' in info or 'Function' in info):
+        return True
+    return any(_reads_table(child) for child in node.get('children', []))
+
+
+def _duckdb_cross_products(node) -> bool:
+    if node.get('name') == 'CROSS_PRODUCT':
+        children = node.get('children', [])
+        # A side with one row (a scalar subquery) is a broadcast, and one
+        # without a table (constant rows) stays small
+        if all(_reads_table(child) and (_estimated_rows(child) or 2) > 1 for child in children):
+            return True
+    return any(_duckdb_cross_products(child) for child in node.get('children', []))
+
+
+def check_duckdb(conn, sql: str, params=None):
+    """Statement type and plan checks for a DuckDB query, before it runs."""
+    import duckdb
+
+    try:
+        statements = conn.extract_statements(sql)
+    except duckdb.ParserException:
+        # Let the query itself report the syntax error
+        return
+    if len(statements) != 1:
+        reject('not_read_only', "the text contains more than one statement.")
+    if statements[0].type != duckdb.StatementType.SELECT:
+        reject('not_read_only', "the statement is not a read.")
+
+    plan = conn.execute("EXPLAIN (FORMAT JSON) " + sql, params).fetchall()
+    if any(_duckdb_cross_products(node) for _, text in plan for node in json.loads(text)):
+        reject('cartesian_product', "tables are joined without a usable join condition.")
+
+
+@contextmanager
+def duckdb_deadline(conn, timeout: float = None):
+    """Interrupts the DuckDB connection's running query once the timeout passes."""
+    import duckdb
+
+    timeout = config.QUERY_TIMEOUT_SECONDS if timeout is None else timeout
+    if not timeout:
+        yield
+        return
+    timer = threading.Timer(timeout, conn.interrupt)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield
+    except duckdb.InterruptException:
+        reject('timeout', f"the query ran longer than {timeout:g} seconds.")
+    finally:
+        timer.cancel()
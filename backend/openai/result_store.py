@@ -0,0 +1,230 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+import pandas as pd
+import config
+from analytics_engine import get_engine, sqlite_value, RESULT_TABLE
+from metrics import span
+
+
+class NoResultError(LookupError):
+    pass
+
+
+class _SessionResult:
+    def __init__(self, frame, rows, columns):
+        self.result_id = uuid.uuid4().hex
+        self.frame = frame
+        self.size_bytes = frame.size_bytes
+        self.rows = rows
+        self.columns = columns
+        self.closed = False
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def close(self):
+        # Caller holds self.lock
+        self.closed = True
+        self.frame.close()
+
+    def handle(self) -> dict:
+        return {'result_id': self.result_id, 'rows': self.rows, 'columns': self.columns}
+
+
+def _quote(column: str) -> str:
+    return '"' + column.replace('"', '""') + '"'
+
+
+class SessionResultStore:
+    """
+    Keeps the latest intermediary_table of every chat session in its own
+    in-memory database (SQLite, or DuckDB with the columnar engine), so
+    chart SQL written against intermediary_table only ever sees that
+    session's rows.
+
+    Sessions are evicted least-recently-used first when the store holds more
+    than max_sessions, uses more than max_bytes, or a session sits idle
+    longer than ttl_seconds.
+    """
+
+    def __init__(self, max_sessions: int = 256, max_bytes: int = 512 * 1024 * 1024, ttl_seconds: float = 3600):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def put(self, session_id: str, df: pd.DataFrame):
+        # A fresh database per result, so the memory of the previous one is released on close
+        with span('result_store.put', rows=len(df)):
+            entry = _SessionResult(get_engine().load_frame(df), len(df), [str(c) for c in df.columns])
+
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            self._sessions[session_id] = entry
+            evicted = self._evict(keep=session_id)
+        if previous is not None:
+            evicted.append(previous)
+        # Closed outside the store lock: a query may hold an entry's lock for its whole timeout
+        for stale in evicted:
+            with stale.lock:
+                stale.close()
+
+    def _entry(self, session_id: str) -> _SessionResult:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or self._expired(entry):
+                raise NoResultError(
+                    f"No {RESULT_TABLE} for session '{session_id}'. Run intermediary_dataframe_retrieval first."
+                )
+            entry.last_used = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return entry
+
+    def _entry_by_id(self, result_id: str) -> _SessionResult:
+        with self._lock:
+            for session_id, entry in self._sessions.items():
+                if entry.result_id == result_id and not self._expired(entry):
+                    entry.last_used = time.monotonic()
+                    self._sessions.move_to_end(session_id)
+                    return entry
+        raise NoResultError(f"Result '{result_id}' does not exist or was replaced by a newer result.")
+
+    def handle(self, session_id: str):
+        try:
+            return self._entry(session_id).handle()
+        except NoResultError:
+            return None
+
+    def _select(self, entry, columns, after=None, limit=None):
+        columns = list(columns) if columns else entry.columns
+        unknown = [c for c in columns if c not in entry.columns]
+        if unknown:
+            raise ValueError(f"Unknown column(s): {', '.join(unknown)}")
+        # rowid is the insertion order in both engines, so it doubles as the keyset cursor
+        sql = f"SELECT rowid, {', '.join(_quote(c) for c in columns)} FROM {RESULT_TABLE}"
+        params = []
+        if after is not None:
+            sql += " WHERE rowid > ?"
+            params.append(int(after))
+        sql += " ORDER BY rowid"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return columns, sql, params
+
+    def page(self, result_id: str, after=None, limit: int = 100, columns=None) -> dict:
+        """
+        One keyset page of a result: the rows after the `after` cursor, plus
+        the cursor for the next page (None on the last page).
+        """
+        entry = self._entry_by_id(result_id)
+        columns, sql, params = self._select(entry, columns, after, limit + 1)
+        with entry.lock, span('db.intermediary.page'):
+            cursor = entry.frame.cursor()
+            try:
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            'result_id': result_id,
+            'rows': [dict(zip(columns, map(sqlite_value, row[1:]))) for row in rows],
+            'next_cursor': str(rows[-1][0]) if has_more else None,
+        }
+
+    def first_page(self, session_id: str, limit: int = 100, columns=None):
+        """The session's result handle with its first page, or None."""
+        handle = self.handle(session_id)
+        if handle is None:
+            return None
+        try:
+            page = self.page(handle['result_id'], limit=limit, columns=columns)
+        except NoResultError:
+            return None
+        return {**handle, 'page_size': limit, 'first_page': page['rows'], 'next_cursor': page['next_cursor']}
+
+    def stream(self, result_id: str, batch_size: int = 500, columns=None):
+        """
+        Yields the rows of a result one by one from a single cursor, fetching
+        batch_size rows at a time, so memory stays flat whatever the size.
+        Raises NoResultError if the result is replaced or evicted midway.
+        """
+        entry = self._entry_by_id(result_id)
+        columns, sql, params = self._select(entry, columns)
+        with entry.lock:
+            cursor = entry.frame.cursor()
+            cursor.execute(sql, params)
+        try:
+            while True:
+                # The lock is held per batch only, so chart queries can run in between
+                with entry.lock:
+                    if entry.closed:
+                        raise NoResultError(f"Result '{result_id}' was replaced while it was being streamed.")
+                    rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(zip(columns, map(sqlite_value, row[1:])))
+        finally:
+            with entry.lock:
+                if not entry.closed:
+                    cursor.close()
+
+    def query(self, session_id: str, sql: str) -> pd.DataFrame:
+        """Runs sql against the session's intermediary_table."""
+        entry = self._entry(session_id)
+        with entry.lock, span('db.intermediary'):
+            return entry.frame.query(sql)
+
+    def get_frame(self, session_id: str):
+        try:
+            return self.query(session_id, f"SELECT * FROM {RESULT_TABLE}")
+        except NoResultError:
+            return None
+
+    def drop(self, session_id: str):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        if entry is not None:
+            with entry.lock:
+                entry.close()
+
+    def _expired(self, entry) -> bool:
+        return time.monotonic() - entry.last_used > self.ttl_seconds
+
+    def _evict(self, keep=None) -> list:
+        # Caller holds self._lock and closes the returned entries after releasing it
+        evicted = []
+        total = sum(e.size_bytes for e in self._sessions.values())
+        for session_id in list(self._sessions):
+            entry = self._sessions[session_id]
+            over_limit = len(self._sessions) > self.max_sessions or total > self.max_bytes
+            if session_id == keep or not (over_limit or self._expired(entry)):
+                continue
+            del self._sessions[session_id]
+            total -= entry.size_bytes
+            self.evictions += 1
+            evicted.append(entry)
+        return evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'bytes': sum(e.size_bytes for e in self._sessions.values()),
+                'rows': sum(e.rows for e in self._sessions.values()),
+                'evictions': self.evictions,
+            }
+
+
+result_store = SessionResultStore(
+    max_sessions=config.RESULT_STORE_MAX_SESSIONS,
+    max_bytes=config.RESULT_STORE_MAX_BYTES,
+    ttl_seconds=config.RESULT_STORE_TTL_SECONDS
+)
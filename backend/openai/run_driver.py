@@ -0,0 +1,146 @@
+import json
+import os
+import time
+from metrics import span, RunStateTimer
+
+TERMINAL_STATUSES = {'completed', 'failed', 'cancelled', 'expired', 'incomplete'}
+
+
+class Backoff:
+    """
+    Poll interval that starts short, grows while the run status stays the
+    same and snaps back to the start whenever the status changes.
+    """
+
+    def __init__(self, initial: float = 0.05, maximum: float = 0.4, factor: float = 1.3):
+        self.initial = initial
+        self.maximum = maximum
+        self.factor = factor
+        self.delay = initial
+
+    def reset(self):
+        self.delay = self.initial
+
+    def next(self) -> float:
+        delay = self.delay
+        self.delay = min(self.delay * self.factor, self.maximum)
+        return delay
+
+
+class EventRecorder:
+    """
+    Records the run events seen by drive_stream in the replay format read by
+    benchmarks/stub_openai_server.py: one segment per stream, each event with
+    the milliseconds since the previous one.
+    """
+
+    def __init__(self):
+        self.segments = []
+        self._last = None
+
+    def start_segment(self):
+        self.segments.append([])
+        self._last = time.monotonic()
+
+    def __call__(self, event):
+        if not event.event.startswith('thread.run.') or event.event.startswith('thread.run.step'):
+            return
+        now = time.monotonic()
+        entry = {'after_ms': round((now - self._last) * 1000), 'event': event.event}
+        self._last = now
+        if event.event == 'thread.run.requires_action':
+            entry['tool_calls'] = [
+                {'name': call.function.name, 'arguments': json.loads(call.function.arguments)}
+                for call in event.data.required_action.submit_tool_outputs.tool_calls
+            ]
+        self.segments[-1].append(entry)
+
+    def save(self, path: str, final_message: str = None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'final_message': final_message, 'segments': self.segments}, f, indent=2, ensure_ascii=False)
+
+
+def drive_stream(client, stream, thread, handle_required_action, recorder: EventRecorder = None):
+    """
+    Follows a run through its streamed events. Tool outputs are submitted the
+    moment requires_action arrives, and the submission's own event stream
+    takes over. Returns the run from the terminal event.
+    """
+    run = None
+    timer = RunStateTimer(TERMINAL_STATUSES)
+    while stream is not None:
+        if recorder:
+            recorder.start_segment()
+        next_stream = None
+        with stream:
+            for event in stream:
+                if recorder:
+                    recorder(event)
+                if event.event == 'error':
+                    raise RuntimeError(f"Run stream error: {event.data}")
+                if not event.event.startswith('thread.run.') or event.event.startswith('thread.run.step'):
+                    continue
+
+                run = event.data
+                timer.observe(run.status)
+                if event.event == 'thread.run.requires_action':
+                    tool_outputs = handle_required_action(run)
+                    with span('openai.submit_tool_outputs'):
+                        next_stream = client.beta.threads.runs.submit_tool_outputs(
+                            thread_id=thread.id,
+                            run_id=run.id,
+                            tool_outputs=tool_outputs,
+                            stream=True
+                        )
+                    break
+                if run.status in TERMINAL_STATUSES:
+                    break
+        stream = next_stream
+    timer.finish()
+    return run
+
+
+def drive_polling(client, run, thread, handle_required_action, backoff: Backoff = None, max_failures: int = 5):
+    """
+    Fallback for non-streamed runs: polls with adaptive backoff instead of a
+    fixed interval, and never waits before acting on a status change. A
+    failing retrieve is retried with exponential backoff; after max_failures
+    failures in a row the last error is raised.
+    """
+    backoff = backoff or Backoff()
+    timer = RunStateTimer(TERMINAL_STATUSES)
+    timer.observe(run.status)
+    last_status = run.status
+    failures = 0
+    while run.status not in TERMINAL_STATUSES:
+        if run.status == 'requires_action':
+            tool_outputs = handle_required_action(run)
+            with span('openai.submit_tool_outputs'):
+                run = client.beta.threads.runs.submit_tool_outputs(
+                    thread_id=thread.id,
+                    run_id=run.id,
+                    tool_outputs=tool_outputs
+                )
+        else:
+            time.sleep(backoff.next())
+            try:
+                with span('openai.runs.retrieve'):
+                    run = client.beta.threads.runs.retrieve(thread_id=thread.id, run_id=run.id)
+                failures = 0
+            except Exception as e:
+                failures += 1
+                print(f"Error retrieving run ({failures}/{max_failures}): {e}")
+                if failures >= max_failures:
+                    raise
+                time.sleep(min(backoff.initial * 2 ** failures, 5.0))
+                continue
+        timer.observe(run.status)
+
+        if run.status != last_status:
+            last_status = run.status
+            backoff.reset()
+    timer.finish()
+    return run
@@ -0,0 +1,163 @@
+"""
+Chat sessions: which OpenAI thread each session_id continues.
+
+Sessions are kept in a SQLite file shared by every worker process, so a
+conversation keeps its thread across restarts and whichever worker takes
+the next request. A session expires ttl_seconds after its last use, and
+the least recently used ones are evicted once there are more than
+max_sessions.
+"""
+import os
+import time
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+import db
+from metrics import REGISTRY
+
+evictions = REGISTRY.counter(
+    'sirupa_session_evictions_total', 'Chat sessions dropped from the session store, by reason.', ['reason'])
+
+# The run helpers only use the thread's id
+SessionThread = namedtuple('SessionThread', ['id'])
+
+
+class SessionStore:
+    """
+    session_id -> thread id, with last-use times for expiry and LRU
+    eviction. Creating a session takes SQLite's write lock (BEGIN
+    IMMEDIATE), so workers never both evict or both store a thread for the
+    same session; reads only touch the last-use time.
+    """
+
+    def __init__(self, path: str, max_sessions: int = 10000, ttl_seconds: float = 86400, on_evict=None):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        # session_id -> [lock, holders and waiters]; only sessions in use have an entry
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self):
+        # Pooled per-thread connection; WAL lets every worker process share the file
+        if not self._schema_ready:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        conn = db.connect(self.path, read_only=False)
+        if not self._schema_ready:
+            with conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS sessions (
+                        session_id TEXT PRIMARY KEY,
+                        thread_id TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        last_used REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions(last_used)")
+            self._schema_ready = True
+        return conn
+
+    @contextmanager
+    def lock(self, session_id: str):
+        """
+        Serializes runs of one session within this process; other sessions
+        never wait on it. The lock is dropped once nobody holds or waits for
+        it, so there are only as many as sessions with a request in flight.
+        """
+        with self._locks_lock:
+            entry = self._locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[session_id]
+
+    def _live(self, conn, session_id: str, now: float):
+        row = conn.execute("SELECT thread_id, last_used FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None or now - row[1] > self.ttl_seconds:
+            return None
+        conn.execute("UPDATE sessions SET last_used = ? WHERE session_id = ?", (now, session_id))
+        return row[0]
+
+    def get(self, session_id: str):
+        """The session's thread id, or None when it has none or it expired; counts as a use."""
+        conn = self._connection()
+        with conn:
+            return self._live(conn, session_id, time.time())
+
+    def get_or_create(self, session_id: str, create) -> str:
+        """
+        The session's thread id, from create() when the session is new or
+        expired. create() is called outside any transaction; if another
+        worker stored a thread for the session in the meantime, that one is
+        kept.
+        """
+        thread_id = self.get(session_id)
+        if thread_id is not None:
+            return thread_id
+        created = create()
+
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            thread_id = self._live(conn, session_id, now)
+            dropped = {}
+            if thread_id is None:
+                dropped = self._evict(conn, now, session_id)
+                conn.execute(
+                    "INSERT OR REPLACE INTO sessions (session_id, thread_id, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    (session_id, created, now, now)
+                )
+                thread_id = created
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+        for reason, session_ids in dropped.items():
+            if session_ids:
+                evictions.inc(len(session_ids), reason=reason)
+            if self.on_evict is not None:
+                for evicted in session_ids:
+                    if evicted != session_id:
+                        self.on_evict(evicted)
+        return thread_id
+
+    def _evict(self, conn, now: float, adding: str) -> dict:
+        # Caller holds the write lock; makes room for one more session
+        expired = [row[0] for row in conn.execute(
+            "SELECT session_id FROM sessions WHERE last_used < ?", (now - self.ttl_seconds,))]
+        conn.execute("DELETE FROM sessions WHERE last_used < ?", (now - self.ttl_seconds,))
+        count = conn.execute("SELECT COUNT(*) FROM sessions WHERE session_id != ?", (adding,)).fetchone()[0]
+        excess = count + 1 - self.max_sessions
+        lru = []
+        if excess > 0:
+            lru = [row[0] for row in conn.execute(
+                "SELECT session_id FROM sessions WHERE session_id != ? ORDER BY last_used LIMIT ?", (adding, excess))]
+            conn.executemany("DELETE FROM sessions WHERE session_id = ?", [(s,) for s in lru])
+        return {'ttl': expired, 'lru': lru}
+
+    def drop(self, session_id: str):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def stats(self) -> dict:
+        conn = self._connection()
+        active = conn.execute(
+            "SELECT COUNT(*) FROM sessions WHERE last_used >= ?", (time.time() - self.ttl_seconds,)
+        ).fetchone()[0]
+        return {
+            'active': active,
+            'evictions_ttl': evictions.value(reason='ttl'),
+            'evictions_lru': evictions.value(reason='lru'),
+        }
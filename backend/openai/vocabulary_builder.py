@@ -0,0 +1,232 @@
+"""
+Builds the keyword vocabulary behind mini_retrieve_similar_keywords from
+data_pengadaan.filtered_keywords.
+
+    python vocabulary_builder.py              # embed keywords the vocabulary does not have yet
+    python vocabulary_builder.py --rebuild    # embed every keyword, replacing the vocabulary
+
+Distinct keywords missing from the vocabulary are embedded in batched
+requests, several in flight at once. Every finished batch is checkpointed
+to its own file, so a build that is interrupted (or hits a failing batch)
+picks up where it stopped when run again. The result is written as the
+binary index (v2_key.npy plus v2_key.keywords.json), and v2_key.csv (when
+there is one) is kept in step with it: new keywords are appended, and a
+--rebuild replaces its rows, so a later rebuild from the CSV loses nothing.
+
+Offline, against the stub server:
+
+    python benchmarks/stub_openai_server.py --port 8765 &
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=stub python vocabulary_builder.py
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import config
+import db
+import keyword_index
+from keyword_index import (
+    KeywordIndex, normalize_rows, matrix_chunks, write_index, write_version, update_sidecars, append_csv
+)
+from analytics_engine import SOURCE_TABLE
+
+
+def distinct_keywords(db_path: str = None) -> list:
+    """Every keyword of filtered_keywords, once, in order of first appearance."""
+    conn = db.connect(db_path or config.DATA_DB_PATH)
+    seen = {}
+    for (value,) in conn.execute(f"SELECT filtered_keywords FROM {SOURCE_TABLE} WHERE filtered_keywords IS NOT NULL"):
+        for keyword in value.split(','):
+            keyword = keyword.strip()
+            if keyword:
+                seen.setdefault(keyword, None)
+    return list(seen)
+
+
+class VocabularyBuild:
+    """
+    Embeddings for a fixed list of keywords, fetched batch by batch into a
+    checkpoint directory. The directory holds the plan (model, batch size
+    and a hash of the keyword list) and one .npy file per finished batch; a
+    directory left by a different plan is cleared.
+    """
+
+    def __init__(self, keywords: list, checkpoint_directory: str, model: str = None, batch_size: int = None,
+                 concurrency: int = None, max_retries: int = None, fetch=None):
+        self.keywords = keywords
+        self.directory = checkpoint_directory
+        self.model = model or config.EMBEDDING_MODEL
+        self.batch_size = batch_size or config.VOCABULARY_BATCH_SIZE
+        self.concurrency = concurrency or config.VOCABULARY_CONCURRENCY
+        self.max_retries = config.VOCABULARY_MAX_RETRIES if max_retries is None else max_retries
+        self._fetch = fetch
+        self.requests = 0
+        # Batches are embedded on several threads
+        self._lock = threading.Lock()
+
+    @property
+    def batch_count(self) -> int:
+        return -(-len(self.keywords) // self.batch_size)
+
+    def _plan(self) -> dict:
+        digest = hashlib.sha256('\n'.join(self.keywords).encode('utf-8')).hexdigest()
+        return {'model': self.model, 'batch_size': self.batch_size, 'keywords': len(self.keywords), 'sha256': digest}
+
+    def _batch_path(self, i: int) -> str:
+        return os.path.join(self.directory, f'batch_{i:06d}.npy')
+
+    def prepare(self):
+        """Creates the checkpoint directory, or keeps it when it belongs to the same plan."""
+        plan = self._plan()
+        plan_path = os.path.join(self.directory, 'plan.json')
+        if os.path.exists(plan_path):
+            with open(plan_path, encoding='utf-8') as f:
+                if json.load(f) == plan:
+                    return
+            print(f"Checkpoints in {self.directory} are from another build; starting over")
+            shutil.rmtree(self.directory)
+        os.makedirs(self.directory, exist_ok=True)
+        with open(plan_path, 'w', encoding='utf-8') as f:
+            json.dump(plan, f)
+
+    def pending_batches(self) -> list:
+        return [i for i in range(self.batch_count) if not os.path.exists(self._batch_path(i))]
+
+    def _fetch_batch(self, texts: list) -> list:
+        if self._fetch is not None:
+            return self._fetch(texts)
+        from list_of_tools import client
+        response = client.embeddings.create(input=texts, model=self.model)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def _embed_batch(self, i: int):
+        texts = self.keywords[i * self.batch_size:(i + 1) * self.batch_size]
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._lock:
+                    self.requests += 1
+                rows = normalize_rows(np.asarray(self._fetch_batch(texts), dtype=np.float32))
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = min(60, 2 ** attempt)
+                print(f"Batch {i} failed ({e}); retrying in {delay}s")
+                time.sleep(delay)
+        if rows.shape[0] != len(texts):
+            raise ValueError(f"Batch {i}: {len(texts)} keywords but {rows.shape[0]} embeddings")
+        # Written under a temporary name, so a batch file is either complete or absent
+        tmp_path = self._batch_path(i) + '.tmp.npy'
+        np.save(tmp_path, rows)
+        os.replace(tmp_path, self._batch_path(i))
+
+    def run(self) -> int:
+        """Embeds the batches that have no checkpoint yet; returns how many were fetched."""
+        self.prepare()
+        pending = self.pending_batches()
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(self._embed_batch, i): i for i in pending}
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    done += 1
+                    print(f"{self.batch_count - len(pending) + done}/{self.batch_count} batches")
+            except BaseException:
+                # Finished batches are kept; the rest are fetched on the next run
+                for future in futures:
+                    future.cancel()
+                raise
+        return done
+
+    def batches(self):
+        """The checkpointed embeddings, batch by batch, in keyword order."""
+        for i in range(self.batch_count):
+            yield np.load(self._batch_path(i), mmap_mode='r')
+
+    def keyword_batches(self):
+        """(keywords, embeddings) of every checkpointed batch, in keyword order."""
+        for i, rows in enumerate(self.batches()):
+            yield self.keywords[i * self.batch_size:(i + 1) * self.batch_size], rows
+
+    def dim(self) -> int:
+        return np.load(self._batch_path(0), mmap_mode='r').shape[1]
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def write_csv(build: VocabularyBuild, csv_path: str, append: bool):
+    """
+    Appends the build's keywords to the CSV, or replaces its rows with them
+    (through a temporary file, so the CSV is never left half written).
+    """
+    target = csv_path if append else csv_path + '.tmp'
+    if not append:
+        pd.read_csv(csv_path, nrows=0).to_csv(target, index=False)
+    for keywords, rows in build.keyword_batches():
+        append_csv(keywords, rows, target)
+    if not append:
+        os.replace(target, csv_path)
+
+
+def build_vocabulary(db_path: str = None, rebuild: bool = False, matrix_path: str = keyword_index.MATRIX_PATH,
+                     keywords_path: str = keyword_index.KEYWORDS_PATH, checkpoint_directory: str = None,
+                     csv_path: str = keyword_index.CSV_PATH, **build_options) -> dict:
+    started = time.perf_counter()
+    if not rebuild and os.path.exists(csv_path) and keyword_index._is_stale(csv_path, matrix_path, keywords_path):
+        keyword_index.build_index(csv_path, matrix_path, keywords_path)
+    has_index = not rebuild and os.path.exists(matrix_path) and os.path.exists(keywords_path)
+    existing = KeywordIndex.load(matrix_path, keywords_path) if has_index else None
+    known = set(existing.keywords) if existing is not None else set()
+
+    keywords = distinct_keywords(db_path)
+    new = [keyword for keyword in keywords if keyword not in known]
+    stats = {'distinct_keywords': len(keywords), 'new_keywords': len(new), 'requests': 0}
+
+    if new:
+        build = VocabularyBuild(new, checkpoint_directory or config.VOCABULARY_CHECKPOINT_DIRECTORY, **build_options)
+        build.run()
+        stats['requests'] = build.requests
+        dim = build.dim()
+        # The CSV first: the matrix written after it stays the newer file, so it is not rebuilt from the CSV
+        if os.path.exists(csv_path):
+            write_csv(build, csv_path, append=existing is not None)
+        if existing is not None:
+            if existing.dim != dim:
+                raise ValueError(f"Vocabulary has {existing.dim} dims, new embeddings have {dim}")
+            all_keywords = existing.keywords + new
+            write_index(all_keywords, itertools.chain(matrix_chunks(existing.matrix), build.batches()),
+                        dim, matrix_path, keywords_path)
+            update_sidecars(KeywordIndex(all_keywords, np.load(matrix_path, mmap_mode='r')), matrix_path)
+        else:
+            all_keywords = new
+            write_index(all_keywords, build.batches(), dim, matrix_path, keywords_path)
+        write_version(all_keywords, matrix_path)
+        build.cleanup()
+
+    stats['vocabulary_size'] = len(known) + len(new)
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', default=config.DATA_DB_PATH)
+    parser.add_argument('--rebuild', action='store_true', help='Embed every keyword instead of only new ones.')
+    parser.add_argument('--batch-size', type=int, default=config.VOCABULARY_BATCH_SIZE)
+    parser.add_argument('--concurrency', type=int, default=config.VOCABULARY_CONCURRENCY)
+    parser.add_argument('--checkpoints', default=config.VOCABULARY_CHECKPOINT_DIRECTORY)
+    args = parser.parse_args()
+
+    stats = build_vocabulary(args.db, args.rebuild, checkpoint_directory=args.checkpoints,
+                             batch_size=args.batch_size, concurrency=args.concurrency)
+    print(json.dumps(stats, indent=2))
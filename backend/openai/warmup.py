@@ -0,0 +1,179 @@
+"""
+Warm-up phase: loads everything the first /chat request would otherwise
+load lazily while the user waits, and tracks when the process is ready.
+
+    python warmup.py            # time imports + warm-up, exit 1 when over budget
+    python -X importtime warmup.py 2> imports.log   # where the import time goes
+"""
+import time
+# Start of the budget when run as a script; the server uses main.STARTED
+SCRIPT_STARTED = time.perf_counter()
+import os
+import threading
+import numpy as np
+import config
+import db
+from keyword_index import get_keyword_index, CSV_PATH, MATRIX_PATH, KEYWORDS_PATH
+from analytics_engine import get_engine, SOURCE_TABLE
+from keyword_fts import has_keyword_fts, FTS_TABLE
+from chart_render import chart_renderer, _pyplot
+
+
+class SkipStep(Exception):
+    """Raised by a warm-up step that has nothing to load; the step does not hold back readiness."""
+
+
+def load_keyword_index():
+    if not os.path.exists(CSV_PATH) and not (os.path.exists(MATRIX_PATH) and os.path.exists(KEYWORDS_PATH)):
+        # A fresh checkout has no vocabulary yet; keyword tools fail on their own until it is built
+        raise SkipStep(f"no keyword vocabulary ({CSV_PATH} or {MATRIX_PATH})")
+    index = get_keyword_index()
+    # One full scan pulls every page of the memory-mapped matrix (or its quantized copy) into the page cache
+    index.search(np.ones(index.dim, dtype=np.float32), top_k=1)
+
+
+def prime_databases():
+    engine = get_engine()
+    # SQLite page caches are per connection (and connections per thread), so this
+    # mainly warms the OS page cache; the duckdb engine builds or opens its snapshot here
+    engine.query(f"SELECT COUNT(*) AS n FROM {SOURCE_TABLE}")
+    conn = db.connect(config.DATA_DB_PATH)
+    if has_keyword_fts(conn):
+        conn.execute(f"SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH '\"gedung\"'").fetchone()
+
+    # Creates the embedding cache file and table if needed
+    from list_of_tools import embedding_cache
+    embedding_cache._connection()
+
+
+def import_plotting():
+    _pyplot()
+
+
+def start_render_pool():
+    chart_renderer.start_pool()
+
+
+class Warmup:
+    """
+    Runs the warm-up steps once and reports readiness. `started` is the
+    moment the process began importing (main.py records it first thing),
+    so the report covers the whole path from start to ready.
+    """
+
+    def __init__(self, started: float = None, budget_seconds: float = None):
+        self.started = started if started is not None else time.perf_counter()
+        self.budget_seconds = budget_seconds if budget_seconds is not None else config.STARTUP_BUDGET_SECONDS
+        self.imports_done = None
+        self.ready_at = None
+        self.steps = {}
+        self.started_warmup = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def steps_to_run(self):
+        steps = [
+            ('keyword_index', load_keyword_index),
+            ('databases', prime_databases),
+            ('plotting', import_plotting),
+        ]
+        if chart_renderer.mode == 'pool':
+            steps.insert(0, ('render_pool', start_render_pool))
+        return steps
+
+    def _run_step(self, name, fn):
+        with self._lock:
+            self.steps[name] = {'status': 'running'}
+        start = time.perf_counter()
+        try:
+            fn()
+            result = {'status': 'done'}
+        except SkipStep as e:
+            print(f"Warm-up step {name} skipped: {e}")
+            result = {'status': 'skipped', 'reason': str(e)}
+        except Exception as e:
+            print(f"Warm-up step {name} failed: {e}")
+            result = {'status': 'failed', 'error': str(e)}
+        result['seconds'] = round(time.perf_counter() - start, 3)
+        with self._lock:
+            self.steps[name] = result
+
+    def run(self, steps=None):
+        if self.imports_done is None:
+            self.imports_done = time.perf_counter()
+        for name, fn in steps if steps is not None else self.steps_to_run():
+            self._run_step(name, fn)
+        self.ready_at = time.perf_counter()
+        self._done.set()
+
+        report = self.report()
+        print(f"Ready in {report['startup_seconds']:.2f}s "
+              f"(imports {report['imports_seconds']:.2f}s, warm-up {report['warmup_seconds']:.2f}s)")
+        if not report['within_budget']:
+            print(f"Startup took {report['startup_seconds']:.2f}s, over the {self.budget_seconds:.0f}s budget")
+        return report
+
+    def start(self):
+        """
+        Warms up in the background so the server can answer health checks
+        meanwhile. The render pool is forked first, on the calling thread,
+        before any other thread exists.
+        """
+        self.imports_done = time.perf_counter()
+        self.started_warmup = True
+        steps = self.steps_to_run()
+        if steps and steps[0][0] == 'render_pool':
+            self._run_step(*steps.pop(0))
+        threading.Thread(target=self.run, args=(steps,), name='warmup', daemon=True).start()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    @property
+    def accepting_traffic(self) -> bool:
+        # Only held back while warm-up runs: a failed step leaves its loading to the
+        # first request (and is reported by /healthz/ready) instead of refusing
+        # traffic for the rest of the process. A process that never started
+        # warming up (e.g. imported by a script) is not held back either.
+        return self._done.is_set() or not self.started_warmup
+
+    @property
+    def ready(self) -> bool:
+        with self._lock:
+            failed = any(step['status'] == 'failed' for step in self.steps.values())
+        return self._done.is_set() and not failed
+
+    def report(self) -> dict:
+        now = self.ready_at or time.perf_counter()
+        imports_done = self.imports_done or now
+        with self._lock:
+            steps = {name: dict(step) for name, step in self.steps.items()}
+        startup = now - self.started
+        return {
+            'ready': self.ready,
+            'imports_seconds': round(imports_done - self.started, 3),
+            'warmup_seconds': round(now - imports_done, 3),
+            'startup_seconds': round(startup, 3),
+            'budget_seconds': self.budget_seconds,
+            'within_budget': startup <= self.budget_seconds,
+            'steps': steps,
+        }
+
+
+if __name__ == '__main__':
+    import os
+    import sys
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Time the server's imports and warm-up against the startup budget.")
+    parser.add_argument('--budget', type=float, default=config.STARTUP_BUDGET_SECONDS)
+    args = parser.parse_args()
+
+    os.environ.setdefault('OPENAI_API_KEY', 'warmup-check')
+    import main
+    warmup = Warmup(SCRIPT_STARTED, args.budget)
+    report = warmup.run()
+    print(json.dumps(report, indent=2))
+    chart_renderer.shutdown()
+    sys.exit(0 if report['ready'] and report['within_budget'] else 1)
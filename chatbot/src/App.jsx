@@ -64,6 +64,8 @@ const ChatbotInterface = () => {
   const [isExpanding, setIsExpanding] = useState(false);
   const [sessionId, setSessionId] = useState(Date.now().toString());
   const [rawData, setRawData] = useState(null);
+  const [rawResult, setRawResult] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [barData, setBarData] = useState(null);
   const [chartTitle, setChartTitle] = useState('');
   const [isLoading, setIsLoading] = useState(false);
@@ -210,6 +212,22 @@ const renderChart = (chart) => {
       return <Line data={{ labels, datasets }} options={options} />;
 
       case 'histogram': {
+        // The backend sends ready-made bins: { bin_start, bin_end, label, count }
+        if (chart.reduction && chart.reduction.method === 'bins') {
+          // Labels are formatted at the bins' own granularity (year, month, day or minute)
+          const binLabels = chart_data.map((item) => item.label);
+          datasets = [
+            {
+              label: 'Frequency',
+              data: chart_data.map((item) => item.count),
+              backgroundColor: 'rgba(153, 102, 255, 0.2)',
+              borderColor: 'rgba(153, 102, 255, 1)',
+              borderWidth: 1,
+            }
+          ];
+          return <Bar data={{ labels: binLabels, datasets }} options={options} />;
+        }
+
         const dates = chart_data.map((item) => new Date(item[visualization.x_column])); 
         const minDate = new Date(Math.min(...dates));
         const maxDate = new Date(Math.max(...dates));
@@ -362,6 +380,25 @@ const formatDateLabel = (value, columnType) => {
   return value; 
 };
 
+// /chat only carries the first page of the result; the rest is fetched by cursor
+const loadMoreRows = async () => {
+  if (!rawResult || !rawResult.next_cursor || isLoadingMore) return;
+  setIsLoadingMore(true);
+  try {
+    const response = await fetch(`http://localhost:5000${rawResult.page_url}?after=${rawResult.next_cursor}`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const page = await response.json();
+    setRawData(prev => [...(prev || []), ...page.rows]);
+    setRawResult(prev => ({ ...prev, next_cursor: page.next_cursor }));
+  } catch (error) {
+    console.error('Error loading more rows:', error);
+  } finally {
+    setIsLoadingMore(false);
+  }
+};
+
 const sendMessage = async (e) => {
   e.preventDefault();
   const message = inputValue.trim();
@@ -402,6 +439,7 @@ const sendMessage = async (e) => {
 
       if (data.data && data.charts_info) {
         setRawData(data.data);
+        setRawResult(data.result || null);
         //setChartsInfo(data.charts_info);
         updateCharts(data.charts_info);
         //const { x_column, y_column, chart_title } = data.tool_info.visualization;
@@ -734,6 +772,14 @@ const formatChartValue = (value, columnName) => {
                             ))}
                           </tbody>
                         </table>
+                        {rawResult && rawResult.next_cursor && (
+                          <div className="p-2 flex items-center justify-center gap-2">
+                            <span className="text-sm text-gray-500">{rawData.length} of {rawResult.rows} rows</span>
+                            <Button variant="outline" size="sm" onClick={loadMoreRows} disabled={isLoadingMore}>
+                              {isLoadingMore ? <Loader2 className="h-4 w-4 animate-spin" /> : 'Load more'}
+                            </Button>
+                          </div>
+                        )}
                       </div>
                     ) : isLoading && (
                       <div className="h-[calc(100vh-300px)] flex items-center justify-center">